@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# Steady-state allocation check for the frame path, against the emulated cam.
+#
+# Streams frames with read_state(out=...) after a warm-up and uses tracemalloc
+# to record the peak memory allocated while streaming. With the reusable
+# receive/output buffers that peak must stay far below one frame; the script
+# exits non-zero if it doesn't, so it can gate changes to pyopenmv.
+
+import argparse
+import sys
+import tracemalloc
+
+import pyopenmv
+from pyopenmv_emulator import EmulatedOpenMV
+from pyopenmv_scripts import capture_script, PIXFORMATS
+
+def stream(cam, frames, out=None, native=False):
+    count = 0
+    while count < frames:
+        w, h, data, size, text, fmt = cam.read_state(out=out, native=native)
+        if data is not None:
+            if not native:
+                out = data
+            count += 1
+    return out
+
+def check(framesize, pixformat, frames, native):
+    with EmulatedOpenMV(framesize, pixformat, fps=1000) as emu:
+        cam = pyopenmv.OpenMVCamera(emu.port, timeout=2, reuse_buffers=native)
+        try:
+            cam.exec_script(capture_script(framesize, pixformat, skip_ms=0))
+            out = stream(cam, 20, native=native)  # warm up: buffers grow to size
+            tracemalloc.start()
+            base = tracemalloc.get_traced_memory()[0]
+            stream(cam, frames, out, native)
+            peak = tracemalloc.get_traced_memory()[1] - base
+            tracemalloc.stop()
+        finally:
+            cam.disconnect()
+    w, h = pyopenmv.FRAMESIZES[framesize]
+    return peak, w * h * (2 if pixformat == "RGB565" else 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame path allocation check")
+    parser.add_argument("--framesizes", nargs="+", default=["QVGA", "VGA"], choices=pyopenmv.FRAMESIZES, help="Framesizes to check")
+    parser.add_argument("--pixformats", nargs="+", default=["GRAYSCALE", "RGB565"], choices=PIXFORMATS, help="Pixformats to check")
+    parser.add_argument("--frames", type=int, default=100, help="Frames streamed per check (default 100)")
+    parser.add_argument("--limit", type=float, default=0.05, help="Allowed peak as a fraction of one raw frame (default 0.05)")
+    args = parser.parse_args()
+
+    ok = True
+    print(f"{'framesize':<10}{'pixformat':<11}{'mode':<8}{'frame B':>10}{'peak B':>10}")
+    for framesize in args.framesizes:
+        for pixformat in args.pixformats:
+            for native in (False, True):
+                peak, frame_bytes = check(framesize, pixformat, args.frames, native)
+                passed = peak <= frame_bytes * args.limit
+                ok &= passed
+                print(f"{framesize:<10}{pixformat:<11}{'native' if native else 'rgb':<8}"
+                      f"{frame_bytes:>10}{peak:>10}  {'ok' if passed else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# Host-side capture throughput benchmark against the emulated OpenMV cam.
+#
+# Sweeps every framesize in fps_log.txt for each pixformat and reports frames/s,
+# MB/s and per-stage latency (GET_STATE round trip, frame transfer, decode).
+# Pass --port to run the same sweep against a real camera instead.
+
+import argparse
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+import pyopenmv
+from pyopenmv import (OpenMVCamera, cmd_header, parse_state, frame_num_bytes, decode_frame,
+                      _USBDBG_GET_STATE, _USBDBG_FRAME_DUMP, _USBDBG_STATE_FLAGS_FRAME)
+from pyopenmv_emulator import EmulatedOpenMV
+from pyopenmv_scripts import capture_script, PIXFORMATS
+from bench_decode import logged_framesizes
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1e3, (50, 95, 99))
+    return {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3)}
+
+def measure(cam, frames, duration, warmup):
+    # read_state() split into its stages so each can be timed.
+    state_t, transfer_t, decode_t = [], [], []
+    nbytes = 0
+    out = None
+    count = 0
+    start = time.perf_counter()
+    deadline = start + warmup + duration
+    measuring = False
+    while count < frames and time.perf_counter() < deadline:
+        if not measuring and time.perf_counter() - start >= warmup:
+            measuring = True
+            start_measure = time.perf_counter()
+        t0 = time.perf_counter()
+        cam.serial.write(cmd_header(_USBDBG_GET_STATE, 64))
+        flags, w, h, size, text = parse_state(cam.serial.read(64))
+        t1 = time.perf_counter()
+        if flags & _USBDBG_STATE_FLAGS_FRAME == 0:
+            continue
+        num_bytes = frame_num_bytes(w, h, size)
+        cam.serial.write(cmd_header(_USBDBG_FRAME_DUMP, num_bytes))
+        buff = cam.serial.read(num_bytes)
+        t2 = time.perf_counter()
+        out, fmt = decode_frame(buff, w, h, size, out)
+        t3 = time.perf_counter()
+        if measuring:
+            state_t.append(t1 - t0)
+            transfer_t.append(t2 - t1)
+            decode_t.append(t3 - t2)
+            nbytes += num_bytes
+            count += 1
+    elapsed = time.perf_counter() - start_measure if measuring else 0
+    return {
+        "frames": count,
+        "seconds": round(elapsed, 3),
+        "fps": round(count / elapsed, 2) if elapsed else 0,
+        "mbps": round(nbytes / elapsed / 1024**2, 3) if elapsed else 0,
+        "bytes_per_frame": nbytes // count if count else 0,
+        "get_state_ms": percentiles(state_t),
+        "transfer_ms": percentiles(transfer_t),
+        "decode_ms": percentiles(decode_t),
+    }
+
+def run(framesize, pixformat, args):
+    emu = None
+    port = args.port
+    if port is None:
+        emu = EmulatedOpenMV(framesize, pixformat, fps=args.fps, link_bps=args.link_bps).start()
+        port = emu.port
+    cam = OpenMVCamera(port, timeout=2)
+    try:
+        cam.stop_script()
+        cam.enable_fb(True)
+        cam.exec_script(capture_script(framesize, pixformat, skip_ms=0 if emu else 2000))
+        result = measure(cam, args.frames, args.duration, args.warmup)
+        cam.stop_script()
+    finally:
+        cam.disconnect()
+        if emu is not None:
+            emu.stop()
+    return dict(framesize=framesize, pixformat=pixformat, w=pyopenmv.FRAMESIZES[framesize][0],
+                h=pyopenmv.FRAMESIZES[framesize][1], **result)
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="OpenMV capture throughput benchmark")
+    parser.add_argument("--port", default=None, help="Benchmark a real camera instead of the emulator")
+    parser.add_argument("--log", default=os.path.join(here, "fps_log.txt"), help="fps log to take framesizes from")
+    parser.add_argument("--pixformats", nargs="+", default=list(PIXFORMATS), choices=PIXFORMATS, help="Pixformats to sweep")
+    parser.add_argument("--frames", type=int, default=100, help="Frames per configuration (default 100)")
+    parser.add_argument("--duration", type=float, default=5.0, help="Max seconds per configuration (default 5)")
+    parser.add_argument("--warmup", type=float, default=0.5, help="Seconds to discard before measuring (default 0.5)")
+    parser.add_argument("--fps", type=float, default=1000.0, help="Emulated sensor frame rate (default 1000, i.e. link bound)")
+    parser.add_argument("--link-bps", type=float, default=None, help="Emulated link speed in bytes/s (default unthrottled)")
+    parser.add_argument("--output", default="capture_bench.json", help="Results file (default capture_bench.json)")
+    args = parser.parse_args()
+
+    # Smallest to largest so a slow link shows up in the table gradually.
+    framesizes = sorted(logged_framesizes(args.log), key=lambda n: pyopenmv.FRAMESIZES[n][0] * pyopenmv.FRAMESIZES[n][1])
+    rows = []
+    print(f"{'framesize':<10}{'pixformat':<11}{'FPS':>9}{'MB/s':>9}{'state':>9}{'xfer':>9}{'decode':>9}  (p50 ms)")
+    for framesize in framesizes:
+        for pixformat in args.pixformats:
+            row = run(framesize, pixformat, args)
+            rows.append(row)
+            print(f"{framesize:<10}{pixformat:<11}{row['fps']:>9.2f}{row['mbps']:>9.3f}"
+                  f"{row['get_state_ms']['p50'] or 0:>9.3f}{row['transfer_ms']['p50'] or 0:>9.3f}"
+                  f"{row['decode_ms']['p50'] or 0:>9.3f}")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "host": platform.node(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "device": args.port or "emulator",
+            "link_bps": args.link_bps,
+            "results": rows,
+        }, f, indent=2)
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
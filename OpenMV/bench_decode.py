@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Micro-benchmark: original column_stack decoders vs pyopenmv_decode, for every
+# framesize that appears in fps_log.txt.
+
+import argparse
+import os
+import time
+import numpy as np
+
+import pyopenmv
+import pyopenmv_decode
+
+def legacy_gray(buff, w, h):
+    y = np.frombuffer(buff, dtype=np.uint8)
+    return np.column_stack((y, y, y)).reshape((h, w, 3))
+
+def legacy_rgb565(buff, w, h):
+    arr = np.frombuffer(buff, dtype=np.uint16)
+    r = (((arr & 0xF800) >>11)*255.0/31.0).astype(np.uint8)
+    g = (((arr & 0x07E0) >>5) *255.0/63.0).astype(np.uint8)
+    b = (((arr & 0x001F) >>0) *255.0/31.0).astype(np.uint8)
+    return np.column_stack((r,g,b)).reshape((h, w, 3))
+
+def logged_framesizes(path):
+    # Framesize names in fps_log.txt, in order; anything pyopenmv doesn't know is skipped.
+    names = []
+    with open(path) as f:
+        for line in f:
+            name = line.split("-")[0].strip()
+            if name in pyopenmv.FRAMESIZES and name not in names:
+                names.append(name)
+    return names
+
+def time_it(fn, iters):
+    fn()  # warm up (builds the LUT, faults in buffers)
+    t = time.perf_counter()
+    for i in range(iters):
+        fn()
+    return (time.perf_counter() - t) / iters
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="RGB565/GRAY decoder benchmark")
+    parser.add_argument("--log", default=os.path.join(here, "fps_log.txt"), help="fps log to take framesizes from")
+    parser.add_argument("--iters", type=int, default=50, help="Iterations per measurement (default 50)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'framesize':<10}{'fmt':<8}{'legacy ms':>12}{'new ms':>12}{'speedup':>10}")
+    for name in logged_framesizes(args.log):
+        w, h = pyopenmv.FRAMESIZES[name]
+        for fmt, bpp, legacy, new in (("GRAY", 1, legacy_gray, pyopenmv_decode.decode_gray),
+                                      ("RGB565", 2, legacy_rgb565, pyopenmv_decode.decode_rgb565)):
+            buff = rng.integers(0, 256, w * h * bpp, dtype=np.uint8).tobytes()
+            out = np.empty((h, w, 3), dtype=np.uint8)
+            assert np.array_equal(legacy(buff, w, h), new(buff, w, h, out))
+            t_old = time_it(lambda: legacy(buff, w, h), args.iters)
+            t_new = time_it(lambda: new(buff, w, h, out), args.iters)
+            print(f"{name:<10}{fmt:<8}{t_old*1e3:>12.3f}{t_new*1e3:>12.3f}{t_old/t_new:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# Benchmark: pose on every frame vs KeyframePose (pose on keyframes, optical
+# flow in between) over recorded archives (pyopenmv_archive.py record). For
+# each --max-interval reports CPU per frame (process time, so MediaPipe's own
+# threads count), the share of frames that ran the model, and the landmark
+# error against the every-frame result: mean distance over landmarks visible
+# in both, in pixels, plus frames where only one of the two found a pose.
+
+import argparse
+import time
+
+import numpy as np
+
+import pyopenmv_decode
+from pyopenmv_archive import FrameArchive
+from pyopenmv_pose import KeyframePose, landmark_xy, landmark_visible
+
+def load(path, limit=None):
+    archive = FrameArchive(path)
+    frames = []
+    for i in range(len(archive) if limit is None else min(len(archive), limit)):
+        t, w, h, native, fmt = archive[i]
+        rgb = pyopenmv_decode.to_rgb(native, fmt, w, h, np.empty((h, w, 3), np.uint8))
+        gray = pyopenmv_decode.to_gray(native, fmt, w, h, np.empty((h, w), np.uint8))
+        frames.append((rgb, gray))
+    return frames
+
+def run(frames, step):
+    """Calls step(rgb, gray) on every frame; returns (landmarks list, CPU s/frame, wall s/frame)."""
+    out = []
+    cpu, wall = time.process_time(), time.perf_counter()
+    for rgb, gray in frames:
+        out.append(step(rgb, gray))
+    return out, (time.process_time() - cpu) / len(frames), (time.perf_counter() - wall) / len(frames)
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyframe pose + optical flow benchmark")
+    parser.add_argument("archives", nargs="+", help="Frame archives to replay")
+    parser.add_argument("--max-intervals", type=int, nargs="+", default=[4, 8, 15], help="KeyframePose max_interval values (default 4 8 15)")
+    parser.add_argument("--infer-size", default=None, help="Inference size for both paths (framesize name or WxH; default native)")
+    parser.add_argument("--frames", type=int, default=None, help="At most this many frames per archive")
+    args = parser.parse_args()
+
+    import cv2
+    import mediapipe as mp
+    from mediapipe_openmv import parse_size
+    infer_size = parse_size(args.infer_size) if args.infer_size else None
+
+    def model(pose):
+        buf = None
+        def process(rgb):
+            nonlocal buf
+            h, w = rgb.shape[:2]
+            if infer_size is not None and infer_size != (w, h):
+                buf = pyopenmv_decode.ensure_buffer(buf, infer_size[1], infer_size[0])
+                cv2.resize(rgb, infer_size, dst=buf, interpolation=cv2.INTER_AREA)
+                rgb = buf
+            return pose.process(rgb)
+        return process
+
+    print(f"{'archive':<24}{'mode':<14}{'cpu ms':>8}{'wall ms':>9}{'model %':>9}{'err px':>8}{'p95 px':>8}{'missed':>8}{'extra':>7}")
+    for path in args.archives:
+        frames = load(path, args.frames)
+        if not frames:
+            continue
+        h, w = frames[0][1].shape
+        name = path[-24:]
+        with mp.solutions.pose.Pose() as pose:
+            process = model(pose)
+            ref, cpu, wall = run(frames, lambda rgb, gray: process(rgb).pose_landmarks)
+        print(f"{name:<24}{'every frame':<14}{cpu * 1e3:>8.2f}{wall * 1e3:>9.2f}{100:>9.0f}{'-':>8}{'-':>8}{'-':>8}{'-':>7}")
+        for max_interval in args.max_intervals:
+            with mp.solutions.pose.Pose() as pose:
+                tracker = KeyframePose(model(pose), interval=min(4, max_interval), max_interval=max_interval)
+                out, cpu, wall = run(frames, lambda rgb, gray: tracker.update(rgb, gray)[0])
+            dist = []
+            missed = extra = 0
+            for a, b in zip(ref, out):
+                if a is None or b is None:
+                    missed += a is not None
+                    extra += b is not None
+                    continue
+                both = landmark_visible(a) & landmark_visible(b)
+                if both.any():
+                    d = (landmark_xy(a)[both] - landmark_xy(b)[both]) * (w, h)
+                    dist.append(np.linalg.norm(d, axis=1))
+            dist = np.concatenate(dist) if dist else np.zeros(0)
+            err = f"{dist.mean():.1f}" if len(dist) else "-"
+            p95 = f"{np.percentile(dist, 95):.1f}" if len(dist) else "-"
+            share = 100 * tracker.keyframes / len(frames)
+            print(f"{name:<24}{f'max {max_interval}':<14}{cpu * 1e3:>8.2f}{wall * 1e3:>9.2f}{share:>9.0f}{err:>8}{p95:>8}{missed:>8}{extra:>7}")
+
+if __name__ == "__main__":
+    main()
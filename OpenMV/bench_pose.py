@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# Micro-benchmark: per-frame cost of the original mediapipe_openmv frame path
+# (surface -> smoothscale -> array3d -> transpose -> 3x cvtColor -> make_surface,
+# pose on the upscaled frame) vs the current one (pose at native size or
+# --infer-size, frame scaled into the window, landmarks drawn at window size).
+# Inference is timed on its own for each path so the copy/scale overhead can
+# be read off. Frames come from an archive
+# (pyopenmv_archive.py) or are synthetic; synthetic frames contain no person,
+# so landmark drawing is only exercised with --archive.
+
+import argparse
+import os
+
+import numpy as np
+
+import pyopenmv
+import pyopenmv_decode
+from bench_decode import time_it
+
+def main():
+    parser = argparse.ArgumentParser(description="Pose pipeline frame path benchmark")
+    parser.add_argument("--framesize", default="QVGA", choices=pyopenmv.FRAMESIZES, help="Synthetic frame size (default QVGA)")
+    parser.add_argument("--archive", default=None, help="Take frames from this archive instead")
+    parser.add_argument("--scale", type=int, default=4, help="Display scale (default 4)")
+    parser.add_argument("--infer-size", default=None, help="Current path's inference size (framesize name or WxH; default native)")
+    parser.add_argument("--iters", type=int, default=30, help="Iterations per measurement (default 30)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import cv2
+    import pygame
+    import mediapipe_openmv as mpo
+
+    if args.archive:
+        from pyopenmv_archive import FrameArchive
+        archive = FrameArchive(args.archive)
+        frames = []
+        for i in range(min(len(archive), args.iters)):
+            t, w, h, native, fmt = archive[i]
+            frames.append(pyopenmv_decode.to_rgb(native, fmt, w, h, np.empty((h, w, 3), np.uint8)))
+    else:
+        w, h = pyopenmv.FRAMESIZES[args.framesize]
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for i in range(4)]
+    h, w = frames[0].shape[:2]
+    scale = args.scale
+
+    from pyopenmv_display import FrameScaler
+    infer_size = mpo.parse_size(args.infer_size) if args.infer_size else None
+
+    pygame.init()
+    screen = pygame.display.set_mode((w * scale, h * scale), pygame.DOUBLEBUF, 32)
+
+    def legacy(data):
+        image = pygame.image.frombuffer(data.flat[0:], (w, h), 'RGB')
+        image = pygame.transform.smoothscale(image, (w * scale, h * scale))
+        frame = np.array(pygame.surfarray.array3d(image))
+        frame = np.transpose(frame, (1, 0, 2))
+        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        results = mpo.pose_model().process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if results.pose_landmarks:
+            mpo.mp_drawing.draw_landmarks(frame, results.pose_landmarks, mpo.mp_pose.POSE_CONNECTIONS,
+                                          landmark_drawing_spec=mpo.mp_drawing_styles.get_default_pose_landmarks_style())
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        screen.blit(pygame.surfarray.make_surface(np.transpose(frame, (1, 0, 2))), (0, 0))
+
+    scaler = FrameScaler(scale)
+    buf = None
+    def current(data):
+        nonlocal buf
+        results, buf = mpo.infer_pose(data, w, h, infer_size, buf)
+        surface = scaler.show(data, w, h)
+        if results.pose_landmarks:
+            mpo.draw_pose(surface, results.pose_landmarks, scale)
+
+    scaled = cv2.resize(frames[0], (w * scale, h * scale))
+    native = cv2.resize(frames[0], infer_size) if infer_size else frames[0]
+
+    n = len(frames)
+    it = iter(range(1 << 30))
+    t_old_inf = time_it(lambda: mpo.pose_model().process(scaled), args.iters)
+    t_new_inf = time_it(lambda: mpo.pose_model().process(native), args.iters)
+    t_old = time_it(lambda: legacy(frames[next(it) % n]), args.iters)
+    t_new = time_it(lambda: current(frames[next(it) % n]), args.iters)
+    iw, ih = infer_size or (w, h)
+    print(f"{w}x{h} frames, x{scale} window")
+    print(f"{'path':<10}{'infer at':>10}{'frame ms':>10}{'inference':>11}{'rest':>8}")
+    print(f"{'legacy':<10}{f'{w * scale}x{h * scale}':>10}{t_old * 1e3:>10.2f}{t_old_inf * 1e3:>11.2f}{(t_old - t_old_inf) * 1e3:>8.2f}")
+    print(f"{'current':<10}{f'{iw}x{ih}':>10}{t_new * 1e3:>10.2f}{t_new_inf * 1e3:>11.2f}{(t_new - t_new_inf) * 1e3:>8.2f}")
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
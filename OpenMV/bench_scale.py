@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# Micro-benchmark: per-frame display cost (frame -> window surface -> flip) of
+# the original smoothscale path vs pyopenmv_display.FrameScaler, for every
+# framesize in fps_log.txt and each scale factor. Runs on SDL's dummy video
+# driver unless --window is given.
+
+import argparse
+import os
+
+import numpy as np
+
+import pyopenmv
+from bench_decode import logged_framesizes, time_it
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Viewer display scaling benchmark")
+    parser.add_argument("--log", default=os.path.join(here, "fps_log.txt"), help="fps log to take framesizes from")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2, 3, 4], help="Scale factors (default 1 2 3 4)")
+    parser.add_argument("--iters", type=int, default=50, help="Iterations per measurement (default 50)")
+    parser.add_argument("--window", action="store_true", help="Draw to a real window (includes vsync/compositor cost)")
+    args = parser.parse_args()
+
+    if not args.window:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from pyopenmv_display import FrameScaler, MODES
+    pygame.init()
+
+    def legacy(data, w, h, scale):
+        screen = pygame.display.get_surface()
+        image = pygame.image.frombuffer(data.flat[0:], (w, h), 'RGB')
+        image = pygame.transform.smoothscale(image, (w * scale, h * scale))
+        screen.blit(image, (0, 0))
+        pygame.display.flip()
+
+    def scaled(scaler, data, w, h):
+        scaler.show(data, w, h)
+        pygame.display.flip()
+
+    rng = np.random.default_rng(0)
+    print(f"{'framesize':<10}{'scale':>6}{'legacy ms':>12}" + "".join(f"{m + ' ms':>12}" for m in MODES))
+    for name in logged_framesizes(args.log):
+        w, h = pyopenmv.FRAMESIZES[name]
+        data = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        for scale in args.scales:
+            pygame.display.set_mode((w * scale, h * scale), pygame.DOUBLEBUF, 32)
+            row = [time_it(lambda: legacy(data, w, h, scale), args.iters)]
+            for mode in MODES:
+                scaler = FrameScaler(scale, mode)
+                row.append(time_it(lambda: scaled(scaler, data, w, h), args.iters))
+                if scaler.mode != mode:
+                    row[-1] = float("nan")  # hw unavailable, fell back to nearest
+            print(f"{name:<10}{scale:>6}" + "".join(f"{t * 1e3:>12.3f}" for t in row))
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
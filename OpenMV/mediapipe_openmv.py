@@ -6,6 +6,14 @@ import os
 import numpy as np
 import pygame
 import pyopenmv
+import pyopenmv_decode
+from pyopenmv_prefetch import FramePrefetcher
+from pyopenmv_perf import PerfLog, SPANS, script_hash, framesize_name, append_fps_log
+from pyopenmv_pose import PoseWorker, KeyframePose, landmark_xy, landmark_visible
+from pyopenmv_record import RecordingSink, MODES as RECORD_MODES, POLICIES as RECORD_POLICIES
+from pyopenmv_display import FrameScaler
+from pyopenmv_motion import MotionGate
+from pyopenmv_bus import BusClosed, BusConsumer
 import argparse
 import time
 import cv2
@@ -16,10 +24,13 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
 # <<< MediaPipe Pose Model >>>
 mp_pose = mp.solutions.pose  
-pose = mp_pose.Pose()  
 mp_drawing = mp.solutions.drawing_utils  
 mp_drawing_styles = mp.solutions.drawing_styles  
 
+# drawing_styles colours are BGR; frames stay RGB from read_state() to display
+landmark_style = {k: mp_drawing.DrawingSpec(color=s.color[::-1], thickness=s.thickness, circle_radius=s.circle_radius)
+                  for k, s in mp_drawing_styles.get_default_pose_landmarks_style().items()}
+
 test_script = """
 import sensor, image, time
 sensor.reset()
@@ -34,77 +45,249 @@ while(True):
     print(clock.fps(), " FPS")
 """
 
-def pygame_test(port, poll_rate, scale):
+# Landmarks below these scores are not drawn (same as mp_drawing)
+VISIBILITY_THRESHOLD = 0.5
+PRESENCE_THRESHOLD = 0.5
+
+def parse_size(text):
+    """Framesize name (e.g. QQVGA) or WxH."""
+    if text in pyopenmv.FRAMESIZES:
+        return pyopenmv.FRAMESIZES[text]
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+_POSE = None
+
+def pose_model():
+    # Built on first use: the spawned pose worker imports this module too
+    # and runs its own graph.
+    global _POSE
+    if _POSE is None:
+        _POSE = mp_pose.Pose()
+    return _POSE
+
+def infer_pose(data, w, h, infer_size=None, buf=None):
+    """Runs pose on an (h, w, 3) RGB frame, resized to infer_size (w, h)
+    first if given. Returns (results, buf); buf is the reused resize buffer.
+    Landmarks are normalized, so they map onto any display size."""
+    if infer_size is not None and infer_size != (w, h):
+        buf = pyopenmv_decode.ensure_buffer(buf, infer_size[1], infer_size[0])
+        cv2.resize(data, infer_size, dst=buf, interpolation=cv2.INTER_AREA)
+        data = buf
+    return pose_model().process(data), buf
+
+def draw_pose(surface, landmarks, width=1):
+    """Draws normalized pose landmarks onto a pygame surface of any size.
+    width scales the line and circle sizes."""
+    sw, sh = surface.get_size()
+    points = {}
+    for i, lm in enumerate(landmarks.landmark):
+        if ((lm.HasField("visibility") and lm.visibility < VISIBILITY_THRESHOLD) or
+                (lm.HasField("presence") and lm.presence < PRESENCE_THRESHOLD)):
+            continue
+        if 0.0 <= lm.x <= 1.0 and 0.0 <= lm.y <= 1.0:
+            points[i] = (int(lm.x * (sw - 1)), int(lm.y * (sh - 1)))
+    conn = mp_drawing.DrawingSpec()
+    for a, b in mp_pose.POSE_CONNECTIONS:
+        if a in points and b in points:
+            pygame.draw.line(surface, conn.color, points[a], points[b], conn.thickness * width)
+    for i, p in points.items():
+        spec = landmark_style[i]
+        pygame.draw.circle(surface, spec.color, p, spec.circle_radius * width + 1)
+
+def pose_rect(landmarks, w, h, margin=4):
+    """(x, y, w, h) frame rect around the landmarks draw_pose() draws, or None."""
+    xy = landmark_xy(landmarks)[landmark_visible(landmarks)] * (w, h)
+    if not len(xy):
+        return None
+    x0, y0 = np.clip(xy.min(axis=0) - margin, 0, (w, h)).astype(int)
+    x1, y1 = np.clip(xy.max(axis=0) + margin + 1, 0, (w, h)).astype(int)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+def pygame_test(port, poll_rate, scale, prefetch=False, depth=2, lossless=False, perf_log=None,
+                record=None, record_mode="raw", record_policy="drop", infer_size=None, sync=False,
+                keyframe=None, motion=None, bus=None):
     pygame.init()
-    pyopenmv.disconnect()
-
-    connected = False
-    for i in range(10):
-        try:
-            pyopenmv.init(port, baudrate=921600, timeout=0.050)
-            connected = True
-            break
-        except Exception:
-            time.sleep(0.100)
-
-    if not connected:
-        print("Failed to connect to OpenMV's serial port.")
-        sys.exit(1)
-
-    pyopenmv.set_timeout(1*2)
-    pyopenmv.stop_script()
-    pyopenmv.enable_fb(True)
-    pyopenmv.exec_script(test_script)
-
-    screen = None
+    consumer = None
+    if bus is not None:
+        # Frames come from a pyopenmv_bus daemon, which owns the camera
+        consumer = BusConsumer(bus, "mediapipe_openmv", latest=True)
+    else:
+        pyopenmv.disconnect()
+
+        connected = False
+        for i in range(10):
+            try:
+                pyopenmv.init(port, baudrate=921600, timeout=0.050)
+                connected = True
+                break
+            except Exception:
+                time.sleep(0.100)
+
+        if not connected:
+            print("Failed to connect to OpenMV's serial port.")
+            sys.exit(1)
+
+        pyopenmv.set_timeout(1*2)
+        pyopenmv.stop_script()
+        pyopenmv.enable_fb(True)
+        pyopenmv.exec_script(test_script)
+
+    # Per-frame latency spans, shown in the overlay and optionally logged
+    # pose_latency: capture to pose result, when pose runs in the worker
+    perf = PerfLog(perf_log, {"port": f"bus:{bus}" if consumer else port, "script_hash": script_hash(test_script)},
+                   spans=(*SPANS, "pose_latency", "motion"))
+    if consumer is None:
+        pyopenmv.default_camera().perf = perf
+
+    # Window scaling is independent of inference, which runs at native size
+    # (or infer_size) and only hands back normalized landmarks
+    scaler = FrameScaler(scale)
     clock = pygame.time.Clock()
     fps_clock = pygame.time.Clock()
     font = pygame.font.SysFont("monospace", 30)
 
-    fps_values = []
+    reader = None
+    read_state = consumer.read_state if consumer else pyopenmv.read_state
+    if prefetch:
+        reader = FramePrefetcher(read_state, depth=depth, lossless=lossless).start()
+        read_state = lambda out=None: reader.read_state(timeout=0.1)
+
+    fps_values = {}  # FPS samples per received framesize
+    logged_size = None
+    sink = None  # created on the first frame, once the output size is known
+    # Unless sync, pose runs in a worker process on the newest frame it can
+    # take; its latest landmarks are drawn over every frame shown
+    worker = None
+    last_seq = 0
+    # keyframe (KeyframePose arguments): full pose on keyframes only, landmarks
+    # carried between them by optical flow on the grayscale frame
+    tracker = None
+    gray = None
+    landmarks = None
+    # motion (MotionGate arguments): pose and recording only run on frames
+    # that changed, and the window only redraws changed tiles
+    gate = None
+    if motion is not None:
+        gate = MotionGate(**motion)
+        pose_sub = gate.subscribe("pose")
+        record_sub = gate.subscribe("record")
+        display_sub = gate.subscribe("display", tiles=True)
+    run_pose = do_record = True
+    rects = None
+    last_pose_rect = None
+
+    fb = None
+    infer_buf = None
+    rec = None  # native frame with the landmarks drawn in, for recording
+
+    def model(rgb):
+        nonlocal infer_buf
+        results, infer_buf = infer_pose(rgb, rgb.shape[1], rgb.shape[0], infer_size, infer_buf)
+        return results
 
     try:
         while True:
-            w, h, data, size, text, fmt = pyopenmv.read_state()
+            # Hand the last frame back so the decoder can reuse its buffer
+            w, h, data, size, text, fmt = read_state(out=fb)
+            if data is not None:
+                fb = data
+                logged_size = framesize_name(w, h)
             fps = fps_clock.get_fps()
 
-            if fps > 0:
-                fps_values.append(fps)
+            if fps > 0 and logged_size is not None:
+                fps_values.setdefault(logged_size, []).append(fps)
 
             mbps = (fps * size) / (1024**2)
 
             if data is not None:
-                # Convert image from Pygame to OpenCV
-                image = pygame.image.frombuffer(data.flat[0:], (w, h), 'RGB')
-                image = pygame.transform.smoothscale(image, (w * scale, h * scale))
-                frame = np.array(pygame.surfarray.array3d(image))  
-                frame = np.transpose(frame, (1, 0, 2))  
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)  
-
-                # Perform Pose Detection
-                results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))  
-
-                if results.pose_landmarks:
-                    # Draw pose landmarks with lines
-                    mp_drawing.draw_landmarks(
-                        frame, 
-                        results.pose_landmarks, 
-                        mp_pose.POSE_CONNECTIONS,  # Draws the skeleton connections
-                        landmark_drawing_spec=mp_drawing_styles.get_default_pose_landmarks_style()
-                    )
-
-                # Convert back to Pygame format
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  
-                image = pygame.surfarray.make_surface(np.transpose(frame, (1, 0, 2)))  
-
-                if screen is None:
-                    screen = pygame.display.set_mode((w * scale, h * scale), pygame.DOUBLEBUF, 32)
-
-                screen.blit(image, (0, 0))
+                if gate is not None:
+                    t0 = time.perf_counter()
+                    gate.update(data)
+                    run_pose = pose_sub.poll()
+                    do_record = record_sub.poll()
+                    rects = display_sub.poll()
+                    perf.add("motion", time.perf_counter() - t0)
+
+                t0 = time.perf_counter()
+                if sync and not run_pose:
+                    pass  # static frame: keep the last landmarks
+                elif sync and keyframe is not None:
+                    if tracker is None:
+                        tracker = KeyframePose(model, **keyframe)
+                    gray = pyopenmv_decode.ensure_buffer(gray, h, w, 1)
+                    if fmt == pyopenmv_decode.RGB_FMT_NAMES[pyopenmv_decode.FMT_GRAY]:
+                        gray[...] = data[:, :, 0]  # expanded grayscale, already luminance
+                    else:
+                        cv2.cvtColor(data, cv2.COLOR_RGB2GRAY, dst=gray)
+                    landmarks = tracker.update(data, gray)[0]
+                    perf.add("inference", time.perf_counter() - t0)
+                elif sync:
+                    landmarks = model(data).pose_landmarks
+                    perf.add("inference", time.perf_counter() - t0)
+                else:
+                    if worker is None:
+                        worker = PoseWorker((w, h), infer_size, keyframe=keyframe)
+                    if run_pose:
+                        worker.submit(data)
+                    result = worker.poll()
+                    landmarks = result.landmarks if result else None
+                    if result and result.seq != last_seq:
+                        last_seq = result.seq
+                        perf.add("inference", result.infer_s)
+                        perf.add("pose_latency", result.done - result.t)
+                t1 = time.perf_counter()
+
+                if rects is not None:
+                    # Also redraw under the text overlay and the pose, old and new
+                    sw, sh = scaler.screen.get_size() if scaler.screen else (w * scale, h * scale)
+                    rects.append((0, 0, w, min(h, -(-120 * h // sh))))
+                    rect = pose_rect(landmarks, w, h) if landmarks else None
+                    rects += [r for r in (rect, last_pose_rect) if r is not None]
+                    last_pose_rect = rect
+                screen = scaler.show(data, w, h, rects)
+                if landmarks:
+                    draw_pose(screen, landmarks, max(1, screen.get_width() // w))
+                perf.add("scale", time.perf_counter() - t1)
+
+                # Record at native size with the landmarks drawn in
+                if record and sink is None:
+                    sink = RecordingSink(record, record_mode, max_size=(w, h), policy=record_policy)
+                if sink is not None and do_record:
+                    rec = pyopenmv_decode.ensure_buffer(rec, h, w)
+                    rec[...] = data
+                    if landmarks:
+                        mp_drawing.draw_landmarks(rec, landmarks, mp_pose.POSE_CONNECTIONS,
+                                                  landmark_drawing_spec=landmark_style)
+                    sink.write(rec)
+
                 screen.blit(font.render(f"{fps:.2f} FPS | {mbps:.2f} MB/s", 5, (255, 0, 0)), (0, 0))
+                screen.blit(font.render(perf.overlay(), 5, (255, 0, 0)), (0, 30))
+                if worker is not None:
+                    # Age of the drawn landmarks: since their frame was captured, and in frames
+                    age = f"age {(time.monotonic() - result.t) * 1e3:.0f} ms ({worker.seq - result.seq} fr)" if result else "waiting"
+                    pose_info = f"pose {worker.rate.rate:.1f} FPS | {age} | skipped {worker.skipped}"
+                    if keyframe is not None:
+                        pose_info += f" | keyframes {worker.keyframes}/{worker.results}"
+                    screen.blit(font.render(pose_info, 5, (255, 0, 0)), (0, 60))
+                if tracker is not None:
+                    drift = "-" if tracker.drift is None else f"{tracker.drift:.3f}"
+                    kf_info = f"keyframe every {tracker.interval} | drift {drift} | forced {tracker.forced}"
+                    screen.blit(font.render(kf_info, 5, (255, 0, 0)), (0, 60))
+                if gate is not None:
+                    skipped = " | ".join(f"{n} skip {sub.skipped_share():.0%}" for n, sub in gate.subscriptions.items())
+                    motion_info = f"changed {gate.changed_frames / gate.frames:.0%} | {skipped}"
+                    screen.blit(font.render(motion_info, 5, (255, 0, 0)), (0, 90))
 
-                pygame.display.flip()
-                fps_clock.tick(30)  # Set a max frame rate to avoid overload
+                t2 = time.perf_counter()
+                if scaler.dirty is None:
+                    pygame.display.flip()
+                else:
+                    pygame.display.update(scaler.dirty)
+                perf.add("flip", time.perf_counter() - t2)
+                perf.tags.update(framesize=framesize_name(w, h), pixformat=fmt)
+                perf.frame()
+                fps_clock.tick()
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
@@ -112,27 +295,64 @@ def pygame_test(port, poll_rate, scale):
 
             clock.tick(1000 // poll_rate)
 
-            # Delay if FPS is higher than expected to smooth out the video
-            if fps > 30:
-                pygame.time.delay(10)
-
     except KeyboardInterrupt:
         pass
+    except BusClosed as e:
+        print(e)
+
+    if reader is not None:
+        reader.stop()
+        print(f"Prefetch: {reader.frames} frames, {reader.dropped} dropped")
+
+    if worker is not None:
+        worker.close()
+        print(f"Pose worker: {worker.stats()}")
+
+    if tracker is not None:
+        print(f"Keyframes: {tracker.stats()}")
+
+    if gate is not None:
+        print(f"Motion: {gate.stats()}")
+
+    if sink is not None:
+        sink.close()
+        print(f"Recording: {sink.stats()}")
+
+    perf.close()
+    print("Latency p50/p95/p99:")
+    print(perf.describe())
 
     pygame.quit()
-    pyopenmv.stop_script()
+    if consumer is not None:
+        consumer.close()
+    else:
+        pyopenmv.stop_script()
 
-    # Calculate and save average FPS
-    if fps_values:
-        avg_fps = sum(fps_values) / len(fps_values)
-        with open("fps_log.txt", "a") as log_file:
-            log_file.write(f"QVGA - {avg_fps:.2f}\n")
+    # Save the average FPS of each framesize received
+    append_fps_log(fps_values)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="pyopenmv module")
     parser.add_argument("--port", default="/dev/ttyACM0", help="OpenMV camera port (default /dev/ttyACM0)")
     parser.add_argument("--poll", type=int, default=4, help="Poll rate (default 4ms)")
     parser.add_argument("--scale", type=int, default=4, help="Set frame scaling factor (default 4x)")
+    parser.add_argument("--bus", default=None, help="Read frames from this pyopenmv_bus daemon instead of the port")
+    parser.add_argument("--prefetch", action="store_true", help="Read frames on a background thread")
+    parser.add_argument("--depth", type=int, default=2, help="Prefetch ring depth (default 2)")
+    parser.add_argument("--lossless", action="store_true", help="Never drop prefetched frames")
+    parser.add_argument("--perf-log", default=None, help="Append per-second latency rows to this file (.jsonl, or .csv)")
+    parser.add_argument("--infer-size", type=parse_size, default=None, help="Run pose at this size (framesize name or WxH; default native)")
+    parser.add_argument("--sync", action="store_true", help="Run pose in the display loop (display FPS limited to inference FPS)")
+    parser.add_argument("--keyframe", action="store_true", help="Run pose on keyframes only and track landmarks with optical flow in between")
+    parser.add_argument("--max-interval", type=int, default=15, help="Longest keyframe spacing in frames (default 15)")
+    parser.add_argument("--motion", action="store_true", help="Skip pose, recording and redraw of frames/tiles that did not change")
+    parser.add_argument("--motion-threshold", type=int, default=16, help="Gray level change that counts as motion (default 16)")
+    parser.add_argument("--record", default=None, help="Record frames with the pose overlay to this file")
+    parser.add_argument("--record-mode", default="raw", choices=RECORD_MODES, help="raw (lossless frame archive) or video (default raw)")
+    parser.add_argument("--record-policy", default="drop", choices=RECORD_POLICIES, help="When the encoder falls behind: drop frames or block (default drop)")
     args = parser.parse_args()
 
-    pygame_test(args.port, args.poll, args.scale)
+    pygame_test(args.port, args.poll, args.scale, args.prefetch, args.depth, args.lossless, args.perf_log,
+                args.record, args.record_mode, args.record_policy, args.infer_size, args.sync,
+                {"max_interval": args.max_interval} if args.keyframe else None,
+                {"threshold": args.motion_threshold} if args.motion else None, args.bus)
@@ -8,218 +8,376 @@
 #
 # Openmv module.
 
+import io
+import os
+import select
 import struct
 import sys,time
 import serial
-import platform
-import numpy as np
-from PIL import Image
+import pyopenmv_decode
 
-__serial = None
-__FB_HDR_SIZE   =12
+_FB_HDR_SIZE   =12
 
 # USB Debug commands
-__USBDBG_CMD            = 48
-__USBDBG_FW_VERSION     = 0x80
-__USBDBG_FRAME_SIZE     = 0x81
-__USBDBG_FRAME_DUMP     = 0x82
-__USBDBG_ARCH_STR       = 0x83
-__USBDBG_SCRIPT_EXEC    = 0x05
-__USBDBG_SCRIPT_STOP    = 0x06
-__USBDBG_SCRIPT_SAVE    = 0x07
-__USBDBG_SCRIPT_RUNNING = 0x87
-__USBDBG_TEMPLATE_SAVE  = 0x08
-__USBDBG_DESCRIPTOR_SAVE= 0x09
-__USBDBG_ATTR_READ      = 0x8A
-__USBDBG_ATTR_WRITE     = 0x0B
-__USBDBG_SYS_RESET      = 0x0C
-__USBDBG_SYS_RESET_TO_BL= 0x0E
-__USBDBG_FB_ENABLE      = 0x0D
-__USBDBG_TX_BUF_LEN     = 0x8E
-__USBDBG_TX_BUF         = 0x8F
-__USBDBG_GET_STATE      = 0x93
-
-__USBDBG_STATE_FLAGS_SCRIPT = (1 << 0)
-__USBDBG_STATE_FLAGS_TEXT   = (1 << 1)
-__USBDBG_STATE_FLAGS_FRAME  = (1 << 2)
+_USBDBG_CMD            = 48
+_USBDBG_FW_VERSION     = 0x80
+_USBDBG_FRAME_SIZE     = 0x81
+_USBDBG_FRAME_DUMP     = 0x82
+_USBDBG_ARCH_STR       = 0x83
+_USBDBG_SCRIPT_EXEC    = 0x05
+_USBDBG_SCRIPT_STOP    = 0x06
+_USBDBG_SCRIPT_SAVE    = 0x07
+_USBDBG_SCRIPT_RUNNING = 0x87
+_USBDBG_TEMPLATE_SAVE  = 0x08
+_USBDBG_DESCRIPTOR_SAVE= 0x09
+_USBDBG_ATTR_READ      = 0x8A
+_USBDBG_ATTR_WRITE     = 0x0B
+_USBDBG_SYS_RESET      = 0x0C
+_USBDBG_SYS_RESET_TO_BL= 0x0E
+_USBDBG_FB_ENABLE      = 0x0D
+_USBDBG_TX_BUF_LEN     = 0x8E
+_USBDBG_TX_BUF         = 0x8F
+_USBDBG_GET_STATE      = 0x93
+
+_USBDBG_STATE_FLAGS_SCRIPT = (1 << 0)
+_USBDBG_STATE_FLAGS_TEXT   = (1 << 1)
+_USBDBG_STATE_FLAGS_FRAME  = (1 << 2)
 
 ATTR_CONTRAST   =0
 ATTR_BRIGHTNESS =1
 ATTR_SATURATION =2
 ATTR_GAINCEILING=3
 
-__BOOTLDR_START         = 0xABCD0001
-__BOOTLDR_RESET         = 0xABCD0002
-__BOOTLDR_ERASE         = 0xABCD0004
-__BOOTLDR_WRITE         = 0xABCD0008
-
-def init(port, baudrate=921600, timeout=0.3):
-    global __serial
-    # open CDC port
-    __serial =  serial.Serial(port, baudrate=baudrate, timeout=timeout)
-
-def disconnect():
-    global __serial
-    try:
-        if (__serial):
-            __serial.close()
-            __serial = None
-    except:
-        pass
-
-def set_timeout(timeout):
-    __serial.timeout = timeout
-
-def fb_size():
-    # read fb header
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_FRAME_SIZE, __FB_HDR_SIZE))
-    return struct.unpack("III", __serial.read(12))
-
-def read_state():
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_GET_STATE, 64))
-    flags, w, h, size, text_buf = struct.unpack("IIII48s", __serial.read(64))
+_BOOTLDR_START         = 0xABCD0001
+_BOOTLDR_RESET         = 0xABCD0002
+_BOOTLDR_ERASE         = 0xABCD0004
+_BOOTLDR_WRITE         = 0xABCD0008
+
+# Data bytes per bootloader WRITE packet (4-byte command + data = one 64-byte USB packet)
+FLASH_WRITE_SIZE = 60
+
+# sensor framesizes (w, h)
+FRAMESIZES = {
+    "QQQQVGA": (40, 30),
+    "QQQVGA":  (80, 60),
+    "QQVGA":   (160, 120),
+    "QVGA":    (320, 240),
+    "VGA":     (640, 480),
+    "HQQQVGA": (80, 40),
+    "HQQVGA":  (120, 80),
+    "HQVGA":   (240, 160),
+    "QQCIF":   (88, 72),
+    "QCIF":    (176, 144),
+    "CIF":     (352, 288),
+    "QQSIF":   (88, 60),
+    "QSIF":    (176, 120),
+    "SIF":     (352, 240),
+}
+
+def cmd_header(cmd, length):
+    return struct.pack("<BBI", _USBDBG_CMD, cmd, length)
+
+def parse_state(buf):
+    # GET_STATE response -> (flags, w, h, size, text)
+    flags, w, h, size, text_buf = struct.unpack("IIII48s", buf)
 
     text = None
-    if flags & __USBDBG_STATE_FLAGS_TEXT:
+    if flags & _USBDBG_STATE_FLAGS_TEXT:
         text = text_buf.split(b'\0', 1)[0].decode()
+    return flags, w, h, size, text
 
-    if flags & __USBDBG_STATE_FLAGS_FRAME == 0:
-        return 0, 0, None, 0, text, ""
-
-    num_bytes = size if size > 2 else (w * h * size)
+def frame_num_bytes(w, h, size):
+    return size if size > 2 else (w * h * size)
 
-    # read fb data
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_FRAME_DUMP, num_bytes))
-    buff = __serial.read(num_bytes)
+def decode_frame(buff, w, h, size, out=None, native=False):
+    # -> (frame, fmt), see read_state()
+    if native:
+        # No conversion, see pyopenmv_decode.to_rgb()/to_gray()
+        return pyopenmv_decode.decode_native(buff, w, h, size)
 
     if size == 1:  # Grayscale
         fmt = "GRAY"
-        y = np.fromstring(buff, dtype=np.uint8)
-        buff = np.column_stack((y, y, y))
     elif size == 2: # RGB565
         fmt = "RGB"
-        arr = np.fromstring(buff, dtype=np.uint16)
-        r = (((arr & 0xF800) >>11)*255.0/31.0).astype(np.uint8)
-        g = (((arr & 0x07E0) >>5) *255.0/63.0).astype(np.uint8)
-        b = (((arr & 0x001F) >>0) *255.0/31.0).astype(np.uint8)
-        buff = np.column_stack((r,g,b))
     else: # JPEG
         fmt = "JPEG"
-        try:
-            buff = np.asarray(Image.frombuffer("RGB", (w, h), buff, "jpeg", "RGB", ""))
-        except Exception as e:
-            raise ValueError(f"JPEG decode error (%e)")
 
-    if (buff.size != (w*h*3)):
-        raise ValueError(f"Unexpected frame size. Expected: {w*h*3} received: {buff.size}")
-
-    return w, h, buff.reshape((h, w, 3)), num_bytes, text, fmt
-
-
-def fb_dump():
-    size = fb_size()
+    try:
+        return pyopenmv_decode.decode(buff, w, h, size, out), fmt
+    except Exception as e:
+        raise ValueError(f"{fmt} decode error ({e})")
+
+class OpenMVCamera:
+    """One OpenMV USB debug connection.
+
+    Every camera owns its serial port, timeouts and buffers, so several
+    cameras can be driven from one process (and from separate threads, one
+    thread per camera). With reuse_buffers=True read_state()/fb_dump()
+    decode into the same array every call, so a returned frame is only valid
+    until the next read. Setting `perf` to a pyopenmv_perf.PerfLog records
+    the GET_STATE, transfer and decode time of every read_state().
+    """
+
+    def __init__(self, port=None, baudrate=921600, timeout=0.3, reuse_buffers=False):
+        self.serial = None
+        self.port = port
+        self.reuse_buffers = reuse_buffers
+        self._out = None
+        self._rx = None
+        self._rx_view = None
+        self._state = bytearray(64)
+        self._state_view = memoryview(self._state)
+        self._fio = None
+        self.perf = None
+        if port is not None:
+            self.connect(port, baudrate, timeout)
+
+    def connect(self, port, baudrate=921600, timeout=0.3):
+        # open CDC port, closing any port opened before
+        self.disconnect()
+        self.port = port
+        self.serial = serial.Serial(port, baudrate=baudrate, timeout=timeout)
+        if os.name == "posix" and hasattr(self.serial, "fileno"):
+            # Raw file over the port's descriptor, for readinto() without
+            # pyserial's intermediate bytes objects.
+            self._fio = io.FileIO(self.serial.fileno(), "rb", closefd=False)
+
+    def disconnect(self):
+        try:
+            if (self.serial):
+                if self._fio is not None:
+                    self._fio.close()
+                    self._fio = None
+                self.serial.close()
+                self.serial = None
+        except:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.disconnect()
+
+    def set_timeout(self, timeout):
+        self.serial.timeout = timeout
+
+    def _cmd(self, cmd, length):
+        self.serial.write(cmd_header(cmd, length))
+
+    def _out_buffer(self, out):
+        if out is None and self.reuse_buffers:
+            return self._out
+        return out
+
+    def _readinto(self, view):
+        # Fills view like serial.read(len(view)) would, honoring the port
+        # timeout, and returns the number of bytes read.
+        if self._fio is None:
+            return self.serial.readinto(view)
+        n = len(view)
+        got = 0
+        timeout = self.serial.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while got < n:
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self._fio], [], [], wait)
+            if not ready:
+                break
+            k = self._fio.readinto(view[got:])
+            if k is None:
+                continue
+            if k == 0:
+                raise serial.SerialException("device reports readiness to read but returned no data")
+            got += k
+        return got
+
+    def _read_frame(self, num_bytes):
+        # Reads a frame into the receive buffer, which grows to the largest
+        # frame seen and is reused for every frame after that.
+        if self._rx is None or len(self._rx) < num_bytes:
+            self._rx = bytearray(num_bytes)
+            self._rx_view = memoryview(self._rx)
+        view = self._rx_view[:num_bytes]
+        return view[:self._readinto(view)]
+
+    def _native_frame(self, buff, w, h, size):
+        if not self.reuse_buffers:
+            # Native frames alias the receive buffer, so hand out a copy unless
+            # the caller opted in to frames that are only valid until the next read.
+            buff = bytes(buff)
+        return pyopenmv_decode.decode_native(buff, w, h, size)
+
+    def fb_size(self):
+        # read fb header
+        self._cmd(_USBDBG_FRAME_SIZE, _FB_HDR_SIZE)
+        return struct.unpack("III", self.serial.read(12))
+
+    def read_state(self, out=None, native=False):
+        perf = self.perf
+        t0 = time.perf_counter()
+        self._cmd(_USBDBG_GET_STATE, 64)
+        if self._readinto(self._state_view) != 64:
+            raise serial.SerialTimeoutException("GET_STATE timed out")
+        flags, w, h, size, text = parse_state(self._state)
+        if perf is not None:
+            t1 = time.perf_counter()
+            perf.add("get_state", t1 - t0)
+
+        if flags & _USBDBG_STATE_FLAGS_FRAME == 0:
+            return 0, 0, None, 0, text, ""
+
+        num_bytes = frame_num_bytes(w, h, size)
+
+        # read fb data
+        self._cmd(_USBDBG_FRAME_DUMP, num_bytes)
+        buff = self._read_frame(num_bytes)
+        if perf is not None:
+            t2 = time.perf_counter()
+            perf.add("transfer", t2 - t1)
+
+        if native:
+            buff, fmt = self._native_frame(buff, w, h, size)
+            return w, h, buff, num_bytes, text, fmt
+
+        buff, fmt = decode_frame(buff, w, h, size, self._out_buffer(out))
+        if self.reuse_buffers:
+            self._out = buff
+        if perf is not None:
+            perf.add("decode", time.perf_counter() - t2)
+        return w, h, buff, num_bytes, text, fmt
+
+    def fb_dump(self, out=None, native=False):
+        size = self.fb_size()
+
+        if (not size[0]):
+            # frame not ready
+            return None
 
-    if (not size[0]):
-        # frame not ready
-        return None
+        if (size[2] > 2): #JPEG
+            num_bytes = size[2]
+        else:
+            num_bytes = size[0]*size[1]*size[2]
 
-    if (size[2] > 2): #JPEG
-        num_bytes = size[2]
-    else:
-        num_bytes = size[0]*size[1]*size[2]
+        # read fb data
+        self._cmd(_USBDBG_FRAME_DUMP, num_bytes)
+        buff = self._read_frame(num_bytes)
 
-    # read fb data
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_FRAME_DUMP, num_bytes))
-    buff = __serial.read(num_bytes)
+        if native:
+            return (size[0], size[1], self._native_frame(buff, size[0], size[1], size[2])[0])
 
-    if size[2] == 1:  # Grayscale
-        y = np.fromstring(buff, dtype=np.uint8)
-        buff = np.column_stack((y, y, y))
-    elif size[2] == 2: # RGB565
-        arr = np.fromstring(buff, dtype=np.uint16)
-        r = (((arr & 0xF800) >>11)*255.0/31.0).astype(np.uint8)
-        g = (((arr & 0x07E0) >>5) *255.0/63.0).astype(np.uint8)
-        b = (((arr & 0x001F) >>0) *255.0/31.0).astype(np.uint8)
-        buff = np.column_stack((r,g,b))
-    else: # JPEG
         try:
-            buff = np.asarray(Image.frombuffer("RGB", size[0:2], buff, "jpeg", "RGB", ""))
+            buff = pyopenmv_decode.decode(buff, size[0], size[1], size[2], self._out_buffer(out))
         except Exception as e:
-            print ("JPEG decode error (%s)"%(e))
+            print ("Frame decode error (%s)"%(e))
             return None
 
-    if (buff.size != (size[0]*size[1]*3)):
-        return None
+        if self.reuse_buffers:
+            self._out = buff
+        return (size[0], size[1], buff)
+
+    def exec_script(self, buf):
+        self._cmd(_USBDBG_SCRIPT_EXEC, len(buf))
+        self.serial.write(buf.encode())
 
-    return (size[0], size[1], buff.reshape((size[1], size[0], 3)))
+    def stop_script(self):
+        self._cmd(_USBDBG_SCRIPT_STOP, 0)
 
-def exec_script(buf):
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_SCRIPT_EXEC, len(buf)))
-    __serial.write(buf.encode())
+    def script_running(self):
+        self._cmd(_USBDBG_SCRIPT_RUNNING, 4)
+        return struct.unpack("I", self.serial.read(4))[0]
 
-def stop_script():
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_SCRIPT_STOP, 0))
+    def save_template(self, x, y, w, h, path):
+        buf = struct.pack("IIII", x, y, w, h) + path
+        self._cmd(_USBDBG_TEMPLATE_SAVE, len(buf))
+        self.serial.write(buf)
 
-def script_running():
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_SCRIPT_RUNNING, 4))
-    return struct.unpack("I", __serial.read(4))[0]
+    def save_descriptor(self, x, y, w, h, path):
+        buf = struct.pack("HHHH", x, y, w, h) + path
+        self._cmd(_USBDBG_DESCRIPTOR_SAVE, len(buf))
+        self.serial.write(buf)
 
-def save_template(x, y, w, h, path):
-    buf = struct.pack("IIII", x, y, w, h) + path
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_TEMPLATE_SAVE, len(buf)))
-    __serial.write(buf)
+    def set_attr(self, attr, value):
+        self._cmd(_USBDBG_ATTR_WRITE, 8)
+        self.serial.write(struct.pack("<II", attr, value))
 
-def save_descriptor(x, y, w, h, path):
-    buf = struct.pack("HHHH", x, y, w, h) + path
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_DESCRIPTOR_SAVE, len(buf)))
-    __serial.write(buf)
+    def get_attr(self, attr):
+        self.serial.write(struct.pack("<BBIh", _USBDBG_CMD, _USBDBG_ATTR_READ, 1, attr))
+        return self.serial.read(1)
 
-def set_attr(attr, value):
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_ATTR_WRITE, 8))
-    __serial.write(struct.pack("<II", attr, value))
+    def reset(self):
+        self._cmd(_USBDBG_SYS_RESET, 0)
 
-def get_attr(attr):
-    __serial.write(struct.pack("<BBIh", __USBDBG_CMD, __USBDBG_ATTR_READ, 1, attr))
-    return __serial.read(1)
+    def reset_to_bl(self):
+        self._cmd(_USBDBG_SYS_RESET_TO_BL, 0)
 
-def reset():
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_SYS_RESET, 0))
+    def bootloader_start(self):
+        self.serial.write(struct.pack("<I", _BOOTLDR_START))
+        return struct.unpack("I", self.serial.read(4))[0] == _BOOTLDR_START
 
-def reset_to_bl():
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_SYS_RESET_TO_BL, 0))
+    def bootloader_reset(self):
+        self.serial.write(struct.pack("<I", _BOOTLDR_RESET))
 
-def bootloader_start():
-    __serial.write(struct.pack("<I", __BOOTLDR_START))
-    return struct.unpack("I", __serial.read(4))[0] == __BOOTLDR_START
+    def flash_erase(self, sector):
+        self.serial.write(struct.pack("<II", _BOOTLDR_ERASE, sector))
 
-def bootloader_reset():
-    __serial.write(struct.pack("<I", __BOOTLDR_RESET))
+    def flash_write(self, buf):
+        self.serial.write(struct.pack("<I", _BOOTLDR_WRITE) + buf)
 
-def flash_erase(sector):
-    __serial.write(struct.pack("<II", __BOOTLDR_ERASE, sector))
+    def tx_buf_len(self):
+        self._cmd(_USBDBG_TX_BUF_LEN, 4)
+        return struct.unpack("I", self.serial.read(4))[0]
 
-def flash_write(buf):
-    __serial.write(struct.pack("<I", __BOOTLDR_WRITE) + buf)
+    def tx_buf(self, bytes):
+        self._cmd(_USBDBG_TX_BUF, bytes)
+        return self.serial.read(bytes)
 
-def tx_buf_len():
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_TX_BUF_LEN, 4))
-    return struct.unpack("I", __serial.read(4))[0]
+    def fw_version(self):
+        self._cmd(_USBDBG_FW_VERSION, 12)
+        return struct.unpack("III", self.serial.read(12))
 
-def tx_buf(bytes):
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_TX_BUF, bytes))
-    return __serial.read(bytes)
+    def enable_fb(self, enable):
+        self._cmd(_USBDBG_FB_ENABLE, 4)
+        self.serial.write(struct.pack("<I", enable))
 
-def fw_version():
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_FW_VERSION, 12))
-    return struct.unpack("III", __serial.read(12))
+    def arch_str(self):
+        self._cmd(_USBDBG_ARCH_STR, 64)
+        return self.serial.read(64).split(b'\0', 1)[0]
 
-def enable_fb(enable):
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_FB_ENABLE, 4))
-    __serial.write(struct.pack("<I", enable))
 
-def arch_str():
-    __serial.write(struct.pack("<BBI", __USBDBG_CMD, __USBDBG_ARCH_STR, 64))
-    return __serial.read(64).split(b'\0', 1)[0]
+# Module-level API: thin wrappers around a default camera, kept for the
+# existing scripts.
+_default = OpenMVCamera()
+
+def init(port, baudrate=921600, timeout=0.3):
+    _default.connect(port, baudrate, timeout)
+
+def default_camera():
+    return _default
+
+disconnect = _default.disconnect
+set_timeout = _default.set_timeout
+fb_size = _default.fb_size
+read_state = _default.read_state
+fb_dump = _default.fb_dump
+exec_script = _default.exec_script
+stop_script = _default.stop_script
+script_running = _default.script_running
+save_template = _default.save_template
+save_descriptor = _default.save_descriptor
+set_attr = _default.set_attr
+get_attr = _default.get_attr
+reset = _default.reset
+reset_to_bl = _default.reset_to_bl
+bootloader_start = _default.bootloader_start
+bootloader_reset = _default.bootloader_reset
+flash_erase = _default.flash_erase
+flash_write = _default.flash_write
+tx_buf_len = _default.tx_buf_len
+tx_buf = _default.tx_buf
+fw_version = _default.fw_version
+enable_fb = _default.enable_fb
+arch_str = _default.arch_str
 
 if __name__ == '__main__':
     if len(sys.argv)!= 3:
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# Frame recording and replay for OpenMV sessions.
+#
+# An archive is a 64-byte file header followed by fixed-size slots, one per
+# frame. Each slot holds a 32-byte record header (timestamp, width, height,
+# byte count, format) and the native frame bytes (see read_state(native=True)),
+# padded to the slot size. Since every slot has the same size the whole file
+# maps onto a numpy structured array with np.memmap, and frame N is a view
+# into the mapping. A side index (<archive>.idx) repeats the record headers so
+# timing can be inspected without touching the frame data.
+
+import argparse
+import os
+import struct
+import time
+
+import numpy as np
+
+import pyopenmv
+import pyopenmv_decode
+
+MAGIC = b"OMVREC1\0"
+VERSION = 1
+HEADER_SIZE = 64
+SLOT_ALIGN = 64
+
+FORMATS = {pyopenmv_decode.FMT_GRAY: 1, pyopenmv_decode.FMT_RGB565: 2, pyopenmv_decode.FMT_JPEG: 3,
+           pyopenmv_decode.FMT_RGB: 4}
+FORMAT_NAMES = {v: k for k, v in FORMATS.items()}
+
+INDEX_DTYPE = np.dtype([("t", "<f8"), ("w", "<u4"), ("h", "<u4"), ("nbytes", "<u4"), ("fmt", "u1"), ("pad", "u1", 11)])
+
+def record_dtype(slot_size):
+    return np.dtype(INDEX_DTYPE.descr + [("data", "u1", (slot_size,))])
+
+def slot_size_for(w, h, bpp=2):
+    # Room for the largest native frame of this size.
+    size = w * h * bpp
+    return (size + SLOT_ALIGN - 1) // SLOT_ALIGN * SLOT_ALIGN
+
+class FrameRecorder:
+    """Appends native frames to an archive. slot_size must be at least the
+    largest frame in bytes; slot_size_for() gives a safe value for a
+    framesize. Appending to an existing archive reuses its slot size."""
+
+    def __init__(self, path, slot_size=None):
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE:
+            with open(path, "rb") as f:
+                slot_size = _read_header(f.read(HEADER_SIZE))
+        else:
+            if slot_size is None:
+                slot_size = slot_size_for(*pyopenmv.FRAMESIZES["VGA"])
+            slot_size = (slot_size + SLOT_ALIGN - 1) // SLOT_ALIGN * SLOT_ALIGN
+            with open(path, "wb") as f:
+                f.write(struct.pack("<8sII", MAGIC, VERSION, slot_size).ljust(HEADER_SIZE, b"\0"))
+            open(path + ".idx", "wb").close()
+        self.slot_size = slot_size
+        self._rec = np.zeros(1, dtype=record_dtype(slot_size))
+        self._f = open(path, "ab")
+        self._idx = open(path + ".idx", "ab")
+        self.frames = (os.path.getsize(path) - HEADER_SIZE) // self._rec.itemsize
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._idx.close()
+            self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, w, h, data, fmt, t=None):
+        data = memoryview(data).cast("B")
+        if data.nbytes > self.slot_size:
+            raise ValueError(f"Frame too large for archive slot. Slot: {self.slot_size} frame: {data.nbytes}")
+        rec = self._rec
+        rec["t"] = time.time() if t is None else t
+        rec["w"], rec["h"], rec["nbytes"], rec["fmt"] = w, h, data.nbytes, FORMATS[fmt]
+        rec["data"][0, :data.nbytes] = np.frombuffer(data, dtype=np.uint8)
+        rec["data"][0, data.nbytes:] = 0
+        self._f.write(memoryview(self._rec))
+        self._idx.write(memoryview(self._rec).cast("B")[:INDEX_DTYPE.itemsize])
+        self.frames += 1
+
+    def record(self, read_state, frames=None, seconds=None):
+        """Pulls native frames from read_state (e.g. OpenMVCamera.read_state)
+        until `frames` have been stored or `seconds` have passed."""
+        end = None if seconds is None else time.monotonic() + seconds
+        count = 0
+        while (frames is None or count < frames) and (end is None or time.monotonic() < end):
+            w, h, data, size, text, fmt = read_state(native=True)
+            if data is None:
+                time.sleep(0.001)
+                continue
+            self.write(w, h, data, fmt)
+            count += 1
+        return count
+
+def _read_header(buf):
+    magic, version, slot_size = struct.unpack_from("<8sII", buf)
+    if magic != MAGIC:
+        raise ValueError("Not an OpenMV frame archive")
+    if version != VERSION:
+        raise ValueError(f"Unsupported archive version {version}")
+    return slot_size
+
+class FrameArchive:
+    """Read-only, zero-copy view of an archive."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.slot_size = _read_header(f.read(HEADER_SIZE))
+        dtype = record_dtype(self.slot_size)
+        count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+        self.records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count,)) if count else np.zeros(0, dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def index(self):
+        # Timestamps/sizes from the side index if present, else from the slots.
+        idx_path = self.path + ".idx"
+        if os.path.exists(idx_path):
+            idx = np.fromfile(idx_path, dtype=INDEX_DTYPE)
+            return idx[:len(self)]
+        return self.records[list(INDEX_DTYPE.names)]
+
+    def frame(self, n):
+        """Returns (t, w, h, data, fmt). data is a native frame viewing the
+        mapped file: (h, w) uint8/uint16 array, (h, w, 3) uint8 for RGB, or
+        a memoryview for JPEG."""
+        rec = self.records[n]
+        w, h, nbytes = int(rec["w"]), int(rec["h"]), int(rec["nbytes"])
+        fmt = FORMAT_NAMES[int(rec["fmt"])]
+        raw = rec["data"][:nbytes]
+        if fmt == pyopenmv_decode.FMT_GRAY:
+            data = raw.reshape((h, w))
+        elif fmt == pyopenmv_decode.FMT_RGB565:
+            data = raw.view(np.uint16).reshape((h, w))
+        elif fmt == pyopenmv_decode.FMT_RGB:
+            data = raw.reshape((h, w, 3))
+        else:
+            data = memoryview(raw)
+        return float(rec["t"]), w, h, data, fmt
+
+    def __getitem__(self, n):
+        return self.frame(n)
+
+class ArchiveReplay:
+    """Replays an archive through the read_state() interface.
+
+    With realtime=True frames are released at their recorded spacing,
+    otherwise as fast as the caller asks. seek() gives random access; once the
+    end is reached an empty state is returned unless loop is set."""
+
+    def __init__(self, path, realtime=True, loop=False, speed=1.0):
+        self.archive = FrameArchive(path)
+        self.realtime = realtime
+        self.loop = loop
+        self.speed = speed
+        self.pos = 0
+        self._t0 = None
+        self._start = None
+
+    def __len__(self):
+        return len(self.archive)
+
+    def seek(self, n):
+        self.pos = n
+        self._t0 = None
+
+    def read_state(self, out=None, native=False):
+        if self.pos >= len(self.archive):
+            if not self.loop or not len(self.archive):
+                return 0, 0, None, 0, None, ""
+            self.seek(0)
+        t, w, h, data, fmt = self.archive.frame(self.pos)
+        if self.realtime:
+            now = time.monotonic()
+            if self._t0 is None:
+                self._t0, self._start = t, now
+            delay = self._start + (t - self._t0) / self.speed - now
+            if delay > 0:
+                time.sleep(delay)
+        self.pos += 1
+        num_bytes = data.nbytes
+        if native:
+            return w, h, data, num_bytes, None, fmt
+        return w, h, pyopenmv_decode.to_rgb(data, fmt, w, h, out), num_bytes, None, pyopenmv_decode.RGB_FMT_NAMES[fmt]
+
+def _record(args):
+    cam = pyopenmv.OpenMVCamera(args.port, timeout=2)
+    try:
+        cam.stop_script()
+        cam.enable_fb(True)
+        if args.script:
+            with open(args.script, 'r') as fin:
+                cam.exec_script(fin.read())
+        w, h = pyopenmv.FRAMESIZES[args.framesize]
+        with FrameRecorder(args.archive, slot_size_for(w, h)) as rec:
+            n = rec.record(cam.read_state, frames=args.frames, seconds=args.seconds)
+        print(f"Recorded {n} frames to {args.archive}")
+    finally:
+        cam.disconnect()
+
+def _info(args):
+    archive = FrameArchive(args.archive)
+    idx = archive.index()
+    print(f"{args.archive}: {len(archive)} frames, slot size {archive.slot_size} bytes")
+    if len(idx) > 1:
+        span = idx["t"][-1] - idx["t"][0]
+        print(f"{span:.2f} s, {(len(idx) - 1) / span:.2f} FPS, {idx['nbytes'].mean() / 1024:.1f} KiB/frame")
+
+def _replay(args):
+    replay = ArchiveReplay(args.archive, realtime=False)
+    out = None
+    start = time.perf_counter()
+    n = 0
+    while True:
+        w, h, out_, size, text, fmt = replay.read_state(out=out)
+        if out_ is None:
+            break
+        out = out_
+        n += 1
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {n} frames in {elapsed:.3f} s ({n / elapsed:.1f} FPS decoded)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record and replay OpenMV frame archives")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("record", help="Record frames from a camera")
+    p.add_argument("archive")
+    p.add_argument("--port", default="/dev/ttyACM0", help="OpenMV camera port (default /dev/ttyACM0)")
+    p.add_argument("--script", help="Script to run on the camera")
+    p.add_argument("--framesize", default="VGA", choices=pyopenmv.FRAMESIZES, help="Largest framesize to expect (default VGA)")
+    p.add_argument("--frames", type=int, default=None, help="Stop after this many frames")
+    p.add_argument("--seconds", type=float, default=10, help="Stop after this many seconds (default 10)")
+    p.set_defaults(func=_record)
+    p = sub.add_parser("info", help="Print archive statistics")
+    p.add_argument("archive")
+    p.set_defaults(func=_info)
+    p = sub.add_parser("replay", help="Decode every frame as fast as possible")
+    p.add_argument("archive")
+    p.set_defaults(func=_replay)
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# asyncio client for the OpenMV USB debug protocol.
+#
+# SerialTransport drives a pyserial port from the event loop's reader/writer
+# callbacks instead of blocking reads, so frame capture, text draining and any
+# other serial streams (e.g. the Hall sensor boards) can share one loop.
+# RGB565 and JPEG frames are decoded in the loop's default executor so a large
+# decode doesn't stall the other tasks. A command that times out or is
+# cancelled drops its partial response, and the next command first discards
+# whatever is still arriving, so the protocol stays in sync. Needs a
+# selector-based loop on a POSIX host.
+
+import argparse
+import asyncio
+import contextlib
+import os
+import struct
+import time
+
+import serial
+
+from pyopenmv import (cmd_header, parse_state, frame_num_bytes, decode_frame,
+                      _USBDBG_FW_VERSION, _USBDBG_FRAME_DUMP, _USBDBG_GET_STATE,
+                      _USBDBG_SCRIPT_EXEC, _USBDBG_SCRIPT_STOP, _USBDBG_SCRIPT_RUNNING,
+                      _USBDBG_FB_ENABLE, _USBDBG_TX_BUF_LEN, _USBDBG_TX_BUF,
+                      _USBDBG_STATE_FLAGS_FRAME)
+
+class SerialTransport:
+    """Non-blocking byte stream over a serial port."""
+
+    def __init__(self, port, baudrate=921600, loop=None):
+        self._loop = loop or asyncio.get_running_loop()
+        self.serial = serial.Serial(port, baudrate=baudrate, timeout=0)
+        self.serial.nonblocking()
+        self._fd = self.serial.fileno()
+        self._rbuf = bytearray()
+        self._wbuf = bytearray()
+        self._need = 0
+        self._waiter = None
+        self._error = None
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    def close(self):
+        if self.serial is None:
+            return
+        self._loop.remove_reader(self._fd)
+        if self._wbuf:
+            self._loop.remove_writer(self._fd)
+        self.serial.close()
+        self.serial = None
+        self._wake(ConnectionError("serial port closed"))
+
+    def _wake(self, error=None):
+        if error is not None:
+            self._error = error
+        if self._waiter is not None and not self._waiter.done():
+            if self._error is not None:
+                self._waiter.set_exception(self._error)
+            else:
+                self._waiter.set_result(None)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._wake(e)
+            return
+        if not data:
+            self._wake(ConnectionError("serial port disconnected"))
+            return
+        self._rbuf += data
+        if len(self._rbuf) >= self._need:
+            self._wake()
+
+    def _on_writable(self):
+        try:
+            n = os.write(self._fd, self._wbuf)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._loop.remove_writer(self._fd)
+            self._wake(e)
+            return
+        del self._wbuf[:n]
+        if not self._wbuf:
+            self._loop.remove_writer(self._fd)
+
+    def write(self, data):
+        if self._wbuf:
+            self._wbuf += data
+            return
+        try:
+            n = os.write(self._fd, data)
+        except BlockingIOError:
+            n = 0
+        if n < len(data):
+            self._wbuf += data[n:]
+            self._loop.add_writer(self._fd, self._on_writable)
+
+    async def _wait_for(self, n, timeout):
+        while len(self._rbuf) < n:
+            if self._error is not None:
+                raise self._error
+            self._need = n
+            self._waiter = self._loop.create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            finally:
+                self._waiter = None
+
+    async def read(self, n, timeout=None):
+        """Reads exactly n bytes."""
+        await self._wait_for(n, timeout)
+        data = bytes(self._rbuf[:n])
+        del self._rbuf[:n]
+        return data
+
+    async def readline(self, timeout=None):
+        while True:
+            i = self._rbuf.find(b"\n")
+            if i >= 0:
+                return await self.read(i + 1)
+            await self._wait_for(len(self._rbuf) + 1, timeout)
+
+    def flush_input(self):
+        """Drops buffered input, including the port's."""
+        self._rbuf.clear()
+        if self.serial is not None:
+            self.serial.reset_input_buffer()
+
+    async def drain_input(self, quiet=0.05, timeout=1.0):
+        """Discards input until none has arrived for `quiet` seconds."""
+        end = self._loop.time() + timeout
+        self.flush_input()
+        while self._loop.time() < end:
+            try:
+                await self._wait_for(1, quiet)
+            except asyncio.TimeoutError:
+                return
+            self.flush_input()
+
+class AsyncOpenMVCamera:
+    """asyncio counterpart of pyopenmv.OpenMVCamera for the commands used by
+    the viewers. Commands are serialized with a lock, so several tasks may
+    share one camera."""
+
+    def __init__(self, transport, timeout=2.0):
+        self.transport = transport
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self._stale = False  # a response was abandoned, resync before the next command
+
+    @classmethod
+    async def open(cls, port, baudrate=921600, timeout=2.0):
+        return cls(SerialTransport(port, baudrate), timeout)
+
+    def close(self):
+        self.transport.close()
+
+    @contextlib.asynccontextmanager
+    async def _exchange(self):
+        # One command/response under the lock.
+        async with self._lock:
+            if self._stale:
+                await self.transport.drain_input()
+                self._stale = False
+            try:
+                yield
+            except BaseException:
+                # Timed out or cancelled: part of the response may be
+                # buffered or still on its way, don't let the next command
+                # read it as its own.
+                self.transport.flush_input()
+                self._stale = True
+                raise
+
+    async def _request(self, cmd, length, payload=b"", response=0):
+        async with self._exchange():
+            self.transport.write(cmd_header(cmd, length) + payload)
+            if response:
+                return await self.transport.read(response, self.timeout)
+
+    async def get_state(self):
+        """Returns the raw (flags, w, h, size, text) GET_STATE response."""
+        return parse_state(await self._request(_USBDBG_GET_STATE, 64, response=64))
+
+    async def read_state(self, out=None, native=False):
+        # Same result layout as pyopenmv.read_state(). GET_STATE and
+        # FRAME_DUMP are issued under one lock so no other command can sneak
+        # in between.
+        async with self._exchange():
+            self.transport.write(cmd_header(_USBDBG_GET_STATE, 64))
+            flags, w, h, size, text = parse_state(await self.transport.read(64, self.timeout))
+
+            if flags & _USBDBG_STATE_FLAGS_FRAME == 0:
+                return 0, 0, None, 0, text, ""
+
+            num_bytes = frame_num_bytes(w, h, size)
+            self.transport.write(cmd_header(_USBDBG_FRAME_DUMP, num_bytes))
+            buff = await self.transport.read(num_bytes, self.timeout)
+
+        if size == 1 or native:
+            buff, fmt = decode_frame(buff, w, h, size, out, native)
+        else:
+            loop = asyncio.get_running_loop()
+            buff, fmt = await loop.run_in_executor(None, decode_frame, buff, w, h, size, out, native)
+        return w, h, buff, num_bytes, text, fmt
+
+    async def exec_script(self, buf):
+        await self._request(_USBDBG_SCRIPT_EXEC, len(buf), buf.encode())
+
+    async def stop_script(self):
+        await self._request(_USBDBG_SCRIPT_STOP, 0)
+
+    async def script_running(self):
+        return struct.unpack("I", await self._request(_USBDBG_SCRIPT_RUNNING, 4, response=4))[0]
+
+    async def enable_fb(self, enable):
+        await self._request(_USBDBG_FB_ENABLE, 4, struct.pack("<I", enable))
+
+    async def tx_buf_len(self):
+        return struct.unpack("I", await self._request(_USBDBG_TX_BUF_LEN, 4, response=4))[0]
+
+    async def tx_buf(self, bytes):
+        return await self._request(_USBDBG_TX_BUF, bytes, response=bytes)
+
+    async def fw_version(self):
+        return struct.unpack("III", await self._request(_USBDBG_FW_VERSION, 12, response=12))
+
+async def _capture(cam, seconds):
+    frames = 0
+    nbytes = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        w, h, data, size, text, fmt = await cam.read_state()
+        if data is None:
+            await asyncio.sleep(0.001)
+            continue
+        frames += 1
+        nbytes += size
+    print(f"capture: {frames / seconds:.2f} FPS, {nbytes / seconds / 1024**2:.2f} MB/s")
+
+async def _drain_text(cam, seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        n = await cam.tx_buf_len()
+        if n:
+            print((await cam.tx_buf(n)).decode(errors="replace"), end="")
+        await asyncio.sleep(0.050)
+
+async def _tail(port, baudrate, seconds):
+    transport = SerialTransport(port, baudrate)
+    end = time.monotonic() + seconds
+    try:
+        while time.monotonic() < end:
+            try:
+                line = await transport.readline(timeout=end - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            print(f"[{port}] {line.decode(errors='replace').rstrip()}")
+    finally:
+        transport.close()
+
+async def _main(args):
+    cam = await AsyncOpenMVCamera.open(args.port)
+    try:
+        await cam.stop_script()
+        await cam.enable_fb(True)
+        if args.script:
+            with open(args.script, 'r') as fin:
+                await cam.exec_script(fin.read())
+        tasks = [_capture(cam, args.seconds), _drain_text(cam, args.seconds)]
+        if args.tail:
+            tasks.append(_tail(args.tail, args.tail_baudrate, args.seconds))
+        await asyncio.gather(*tasks)
+    finally:
+        cam.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="asyncio OpenMV capture demo")
+    parser.add_argument("--port", default="/dev/ttyACM0", help="OpenMV camera port (default /dev/ttyACM0)")
+    parser.add_argument("--script", help="Script to run on the camera")
+    parser.add_argument("--seconds", type=float, default=10, help="Capture duration (default 10s)")
+    parser.add_argument("--tail", help="Extra line-based serial port to read on the same loop (e.g. Hall sensor)")
+    parser.add_argument("--tail-baudrate", type=int, default=115200, help="Baud rate for --tail (default 115200)")
+    args = parser.parse_args()
+
+    asyncio.run(_main(args))
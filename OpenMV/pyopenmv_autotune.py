@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# Auto-tuned JPEG transport.
+#
+# TransportTuner uploads a capture script that JPEG-compresses every frame on
+# the camera, then adjusts the JPEG quality (and, once quality is exhausted,
+# the framesize) in a feedback loop so the host reaches a target frame rate
+# and/or stays under a link budget in MB/s. Each change re-uploads the script,
+# so changes are made at most once per measurement window. Quality moves one
+# step per window, also after a framesize change. A quality or framesize that
+# was too slow right after stepping up to it is held off for HOLD_WINDOWS
+# windows, doubling with every further failure, so the tuner doesn't bounce
+# between two settings.
+
+import argparse
+import time
+
+import pyopenmv
+import pyopenmv_decode
+from pyopenmv_jpeg import JpegDecoder
+from pyopenmv_scripts import capture_script
+from pyopenmv_text import TextStream, MetricParser
+
+QUALITY_MIN = 10
+QUALITY_MAX = 95
+QUALITY_STEP = 10
+HOLD_WINDOWS = 4
+
+def framesize_ladder(largest):
+    # 4:3 framesizes from `largest` down, by pixel count.
+    w, h = pyopenmv.FRAMESIZES[largest]
+    sizes = [n for n, (fw, fh) in pyopenmv.FRAMESIZES.items() if fw * 3 == fh * 4 and fw * fh <= w * h]
+    if largest not in sizes:
+        sizes.append(largest)
+    return sorted(sizes, key=lambda n: -pyopenmv.FRAMESIZES[n][0] * pyopenmv.FRAMESIZES[n][1])
+
+class TransportTuner:
+
+    def __init__(self, cam=None, target_fps=None, max_mbps=None, framesize="QVGA",
+                 quality=70, window=1.0, settle=0.5):
+        if target_fps is None and max_mbps is None:
+            raise ValueError("need target_fps and/or max_mbps")
+        self.cam = cam or pyopenmv.default_camera()
+        self.target_fps = target_fps
+        self.max_mbps = max_mbps
+        self.ladder = framesize_ladder(framesize)
+        self.level = 0
+        self.quality = quality
+        self.window = window
+        self.settle = settle
+        self.decoder = JpegDecoder(workers=0)
+        self.stream = TextStream(self.cam)
+        self.metrics = MetricParser()
+        self.device_fps = 0.0
+        self.changes = 0
+        self.last = {}
+        self._failures = {}   # (level, quality): failed step ups to it
+        self._held = {}       # (level, quality): monotonic time until stepping up to it is allowed
+        self._stepped_up = None  # (level, quality) before the last step up
+        self._apply()
+
+    @property
+    def framesize(self):
+        return self.ladder[self.level]
+
+    def _apply(self):
+        self.cam.stop_script()
+        self.cam.enable_fb(True)
+        self.script = capture_script(self.framesize, "JPEG", self.quality, skip_ms=0)
+        self.cam.exec_script(self.script)
+        self._window_start = time.monotonic() + self.settle
+        self._frames = 0
+        self._bytes = 0
+        self._decode_ms = 0.0
+        self.device_fps = 0.0
+
+    def read_state(self, out=None):
+        """Same result as pyopenmv.read_state(), the frame decoded to RGB.
+        `out` is a frame this tuner returned earlier; its buffer is reused."""
+        self.decoder.release(out)
+        w, h, data, size, text, fmt = self.cam.read_state(native=True)
+        self.stream.feed(text)
+        for m in self.metrics.metrics(self.stream.lines()):
+            self.device_fps = m.values.get("fps", self.device_fps)
+        if data is None:
+            return w, h, None, size, text, fmt
+
+        frame = self.decoder.decode(data, w, h, fmt)
+        now = time.monotonic()
+        if now >= self._window_start:
+            self._frames += 1
+            self._bytes += size
+            self._decode_ms += frame.decode_ms
+            if now - self._window_start >= self.window:
+                self._adjust(now - self._window_start)
+        return frame.w, frame.h, frame.data, size, text, pyopenmv_decode.RGB_FMT_NAMES[fmt]
+
+    def _adjust(self, elapsed):
+        fps = self._frames / elapsed
+        mbps = self._bytes / elapsed / 1024**2
+        self.last = {
+            "fps": round(fps, 2),
+            "device_fps": round(self.device_fps, 2),
+            "mbps": round(mbps, 3),
+            "bytes_per_frame": self._bytes // max(self._frames, 1),
+            "decode_ms": round(self._decode_ms / max(self._frames, 1), 3),
+            "quality": self.quality,
+            "framesize": self.framesize,
+        }
+
+        over_budget = self.max_mbps is not None and mbps > self.max_mbps
+        # The link is only the bottleneck if the host sees fewer frames than
+        # the camera produces; otherwise smaller frames won't help.
+        link_bound = self.device_fps == 0 or fps < 0.9 * self.device_fps
+        too_slow = self.target_fps is not None and fps < self.target_fps and link_bound
+        headroom = ((self.target_fps is None or fps > 1.15 * self.target_fps or not link_bound) and
+                    (self.max_mbps is None or mbps < 0.8 * self.max_mbps))
+
+        now = time.monotonic()
+        stepped_up, self._stepped_up = self._stepped_up, None
+        setting = (self.level, self.quality)
+        if stepped_up is not None and not (over_budget or too_slow):
+            self._failures.pop(setting, None)  # the step up held
+        if over_budget or too_slow:
+            if stepped_up is not None:
+                # The step up failed: back to the setting that had headroom,
+                # and hold this one off for a while.
+                failures = self._failures[setting] = self._failures.get(setting, 0) + 1
+                self._held[setting] = now + self.window * HOLD_WINDOWS * 2 ** (failures - 1)
+                self.level, self.quality = stepped_up
+            elif self.quality > QUALITY_MIN:
+                self.quality = max(QUALITY_MIN, self.quality - QUALITY_STEP)
+            elif self.level + 1 < len(self.ladder):
+                self.level += 1
+            else:
+                return self._reset_window()
+        elif headroom:
+            if self.quality < QUALITY_MAX:
+                up = (self.level, min(QUALITY_MAX, self.quality + QUALITY_STEP))
+            elif self.level > 0:
+                up = (self.level - 1, QUALITY_MIN)
+            else:
+                return self._reset_window()
+            if now < self._held.get(up, 0):
+                return self._reset_window()
+            self._stepped_up = setting
+            self.level, self.quality = up
+        else:
+            return self._reset_window()
+        self.changes += 1
+        self._apply()
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._frames = 0
+        self._bytes = 0
+        self._decode_ms = 0.0
+
+    def report(self):
+        return dict(self.last, changes=self.changes)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream JPEG frames, tuning quality/framesize to a target")
+    parser.add_argument("--port", default="/dev/ttyACM0", help="OpenMV camera port (default /dev/ttyACM0)")
+    parser.add_argument("--target-fps", type=float, default=None, help="Host frame rate to reach")
+    parser.add_argument("--max-mbps", type=float, default=None, help="Link budget in MB/s")
+    parser.add_argument("--framesize", default="QVGA", choices=pyopenmv.FRAMESIZES, help="Largest framesize to use (default QVGA)")
+    parser.add_argument("--quality", type=int, default=70, help="Initial JPEG quality (default 70)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Run time (default 10)")
+    parser.add_argument("--emulate", action="store_true", help="Run against an emulated camera")
+    parser.add_argument("--link-bps", type=float, default=None, help="Emulated link speed in bytes/s")
+    args = parser.parse_args()
+    if args.target_fps is None and args.max_mbps is None:
+        parser.error("need --target-fps and/or --max-mbps")
+
+    emu = None
+    port = args.port
+    if args.emulate:
+        from pyopenmv_emulator import EmulatedOpenMV
+        emu = EmulatedOpenMV(link_bps=args.link_bps).start()
+        port = emu.port
+
+    cam = pyopenmv.OpenMVCamera(port, timeout=2)
+    tuner = TransportTuner(cam, args.target_fps, args.max_mbps, args.framesize, args.quality)
+    end = time.monotonic() + args.seconds
+    shown = None
+    fb = None
+    try:
+        while time.monotonic() < end:
+            w, h, data, size, text, fmt = tuner.read_state(out=fb)
+            if data is None:
+                time.sleep(0.001)
+                continue
+            fb = data
+            if tuner.last and tuner.last is not shown:
+                shown = tuner.last
+                print(tuner.report())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cam.stop_script()
+        cam.disconnect()
+        if emu is not None:
+            emu.stop()
+    print(f"Final: {tuner.report()}")
+
+if __name__ == "__main__":
+    main()
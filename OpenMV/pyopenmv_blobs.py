@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# Host-side blob detection, mirroring img.find_blobs() in the IR trackers.
+#
+# find_blobs() thresholds a grayscale frame, labels connected components with
+# scipy.ndimage.label, then gets every blob's pixel count, centroid and
+# bounding box from one pass over the foreground pixels (bincount and
+# minimum/maximum.at, no per-blob Python loop). As on the device, area is the
+# bounding box area, density is pixels / area, blobs under area_threshold or
+# pixels_threshold are dropped, and blobs come out in scan order. Components
+# are 4-connected by default, like imlib's span fill. most_dense() picks the
+# blob the trackers follow.
+
+import argparse
+import time
+
+import numpy as np
+
+import pyopenmv
+from pyopenmv_perf import RateCounter
+from pyopenmv_scripts import PIXFORMATS, capture_script
+
+TRACKING_THRESHOLDS = [(128, 255)]
+
+BLOB_DTYPE = np.dtype([
+    ("x", "<i4"), ("y", "<i4"), ("w", "<i4"), ("h", "<i4"),
+    ("pixels", "<i4"), ("area", "<i4"),
+    ("cx", "<f4"), ("cy", "<f4"), ("density", "<f4"),
+    ("code", "<u4"),   # 1 << threshold index, as blob.code()
+])
+
+_STRUCTURES = {
+    4: np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]], bool),
+    8: np.ones((3, 3), bool),
+}
+
+def to_gray(frame):
+    """(h, w) uint8 view of a read_state() frame; RGB is reduced to Y with
+    imlib's integer weights."""
+    if frame.ndim == 2:
+        return frame
+    rgb = frame.astype(np.uint16)
+    return ((rgb[..., 0] * 38 + rgb[..., 1] * 75 + rgb[..., 2] * 15) >> 7).astype(np.uint8)
+
+def _label_stats(mask, structure, code):
+    from scipy import ndimage
+    labels, n = ndimage.label(mask, structure)
+    if not n:
+        return np.zeros(0, BLOB_DTYPE)
+    w = mask.shape[1]
+    idx = np.flatnonzero(mask)
+    lab = labels.ravel()[idx] - 1
+    ys, xs = np.divmod(idx, w)
+    pixels = np.bincount(lab, minlength=n)
+    x0, y0 = np.full(n, w, np.int64), np.full(n, mask.shape[0], np.int64)
+    x1, y1 = np.zeros(n, np.int64), np.zeros(n, np.int64)
+    np.minimum.at(x0, lab, xs)
+    np.minimum.at(y0, lab, ys)
+    np.maximum.at(x1, lab, xs)
+    np.maximum.at(y1, lab, ys)
+    blobs = np.empty(n, BLOB_DTYPE)
+    blobs["x"], blobs["y"] = x0, y0
+    blobs["w"], blobs["h"] = x1 - x0 + 1, y1 - y0 + 1
+    blobs["pixels"] = pixels
+    blobs["area"] = blobs["w"] * blobs["h"]
+    blobs["cx"] = np.bincount(lab, xs, n) / pixels
+    blobs["cy"] = np.bincount(lab, ys, n) / pixels
+    blobs["density"] = pixels / blobs["area"]
+    blobs["code"] = code
+    return blobs
+
+def find_blobs(frame, thresholds=TRACKING_THRESHOLDS, area_threshold=10, pixels_threshold=10,
+               connectivity=4):
+    """Returns a BLOB_DTYPE array of the blobs in a gray (h, w) or RGB
+    (h, w, 3) uint8 frame. thresholds are inclusive (lo, hi) gray ranges,
+    each labelled on its own."""
+    gray = to_gray(frame)
+    structure = _STRUCTURES[connectivity]
+    found = []
+    for i, (lo, hi) in enumerate(thresholds):
+        lo, hi = min(lo, hi), max(lo, hi)
+        mask = gray >= lo if hi >= 255 else (gray >= lo) & (gray <= hi)
+        found.append(_label_stats(mask, structure, 1 << i))
+    blobs = found[0] if len(found) == 1 else np.concatenate(found)
+    return blobs[(blobs["area"] >= area_threshold) & (blobs["pixels"] >= pixels_threshold)]
+
+def most_dense(blobs):
+    """The blob max(blobs, key=density) would return, or None."""
+    if not len(blobs):
+        return None
+    return blobs[int(np.argmax(blobs["density"]))]
+
+def synthetic_frame(w, h, count=20, seed=0):
+    """Dark noisy frame with `count` bright discs and some hot pixels."""
+    rng = np.random.default_rng(seed)
+    gray = rng.integers(0, 100, (h, w), dtype=np.uint8)
+    yy, xx = np.ogrid[:h, :w]
+    for _ in range(count):
+        cx, cy = rng.integers(w), rng.integers(h)
+        r = rng.integers(2, max(3, min(w, h) // 12))
+        gray[(xx - cx) ** 2 + (yy - cy) ** 2 < r * r] = rng.integers(160, 256)
+    gray[rng.random((h, w)) < 0.002] = 255
+    return gray
+
+def _bench(args):
+    print(f"{'framesize':<10}{'blobs':>7}{'p50 ms':>9}{'p95 ms':>9}{'max FPS':>9}")
+    for name in args.framesizes:
+        w, h = pyopenmv.FRAMESIZES[name]
+        frames = [synthetic_frame(w, h, args.blob_count, seed) for seed in range(8)]
+        find_blobs(frames[0])
+        times = []
+        for i in range(args.frames):
+            t0 = time.perf_counter()
+            blobs = find_blobs(frames[i % len(frames)], args.thresholds,
+                               args.area_threshold, args.pixels_threshold, args.connectivity)
+            times.append(time.perf_counter() - t0)
+        p50, p95 = np.percentile(times, [50, 95]) * 1e3
+        print(f"{name:<10}{len(blobs):>7}{p50:>9.2f}{p95:>9.2f}{1e3 / p50:>9.0f}")
+
+def _track(args):
+    from pyopenmv_bus import BusClosed
+    from pyopenmv_text import MetricParser, TextStream
+    emu = consumer = cam = None
+    if args.bus:
+        from pyopenmv_bus import BusConsumer
+        consumer = BusConsumer(args.bus, "blobs", latest=True)
+        read_state = consumer.read_state
+    else:
+        port = args.port
+        if args.emulate:
+            from pyopenmv_emulator import EmulatedOpenMV
+            emu = EmulatedOpenMV(args.framesize, args.pixformat).start()
+            port = emu.port
+        cam = pyopenmv.OpenMVCamera(port, timeout=2)
+        cam.stop_script()
+        cam.enable_fb(True)
+        if args.script:
+            with open(args.script, 'r') as fin:
+                cam.exec_script(fin.read())
+        else:
+            cam.exec_script(capture_script(args.framesize, args.pixformat))
+        read_state = cam.read_state
+
+    stream = TextStream(cam)
+    metrics = MetricParser()
+    rate = RateCounter()
+    times = []
+    last = time.monotonic()
+    end = None if args.seconds is None else last + args.seconds
+    try:
+        while end is None or time.monotonic() < end:
+            w, h, data, size, text, fmt = read_state()
+            stream.feed(text)
+            for _ in metrics.metrics(stream.lines()):
+                pass
+            if data is None:
+                continue
+            t0 = time.perf_counter()
+            blobs = find_blobs(data, args.thresholds, args.area_threshold,
+                               args.pixels_threshold, args.connectivity)
+            times.append(time.perf_counter() - t0)
+            rate.add()
+            now = time.monotonic()
+            if now - last < args.report:
+                continue
+            last = now
+            best = most_dense(blobs)
+            host = "none" if best is None else (f"cx={best['cx']:.1f} cy={best['cy']:.1f} "
+                                                f"density={best['density']:.2f}")
+            line = (f"{w}x{h} {rate.rate:.1f} FPS, detect {np.median(times) * 1e3:.2f} ms, "
+                    f"{len(blobs)} blobs, host {host}")
+            device = metrics.latest.get("blob")
+            if device is not None:
+                line += f", device cx={device.values['cx']} cy={device.values['cy']}"
+                if best is not None:
+                    line += f" (d={np.hypot(best['cx'] - device.values['cx'], best['cy'] - device.values['cy']):.1f} px)"
+            print(line, flush=True)
+            times.clear()
+    except KeyboardInterrupt:
+        pass
+    except BusClosed as e:
+        print(e)
+    finally:
+        if consumer is not None:
+            consumer.close()
+        if cam is not None:
+            cam.stop_script()
+            cam.disconnect()
+        if emu is not None:
+            emu.stop()
+
+def _threshold(text):
+    lo, hi = text.split(",")
+    return int(lo), int(hi)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find IR blobs on the host")
+    parser.add_argument("--port", default="/dev/ttyACM0", help="OpenMV camera port (default /dev/ttyACM0)")
+    parser.add_argument("--bus", default=None, help="Read frames from a pyopenmv_bus.py daemon instead of the port")
+    parser.add_argument("--emulate", action="store_true", help="Use an emulated camera")
+    parser.add_argument("--script", default=None, help="Run this script instead of the capture script, e.g. an IR tracker, to compare with the device's blobs")
+    parser.add_argument("--framesize", default="VGA", choices=pyopenmv.FRAMESIZES, help="Capture framesize (default VGA)")
+    parser.add_argument("--pixformat", default="GRAYSCALE", choices=PIXFORMATS, help="Capture pixformat (default GRAYSCALE)")
+    parser.add_argument("--thresholds", type=_threshold, nargs="+", default=TRACKING_THRESHOLDS, help="lo,hi gray ranges (default 128,255)")
+    parser.add_argument("--area-threshold", type=int, default=16, help="Smallest bounding box area (default 16)")
+    parser.add_argument("--pixels-threshold", type=int, default=16, help="Smallest pixel count (default 16)")
+    parser.add_argument("--connectivity", type=int, default=4, choices=(4, 8), help="Pixel connectivity (default 4)")
+    parser.add_argument("--report", type=float, default=1.0, help="Print the most dense blob every N seconds (default 1)")
+    parser.add_argument("--seconds", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--bench", action="store_true", help="Time find_blobs on synthetic frames instead of capturing")
+    parser.add_argument("--framesizes", nargs="+", default=["QVGA", "VGA"], choices=pyopenmv.FRAMESIZES, help="Bench framesizes (default QVGA VGA)")
+    parser.add_argument("--frames", type=int, default=200, help="Bench frames per framesize (default 200)")
+    parser.add_argument("--blob-count", type=int, default=20, help="Bench discs per frame (default 20)")
+    args = parser.parse_args()
+
+    if args.bench:
+        _bench(args)
+    else:
+        _track(args)
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# Shared-memory frame bus: one capture daemon, any number of local consumers.
+#
+# FrameBus owns the camera and publishes every decoded (h, w, 3) RGB frame
+# into a ring of `slots` fixed-size slots in a named shared-memory segment,
+# tagged with a sequence number. Consumers attach by name (BusConsumer) and
+# read slots in place, each at its own pace: in order (a consumer that falls a
+# full ring behind loses frames, counted as overruns) or always the newest
+# frame (older ones counted as skipped). A slot's sequence number is cleared
+# only while the daemon converts the received frame into it, so a reader can
+# tell, before and after using a frame, that it was not overwritten
+# underneath it (BusConsumer.valid()). A segment left behind by a daemon that
+# died is removed when the next daemon starts.
+# Consumers keep their position and counters in a table in the segment, from
+# which the daemon reports each consumer's lag and overruns.
+#
+#   python pyopenmv_bus.py serve --port /dev/ttyACM0
+#   python mediapipe_openmv.py --bus openmv
+#   python pyopenmv_fb_updated2.py --bus openmv
+
+import argparse
+import fcntl
+import os
+import tempfile
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import pyopenmv
+import pyopenmv_decode
+from pyopenmv_multi import Frame
+from pyopenmv_perf import RateCounter
+from pyopenmv_scripts import capture_script, PIXFORMATS
+
+MAGIC = b"OMVBUS1\0"
+VERSION = 1
+
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("slots", "<u4"), ("slot_size", "<u8"),
+                         ("consumers", "<u4"), ("pid", "<u4"), ("seq", "<u8"), ("t", "<f8"),
+                         ("pad", "u1", 16)])
+CONSUMER_DTYPE = np.dtype([("pid", "<u4"), ("name", "S20"), ("seq", "<u8"), ("frames", "<u8"),
+                           ("skipped", "<u8"), ("overruns", "<u8"), ("t", "<f8")])
+SLOT_DTYPE = np.dtype([("seq", "<u8"), ("t", "<f8"), ("w", "<u4"), ("h", "<u4"), ("nbytes", "<u4"),
+                       ("fmt", "S8"), ("pad", "u1", 28)])
+
+def _layout(slots, slot_size, consumers):
+    table = HEADER_DTYPE.itemsize
+    ring = table + CONSUMER_DTYPE.itemsize * consumers
+    stride = SLOT_DTYPE.itemsize + slot_size
+    return table, ring, stride, ring + stride * slots
+
+class BusClosed(RuntimeError):
+    # Raised by BusConsumer.read() once the daemon has exited.
+    pass
+
+class _Segment:
+    # numpy views of the header, the consumer table and the slots.
+
+    def __init__(self, shm, slots, slot_size, consumers):
+        self.shm = shm
+        table, ring, stride, size = _layout(slots, slot_size, consumers)
+        buf = shm.buf
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=buf)
+        self.table = np.ndarray((consumers,), CONSUMER_DTYPE, buffer=buf, offset=table)
+        self.slot_headers = [np.ndarray((), SLOT_DTYPE, buffer=buf, offset=ring + i * stride) for i in range(slots)]
+        self.slot_data = [np.ndarray((slot_size,), np.uint8, buffer=buf, offset=ring + i * stride + SLOT_DTYPE.itemsize)
+                          for i in range(slots)]
+        self.slots = slots
+
+    def close(self):
+        del self.header, self.table, self.slot_headers, self.slot_data
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # the caller still holds frames; the mapping goes at exit
+
+def _remove_stale(name):
+    # Unlinks the bus segment `name` if the daemon that created it is gone.
+    shm = shared_memory.SharedMemory(name=name)
+    header = np.ndarray((), HEADER_DTYPE, buffer=shm.buf)
+    magic, pid = header["magic"].item(), int(header["pid"])
+    del header
+    shm.close()
+    error = None
+    if magic != MAGIC.rstrip(b"\0"):
+        error = f"Shared memory {name} exists and is not an OpenMV frame bus"
+    elif pid:
+        try:
+            os.kill(pid, 0)
+            error = f"Frame bus {name} is already served by pid {pid}"
+        except ProcessLookupError:
+            pass
+    if error is not None:
+        # Not ours to remove: keep this process's resource tracker off it too.
+        resource_tracker.unregister(shm._name, "shared_memory")
+        raise FileExistsError(error)
+    shm.unlink()
+    print(f"Removed stale frame bus {name} (daemon pid {pid} is gone)")
+
+class FrameBus:
+    """Daemon side: creates the segment `name` and publishes frames into it."""
+
+    def __init__(self, name="openmv", slots=8, max_size="VGA", consumers=8):
+        w, h = pyopenmv.FRAMESIZES[max_size] if isinstance(max_size, str) else max_size
+        self.name = name
+        self.slot_size = w * h * 3
+        size = _layout(slots, self.slot_size, consumers)[3]
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            _remove_stale(name)
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.seg = _Segment(self._shm, slots, self.slot_size, consumers)
+        self.seg.header[()] = (MAGIC, VERSION, slots, self.slot_size, consumers, os.getpid(), 0, 0.0, 0)
+        self.seg.table[:] = np.zeros(consumers, CONSUMER_DTYPE)
+        self.seq = 0
+        self.rate = RateCounter()
+        self._rates = {}  # consumer pid -> RateCounter of frames read
+
+    def publish(self, read_state):
+        """Reads one native frame from read_state (e.g. OpenMVCamera.read_state,
+        called with native=True) and decodes it into the next slot. Returns
+        the frame's sequence number, or None if the camera had no frame."""
+        w, h, frame, size, text, fmt = read_state(native=True)
+        if frame is None:
+            return None
+        nbytes = w * h * 3
+        if nbytes > self.slot_size:
+            raise ValueError(f"Frame too large for bus slot. Slot: {self.slot_size} frame: {nbytes}")
+        name = pyopenmv_decode.RGB_FMT_NAMES[fmt]
+        if fmt == pyopenmv_decode.FMT_JPEG:
+            # Decompress before taking the slot, so only the copy is unguarded
+            frame, fmt = pyopenmv_decode.to_rgb(frame, fmt, w, h), pyopenmv_decode.FMT_RGB
+        seq = self.seq + 1
+        i = seq % self.seg.slots
+        hdr, data = self.seg.slot_headers[i], self.seg.slot_data[i]
+        hdr["seq"] = 0  # being written
+        pyopenmv_decode.to_rgb(frame, fmt, w, h, data[:nbytes].reshape(h, w, 3))
+        now = time.monotonic()
+        hdr["t"], hdr["w"], hdr["h"], hdr["nbytes"], hdr["fmt"] = now, w, h, nbytes, name.encode()
+        hdr["seq"] = seq
+        self.seg.header["t"] = now
+        self.seg.header["seq"] = seq
+        self.seq = seq
+        self.rate.add(now=now)
+        return seq
+
+    def consumers(self):
+        """One dict per attached consumer: lag is frames published since the
+        consumer's last read. Entries of exited consumers are released."""
+        out = []
+        now = time.monotonic()
+        for i, entry in enumerate(self.seg.table):
+            pid = int(entry["pid"])
+            if not pid:
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                self.seg.table[i]["pid"] = 0
+                self._rates.pop(pid, None)
+                continue
+            rate = self._rates.setdefault(pid, RateCounter())
+            rate.update(int(entry["frames"]), now)
+            out.append({"pid": pid, "name": entry["name"].decode(), "seq": int(entry["seq"]),
+                        "lag": self.seq - int(entry["seq"]), "frames": int(entry["frames"]),
+                        "skipped": int(entry["skipped"]), "overruns": int(entry["overruns"]),
+                        "fps": round(rate.rate, 2)})
+        return out
+
+    def describe(self):
+        lines = [f"{self.name}: seq {self.seq}, {self.rate.rate:.1f} FPS"]
+        for c in self.consumers():
+            lines.append(f"  {c['name'] or c['pid']:<20} {c['fps']:6.1f} FPS  lag {c['lag']:4d}  "
+                         f"skipped {c['skipped']}  overruns {c['overruns']}")
+        return "\n".join(lines)
+
+    def serve(self, read_state, seconds=None, report=5.0, poll=0.001):
+        """Publishes until interrupted (or for `seconds`), printing describe()
+        every `report` seconds."""
+        end = None if seconds is None else time.monotonic() + seconds
+        next_report = time.monotonic() + report
+        try:
+            while end is None or time.monotonic() < end:
+                if self.publish(read_state) is None:
+                    time.sleep(poll)
+                if report and time.monotonic() >= next_report:
+                    print(self.describe(), flush=True)
+                    next_report += report
+        except KeyboardInterrupt:
+            pass
+
+    def close(self):
+        if self._shm is None:
+            return
+        self.seg.header["pid"] = 0  # tells consumers the daemon is gone
+        self.seg.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class BusConsumer:
+    """Consumer side: attaches to the segment `name`.
+
+    read() returns a Frame whose data is an (h, w, 3) view into the slot, valid
+    until the daemon laps the ring; check valid(frame) after using it if that
+    matters. With latest=True every read returns the newest frame, otherwise
+    frames are returned in order.
+    """
+
+    def __init__(self, name="openmv", label="", latest=False, poll=0.001):
+        self._shm = shared_memory.SharedMemory(name=name)
+        # The segment belongs to the daemon: don't let this process's resource
+        # tracker unlink it when we exit.
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+        header = np.ndarray((), HEADER_DTYPE, buffer=self._shm.buf)
+        if header["magic"] != MAGIC.rstrip(b"\0") or header["version"] != VERSION:
+            raise ValueError(f"{name} is not an OpenMV frame bus")
+        slots, slot_size, consumers = int(header["slots"]), int(header["slot_size"]), int(header["consumers"])
+        del header
+        self.seg = _Segment(self._shm, slots, slot_size, consumers)
+        self.latest = latest
+        self.poll = poll
+        self.seq = int(self.seg.header["seq"])  # start at the current frame
+        self._entry = None
+        with open(os.path.join(tempfile.gettempdir(), f"{name}.bus.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            for i, entry in enumerate(self.seg.table):
+                if not entry["pid"]:
+                    self.seg.table[i] = (os.getpid(), label.encode()[:20], self.seq, 0, 0, 0, time.monotonic())
+                    self._entry = i
+                    break
+        if self._entry is None:
+            self.close()
+            raise RuntimeError(f"No free consumer entry on {name} ({consumers} in use)")
+
+    @property
+    def entry(self):
+        return self.seg.table[self._entry]
+
+    def read(self, timeout=1.0):
+        """Returns the next (or newest) Frame, or None if nothing new was
+        published within timeout. Raises if the daemon has exited."""
+        end = time.monotonic() + timeout
+        header = self.seg.header
+        slots = self.seg.slots
+        while True:
+            if not header["pid"]:
+                raise BusClosed("Frame bus daemon has exited")
+            head = int(header["seq"])
+            if head > self.seq:
+                if self.latest:
+                    want = head
+                    skipped, lost = head - self.seq - 1, 0
+                else:
+                    want = self.seq + 1
+                    if want < head - slots + 2:
+                        # Overrun (the oldest slot may also be mid-rewrite):
+                        # resync half a ring back so there is room to catch up
+                        want = head - slots // 2 + 1
+                    skipped, lost = 0, want - self.seq - 1
+                i = want % slots
+                hdr = self.seg.slot_headers[i]
+                if int(hdr["seq"]) == want:
+                    w, h, nbytes = int(hdr["w"]), int(hdr["h"]), int(hdr["nbytes"])
+                    frame = Frame(want, float(hdr["t"]), w, h, self.seg.slot_data[i][:nbytes].reshape(h, w, 3),
+                                  nbytes, "", hdr["fmt"].item().decode())
+                    entry = self.entry
+                    entry["seq"] = want
+                    entry["frames"] += 1
+                    entry["skipped"] += skipped
+                    entry["overruns"] += lost
+                    entry["t"] = time.monotonic()
+                    self.seq = want
+                    return frame
+                # Overwritten between reading the head and the slot: look again
+                continue
+            if time.monotonic() >= end:
+                return None
+            time.sleep(self.poll)
+
+    def valid(self, frame):
+        """True if the frame's slot has not been rewritten since read()."""
+        return int(self.seg.slot_headers[frame.seq % self.seg.slots]["seq"]) == frame.seq
+
+    def read_state(self, out=None, timeout=0.1):
+        """read() in read_state()'s (w, h, data, size, text, fmt) form, for the
+        viewers. data views the slot; `out` is ignored."""
+        f = self.read(timeout)
+        if f is None:
+            return 0, 0, None, 0, "", ""
+        return f.w, f.h, f.data, f.size, f.text, f.fmt
+
+    def close(self):
+        if self._shm is None:
+            return
+        if self._entry is not None:
+            self.entry["pid"] = 0
+        self.seg.close()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _serve(args):
+    emu = None
+    port = args.port
+    if args.emulate:
+        from pyopenmv_emulator import EmulatedOpenMV
+        emu = EmulatedOpenMV(args.framesize, args.pixformat, fps=args.fps).start()
+        port = emu.port
+    cam = pyopenmv.OpenMVCamera(port, timeout=2)
+    try:
+        cam.stop_script()
+        cam.enable_fb(True)
+        cam.exec_script(capture_script(args.framesize, args.pixformat))
+        with FrameBus(args.name, args.slots, args.framesize, args.consumers) as bus:
+            print(f"Publishing {port} on {args.name} ({args.slots} slots)", flush=True)
+            bus.serve(cam.read_state, args.seconds, args.report)
+            print(bus.describe())
+    finally:
+        cam.stop_script()
+        cam.disconnect()
+        if emu is not None:
+            emu.stop()
+
+def _watch(args):
+    with BusConsumer(args.name, args.label, latest=args.latest) as consumer:
+        rate = RateCounter()
+        end = None if args.seconds is None else time.monotonic() + args.seconds
+        torn = 0
+        try:
+            while end is None or time.monotonic() < end:
+                frame = consumer.read()
+                if frame is None:
+                    continue
+                time.sleep(args.work)  # stand-in for the consumer's own processing
+                torn += not consumer.valid(frame)
+                rate.add()
+        except KeyboardInterrupt:
+            pass
+        except BusClosed as e:
+            print(e)
+        e = consumer.entry
+        print(f"{args.label or os.getpid()}: {int(e['frames'])} frames, {rate.rate:.1f} FPS, "
+              f"{int(e['skipped'])} skipped, {int(e['overruns'])} overruns, {torn} overwritten while in use")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Share one OpenMV stream between local processes")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("serve", help="Own the camera and publish its frames")
+    p.add_argument("--port", default="/dev/ttyACM0", help="OpenMV camera port (default /dev/ttyACM0)")
+    p.add_argument("--emulate", action="store_true", help="Publish an emulated camera")
+    p.add_argument("--fps", type=float, default=30.0, help="Emulated camera frame rate (default 30)")
+    p.add_argument("--framesize", default="QVGA", choices=pyopenmv.FRAMESIZES, help="Capture framesize, also the slot size (default QVGA)")
+    p.add_argument("--pixformat", default="GRAYSCALE", choices=PIXFORMATS, help="Capture pixformat (default GRAYSCALE)")
+    p.add_argument("--name", default="openmv", help="Shared memory name (default openmv)")
+    p.add_argument("--slots", type=int, default=8, help="Ring slots (default 8)")
+    p.add_argument("--consumers", type=int, default=8, help="Most consumers at once (default 8)")
+    p.add_argument("--report", type=float, default=5.0, help="Print consumer lag/overruns every N seconds (default 5)")
+    p.add_argument("--seconds", type=float, default=None, help="Stop after this many seconds")
+    p.set_defaults(func=_serve)
+    p = sub.add_parser("watch", help="Attach as a consumer and print its counters")
+    p.add_argument("--name", default="openmv", help="Shared memory name (default openmv)")
+    p.add_argument("--label", default="", help="Name shown in the daemon's report")
+    p.add_argument("--latest", action="store_true", help="Always take the newest frame")
+    p.add_argument("--work", type=float, default=0.0, help="Seconds of simulated work per frame")
+    p.add_argument("--seconds", type=float, default=None, help="Stop after this many seconds")
+    p.set_defaults(func=_watch)
+    args = parser.parse_args()
+    args.func(args)
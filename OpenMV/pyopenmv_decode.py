@@ -0,0 +1,151 @@
+# Framebuffer decoders for pyopenmv.
+#
+# All decoders take the raw bytes received from FRAME_DUMP and write an
+# (h, w, 3) uint8 RGB frame into `out`. If `out` is missing or has the wrong
+# shape a new array is allocated, so callers can stream allocation-free by
+# passing back the array returned for the previous frame.
+
+import threading
+
+import numpy as np
+from PIL import Image
+
+_RGB565_LUT = None
+_scratch = threading.local()
+
+def rgb565_lut():
+    # 65536 x 3 table mapping every RGB565 pixel to 8-bit RGB. Uses the same
+    # truncating x*255/31 (x*255/63 for green) scaling as the original decoder.
+    global _RGB565_LUT
+    if _RGB565_LUT is None:
+        v = np.arange(65536, dtype=np.uint32)
+        lut = np.empty((65536, 3), dtype=np.uint8)
+        lut[:, 0] = (((v & 0xF800) >> 11) * 255) // 31
+        lut[:, 1] = (((v & 0x07E0) >> 5) * 255) // 63
+        lut[:, 2] = ((v & 0x001F) * 255) // 31
+        _RGB565_LUT = lut
+    return _RGB565_LUT
+
+def _lut_index(arr):
+    # np.take converts uint16 indices to intp internally, allocating 8 bytes per
+    # pixel every call. Converting into a per-thread scratch buffer instead
+    # keeps table lookups allocation-free.
+    idx = getattr(_scratch, "idx", None)
+    if idx is None or len(idx) < arr.size:
+        idx = _scratch.idx = np.empty(arr.size, dtype=np.intp)
+    idx = idx[:arr.size]
+    np.copyto(idx, arr.reshape(-1))
+    return idx
+
+def ensure_buffer(out, h, w, channels=3, dtype=np.uint8):
+    shape = (h, w, channels) if channels > 1 else (h, w)
+    if out is None or out.shape != shape or out.dtype != dtype or not out.flags.c_contiguous:
+        out = np.empty(shape, dtype=dtype)
+    return out
+
+def decode_gray(buf, w, h, out=None):
+    out = ensure_buffer(out, h, w)
+    y = np.frombuffer(buf, dtype=np.uint8, count=w * h).reshape((h, w))
+    # Per-channel copies are ~4x faster than a broadcast into the last axis.
+    out[..., 0] = y
+    out[..., 1] = y
+    out[..., 2] = y
+    return out
+
+def decode_rgb565(buf, w, h, out=None):
+    out = ensure_buffer(out, h, w)
+    arr = np.frombuffer(buf, dtype=np.uint16, count=w * h)
+    np.take(rgb565_lut(), _lut_index(arr), axis=0, out=out.reshape((w * h, 3)), mode="clip")
+    return out
+
+def decode_jpeg(buf, w, h, out=None):
+    img = Image.frombuffer("RGB", (w, h), bytes(buf), "jpeg", "RGB", "")
+    if img.size != (w, h):
+        raise ValueError(f"Unexpected JPEG size. Expected: {(w, h)} received: {img.size}")
+    out = ensure_buffer(out, h, w)
+    out[...] = np.asarray(img)
+    return out
+
+def decode(buf, w, h, bpp, out=None):
+    """Decodes a frame given its FRAME_SIZE/GET_STATE bytes-per-pixel field
+    (1 = grayscale, 2 = RGB565, anything larger is a JPEG byte count)."""
+    if len(buf) < (bpp if bpp > 2 else w * h * bpp):
+        raise ValueError(f"Short frame. Expected: {bpp if bpp > 2 else w * h * bpp} received: {len(buf)}")
+    if bpp == 1:
+        return decode_gray(buf, w, h, out)
+    elif bpp == 2:
+        return decode_rgb565(buf, w, h, out)
+    else:
+        return decode_jpeg(buf, w, h, out)
+
+# Native layouts: the frame exactly as the sensor produced it, without any
+# colour expansion. Grayscale is (h, w) uint8, RGB565 is (h, w) uint16 and
+# JPEG is the compressed bytes. The arrays are views over `buf`. FMT_RGB is a
+# frame that has already been expanded (or drawn on) by the host, (h, w, 3)
+# uint8; cameras never produce it, but recordings can hold it. The names
+# differ from read_state()'s expanded ones below, so an expanded frame can't
+# be passed to to_rgb()/to_gray() as a native one by mistake.
+FMT_GRAY   = "GRAY8"
+FMT_RGB565 = "RGB565"
+FMT_JPEG   = "JPEG_RAW"
+FMT_RGB    = "RGB"
+
+# Format name read_state() reports once a native frame has been expanded to RGB.
+RGB_FMT_NAMES = {FMT_GRAY: "GRAY", FMT_RGB565: "RGB", FMT_JPEG: "JPEG", FMT_RGB: "RGB"}
+
+_GRAY565_LUT = None
+
+def gray565_lut():
+    # RGB565 -> 8-bit luma (BT.601 integer weights) over the expanded RGB values.
+    global _GRAY565_LUT
+    if _GRAY565_LUT is None:
+        rgb = rgb565_lut().astype(np.uint32)
+        _GRAY565_LUT = ((rgb[:, 0] * 77 + rgb[:, 1] * 150 + rgb[:, 2] * 29) >> 8).astype(np.uint8)
+    return _GRAY565_LUT
+
+def decode_native(buf, w, h, bpp):
+    """Returns (frame, fmt) without converting the pixel format."""
+    if bpp == 1:
+        return np.frombuffer(buf, dtype=np.uint8, count=w * h).reshape((h, w)), FMT_GRAY
+    elif bpp == 2:
+        return np.frombuffer(buf, dtype=np.uint16, count=w * h).reshape((h, w)), FMT_RGB565
+    else:
+        return bytes(buf), FMT_JPEG
+
+def to_rgb(frame, fmt, w, h, out=None):
+    """Expands a native frame to (h, w, 3) uint8 RGB."""
+    if fmt == FMT_GRAY:
+        return decode_gray(frame, w, h, out)
+    elif fmt == FMT_RGB565:
+        return decode_rgb565(frame, w, h, out)
+    elif fmt == FMT_JPEG:
+        return decode_jpeg(frame, w, h, out)
+    elif fmt == FMT_RGB:
+        if out is None:
+            return frame
+        out = ensure_buffer(out, h, w)
+        out[...] = frame
+        return out
+    raise ValueError(f"Unknown frame format {fmt}")
+
+def to_gray(frame, fmt, w, h, out=None):
+    """Reduces a native frame to (h, w) uint8 luminance. Grayscale frames are
+    returned as-is unless `out` is given."""
+    if fmt == FMT_GRAY:
+        if out is None:
+            return frame
+        out = ensure_buffer(out, h, w, 1)
+        out[...] = frame
+        return out
+    out = ensure_buffer(out, h, w, 1)
+    if fmt == FMT_RGB565:
+        arr = np.frombuffer(frame, dtype=np.uint16, count=w * h)
+        np.take(gray565_lut(), _lut_index(arr), out=out.reshape(w * h), mode="clip")
+    elif fmt == FMT_JPEG:
+        img = Image.frombuffer("RGB", (w, h), bytes(frame), "jpeg", "RGB", "").convert("L")
+        out[...] = np.asarray(img)
+    elif fmt == FMT_RGB:
+        out[...] = np.asarray(Image.fromarray(np.ascontiguousarray(frame)).convert("L"))
+    else:
+        raise ValueError(f"Unknown frame format {fmt}")
+    return out
@@ -0,0 +1,101 @@
+# Frame display for the pygame viewers.
+#
+# FrameScaler draws RGB frames into the window without allocating per frame:
+#   nearest  integer nearest-neighbour upscale (pygame.transform.scale) straight
+#            into the display surface
+#   smooth   bilinear smoothscale into the display surface (the old look)
+#   hw       no CPU scaling: the window is created at frame size with
+#            pygame.SCALED and SDL scales it on the GPU
+# Surfaces are only (re)created when the frame size changes or the window is
+# resized. show() can redraw just some rects of the frame (e.g. the changed
+# tiles from pyopenmv_motion); `dirty` then lists the window rects to pass to
+# pygame.display.update() instead of flipping the whole window.
+
+import pygame
+
+MODES = ("nearest", "smooth", "hw")
+
+class FrameScaler:
+
+    def __init__(self, scale=4, mode="nearest", resizable=False):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.scale = scale
+        self.mode = mode
+        self.resizable = resizable
+        self.screen = None
+        self._frame_size = None
+        self._small = None  # frame converted to the screen's pixel format
+        self.dirty = None   # window rects drawn by the last show(); None: all of it
+
+    def _flags(self):
+        flags = pygame.DOUBLEBUF
+        if self.mode == "hw":
+            flags |= pygame.SCALED
+        if self.resizable:
+            flags |= pygame.RESIZABLE
+        return flags
+
+    def _setup(self, w, h, size=None):
+        if self.mode == "hw":
+            size = (w, h)
+        elif size is None:
+            size = (w * self.scale, h * self.scale)
+        try:
+            self.screen = pygame.display.set_mode(size, self._flags(), 32)
+        except pygame.error:
+            if self.mode != "hw":
+                raise
+            # No GPU renderer (e.g. a dummy or remote display): scale on the CPU.
+            self.mode = "nearest"
+            return self._setup(w, h)
+        self._frame_size = (w, h)
+        self._small = pygame.Surface((w, h), 0, self.screen)
+
+    def resize(self, size):
+        """Call on pygame.VIDEORESIZE; the frame is stretched to the new size."""
+        if self._frame_size is not None and self.mode != "hw":
+            self._setup(*self._frame_size, size)
+
+    def show(self, data, w, h, rects=None):
+        """Draws an (h, w, 3) uint8 RGB frame and returns the display surface.
+        With rects ((x, y, w, h) in frame pixels) only those parts are redrawn."""
+        if self._frame_size != (w, h):
+            self._setup(w, h)
+            rects = None  # new surfaces: draw everything
+        src = pygame.image.frombuffer(data.flat[0:], (w, h), 'RGB')
+        if rects is not None:
+            return self._show_rects(src, w, h, rects)
+        self.dirty = None
+        if self.mode == "hw" or self.screen.get_size() == (w, h):
+            self.screen.blit(src, (0, 0))
+            return self.screen
+        # Convert at frame size, then scale into the display surface itself.
+        self._small.blit(src, (0, 0))
+        if self.mode == "nearest":
+            pygame.transform.scale(self._small, self.screen.get_size(), self.screen)
+        else:
+            pygame.transform.smoothscale(self._small, self.screen.get_size(), self.screen)
+        return self.screen
+
+    def _show_rects(self, src, w, h, rects):
+        sw, sh = self.screen.get_size()
+        direct = self.mode == "hw" or (sw, sh) == (w, h)
+        self.dirty = []
+        for x, y, rw, rh in rects:
+            if direct:
+                self.screen.blit(src, (x, y), (x, y, rw, rh))
+                self.dirty.append(pygame.Rect(x, y, rw, rh))
+                continue
+            self._small.blit(src, (x, y), (x, y, rw, rh))
+            # Same pixel edges as scaling the whole frame
+            x0, x1 = x * sw // w, (x + rw) * sw // w
+            y0, y1 = y * sh // h, (y + rh) * sh // h
+            dst = pygame.Rect(x0, y0, x1 - x0, y1 - y0)
+            part = self._small.subsurface((x, y, rw, rh))
+            if self.mode == "nearest":
+                pygame.transform.scale(part, dst.size, self.screen.subsurface(dst))
+            else:
+                pygame.transform.smoothscale(part, dst.size, self.screen.subsurface(dst))
+            self.dirty.append(dst)
+        return self.screen
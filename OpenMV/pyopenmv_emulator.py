@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# Hardware-free stand-in for an OpenMV cam.
+#
+# EmulatedOpenMV opens a pseudo terminal and answers the USB debug commands
+# used by pyopenmv on it, so pyopenmv.OpenMVCamera(emu.port) behaves like a
+# camera plugged in over USB. Scripts are not executed: the emulator only picks
+# the pixformat, framesize and JPEG quality out of the uploaded script and then
+# serves synthetic frames at `fps`, optionally throttled to `link_bps`. The
+# bootloader commands are emulated as well: erased sectors and written bytes
+# are kept in `erased` and `flash` for checking a flashing run. With
+# bootloader=False the cam starts in its firmware and only answers the
+# bootloader after a reset_to_bl().
+
+import argparse
+import io
+import os
+import re
+import select
+import struct
+import threading
+import time
+import tty
+
+import numpy as np
+from PIL import Image
+
+import pyopenmv
+from pyopenmv import (_USBDBG_CMD, _USBDBG_FW_VERSION, _USBDBG_FRAME_SIZE, _USBDBG_FRAME_DUMP,
+                      _USBDBG_ARCH_STR, _USBDBG_SCRIPT_EXEC, _USBDBG_SCRIPT_STOP,
+                      _USBDBG_SCRIPT_SAVE, _USBDBG_SCRIPT_RUNNING, _USBDBG_TEMPLATE_SAVE,
+                      _USBDBG_DESCRIPTOR_SAVE, _USBDBG_ATTR_READ, _USBDBG_ATTR_WRITE,
+                      _USBDBG_SYS_RESET, _USBDBG_SYS_RESET_TO_BL, _USBDBG_FB_ENABLE,
+                      _USBDBG_TX_BUF_LEN, _USBDBG_TX_BUF, _USBDBG_GET_STATE,
+                      _USBDBG_STATE_FLAGS_SCRIPT, _USBDBG_STATE_FLAGS_TEXT, _USBDBG_STATE_FLAGS_FRAME,
+                      _BOOTLDR_START, _BOOTLDR_RESET, _BOOTLDR_ERASE, _BOOTLDR_WRITE, FLASH_WRITE_SIZE)
+
+FW_VERSION = (4, 5, 0)
+ARCH = b"OMV4 H7 PLUS [EMULATED]"
+PATTERN_FRAMES = 8
+TX_BUF_MAX = 4096
+
+# Commands whose header length field is followed by that many payload bytes.
+_PAYLOAD_CMDS = (_USBDBG_SCRIPT_EXEC, _USBDBG_SCRIPT_SAVE, _USBDBG_TEMPLATE_SAVE,
+                 _USBDBG_DESCRIPTOR_SAVE, _USBDBG_ATTR_WRITE, _USBDBG_FB_ENABLE)
+
+def synthetic_frames(w, h, pixformat, quality=90, count=PATTERN_FRAMES):
+    """Moving gradient test pattern, returned as the raw bytes the camera would
+    send for each frame."""
+    x = np.arange(w, dtype=np.uint16)[None, :]
+    y = np.arange(h, dtype=np.uint16)[:, None]
+    frames = []
+    for i in range(count):
+        shift = i * max(1, w // count)
+        r = ((x + shift) * 255 // max(1, w - 1)).astype(np.uint8) + np.zeros((h, 1), np.uint8)
+        g = (y * 255 // max(1, h - 1)).astype(np.uint8) + np.zeros((1, w), np.uint8)
+        b = ((r.astype(np.uint16) + g) // 2).astype(np.uint8)
+        gray = ((r.astype(np.uint16) * 77 + g.astype(np.uint16) * 150 + b.astype(np.uint16) * 29) >> 8).astype(np.uint8)
+        if pixformat == "GRAYSCALE":
+            frames.append(gray.tobytes())
+        elif pixformat == "RGB565":
+            rgb565 = ((r.astype(np.uint16) >> 3) << 11) | ((g.astype(np.uint16) >> 2) << 5) | (b.astype(np.uint16) >> 3)
+            frames.append(rgb565.astype(np.uint16).tobytes())
+        else:
+            out = io.BytesIO()
+            Image.fromarray(gray).save(out, "JPEG", quality=quality)
+            frames.append(out.getvalue())
+    return frames
+
+class EmulatedOpenMV:
+
+    def __init__(self, framesize="QVGA", pixformat="GRAYSCALE", quality=90, fps=20.0, link_bps=None,
+                 erase_s=0.0, bootloader=True):
+        self.fps = fps
+        self.link_bps = link_bps
+        self.framesize = framesize
+        self.pixformat = pixformat
+        self.quality = quality
+        self.script_running = False
+        self.fb_enabled = True
+        self.attrs = {}
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        # Bootloader state: erased sector numbers and the bytes written since
+        # the last START, in order.
+        self.erase_s = erase_s
+        self.bootloader = bootloader    # False: running firmware, START is ignored
+        self.in_bootloader = False
+        self.erased = set()
+        self.flash = bytearray()
+        self.resets = 0
+        self._frames = []
+        self._latched = None
+        self._tx = bytearray()
+        self._t0 = time.monotonic()
+        self._last_dumped = -1
+        self._last_printed = -1
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = False
+        self._thread = None
+        self._configure(framesize, pixformat, quality)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="openmv-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _configure(self, framesize, pixformat, quality):
+        self.framesize, self.pixformat, self.quality = framesize, pixformat, quality
+        self.w, self.h = pyopenmv.FRAMESIZES[framesize]
+        self._frames = synthetic_frames(self.w, self.h, pixformat, quality)
+
+    def _load_script(self, script):
+        # Pick the sensor setup out of the script text.
+        fmt = re.search(r"set_pixformat\(\s*sensor\.(\w+)", script)
+        size = re.search(r"set_framesize\(\s*sensor\.(\w+)", script)
+        quality = re.search(r"compress\(\s*quality\s*=\s*(\d+)", script)
+        pixformat = fmt.group(1) if fmt else self.pixformat
+        if quality:
+            pixformat = "JPEG"
+        framesize = size.group(1) if size and size.group(1) in pyopenmv.FRAMESIZES else self.framesize
+        self._configure(framesize, pixformat, int(quality.group(1)) if quality else self.quality)
+        self._t0 = time.monotonic()
+        self._last_dumped = -1
+        self._last_printed = -1
+        self.script_running = True
+
+    def _frame_index(self):
+        return int((time.monotonic() - self._t0) * self.fps)
+
+    def _current_frame(self):
+        return self._frames[self._frame_index() % len(self._frames)]
+
+    def _bpp(self, frame):
+        if self.pixformat == "GRAYSCALE":
+            return 1
+        elif self.pixformat == "RGB565":
+            return 2
+        return len(frame)
+
+    def _print_fps(self):
+        # What the test script's print(clock.fps(), " FPS") would produce.
+        idx = self._frame_index()
+        if self.script_running and idx > self._last_printed:
+            self._tx += b"%.5f  FPS\n" % self.fps * (idx - max(self._last_printed, idx - 4))
+            self._last_printed = idx
+            del self._tx[:max(0, len(self._tx) - TX_BUF_MAX)]
+
+    def _read(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            if not self._running:
+                raise EOFError
+            r, _, _ = select.select([self._master], [], [], 0.05)
+            if r:
+                try:
+                    data = os.read(self._master, n - len(buf))
+                except OSError:
+                    raise EOFError
+                if not data:
+                    raise EOFError
+                buf += data
+        return bytes(buf)
+
+    def _write(self, data):
+        view = memoryview(data)
+        start = time.monotonic()
+        sent = 0
+        while sent < len(view):
+            chunk = view[sent:sent + 4096]
+            while chunk:
+                n = os.write(self._master, chunk)
+                chunk = chunk[n:]
+                sent += n
+            if self.link_bps:
+                delay = start + sent / self.link_bps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        self.bytes_sent += len(data)
+
+    def _run(self):
+        try:
+            while self._running:
+                hdr = self._read(1)
+                if hdr[0] == _USBDBG_CMD:
+                    cmd, length = struct.unpack("<BI", self._read(5))
+                    self._usbdbg(cmd, length)
+                else:
+                    self._bootloader(struct.unpack("<I", hdr + self._read(3))[0])
+        except EOFError:
+            pass
+
+    def _bootloader(self, cmd):
+        if cmd == _BOOTLDR_START:
+            if not self.bootloader:
+                return
+            self.in_bootloader = True
+            self.erased.clear()
+            self.flash.clear()
+            self.script_running = False
+            self._write(struct.pack("<I", _BOOTLDR_START))
+        elif cmd == _BOOTLDR_ERASE:
+            sector = struct.unpack("<I", self._read(4))[0]
+            if self.in_bootloader:
+                time.sleep(self.erase_s)
+                self.erased.add(sector)
+        elif cmd == _BOOTLDR_WRITE:
+            data = self._read(FLASH_WRITE_SIZE)
+            if self.in_bootloader:
+                self.flash += data
+        elif cmd == _BOOTLDR_RESET:
+            self.bootloader = self.in_bootloader = False
+            self.resets += 1
+        else:
+            raise EOFError  # out of sync, nothing sensible to do
+
+    def _usbdbg(self, cmd, length):
+        payload = self._read(length) if cmd in _PAYLOAD_CMDS else b""
+        self._print_fps()
+
+        if cmd == _USBDBG_FW_VERSION:
+            self._write(struct.pack("<III", *FW_VERSION))
+        elif cmd == _USBDBG_ARCH_STR:
+            self._write(ARCH.ljust(64, b"\0"))
+        elif cmd == _USBDBG_SCRIPT_EXEC:
+            self._load_script(payload.decode(errors="replace"))
+        elif cmd == _USBDBG_SCRIPT_STOP:
+            self.script_running = False
+        elif cmd == _USBDBG_SCRIPT_RUNNING:
+            self._write(struct.pack("<I", int(self.script_running)))
+        elif cmd == _USBDBG_FB_ENABLE:
+            self.fb_enabled = bool(struct.unpack("<I", payload)[0])
+        elif cmd == _USBDBG_ATTR_WRITE:
+            attr, value = struct.unpack("<II", payload)
+            self.attrs[attr] = value
+        elif cmd == _USBDBG_ATTR_READ:
+            attr = struct.unpack("<h", self._read(2))[0]
+            self._write(bytes([self.attrs.get(attr, 0) & 0xFF]))
+        elif cmd == _USBDBG_TX_BUF_LEN:
+            self._write(struct.pack("<I", len(self._tx)))
+        elif cmd == _USBDBG_TX_BUF:
+            out = bytes(self._tx[:length]).ljust(length, b"\0")
+            del self._tx[:length]
+            self._write(out)
+        elif cmd == _USBDBG_FRAME_SIZE:
+            if self.script_running and self.fb_enabled:
+                self._latched = self._current_frame()
+                self._write(struct.pack("<III", self.w, self.h, self._bpp(self._latched)))
+            else:
+                self._write(struct.pack("<III", 0, 0, 0))
+        elif cmd == _USBDBG_GET_STATE:
+            flags = 0
+            w = h = size = 0
+            if self.script_running:
+                flags |= _USBDBG_STATE_FLAGS_SCRIPT
+                if self.fb_enabled and self._frame_index() > self._last_dumped:
+                    flags |= _USBDBG_STATE_FLAGS_FRAME
+                    # The header describes this frame, FRAME_DUMP must send the same one.
+                    self._latched = self._current_frame()
+                    w, h, size = self.w, self.h, self._bpp(self._latched)
+            text = bytes(self._tx[:47])
+            if text:
+                flags |= _USBDBG_STATE_FLAGS_TEXT
+                del self._tx[:47]
+            self._write(struct.pack("<IIII48s", flags, w, h, size, text))
+        elif cmd == _USBDBG_FRAME_DUMP:
+            frame = self._latched if self._latched is not None else self._current_frame()
+            self._latched = None
+            self._last_dumped = self._frame_index()
+            self._write(frame if len(frame) == length else frame[:length].ljust(length, b"\0"))
+            self.frames_sent += 1
+        elif cmd in (_USBDBG_SYS_RESET, _USBDBG_SYS_RESET_TO_BL):
+            self.script_running = False
+            self.bootloader = cmd == _USBDBG_SYS_RESET_TO_BL
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulated OpenMV cam on a pseudo terminal")
+    parser.add_argument("--framesize", default="QVGA", choices=pyopenmv.FRAMESIZES, help="Initial framesize (default QVGA)")
+    parser.add_argument("--pixformat", default="GRAYSCALE", choices=("GRAYSCALE", "RGB565", "JPEG"), help="Initial pixformat")
+    parser.add_argument("--fps", type=float, default=20.0, help="Sensor frame rate (default 20)")
+    parser.add_argument("--link-bps", type=float, default=None, help="Throttle the link to this many bytes/s")
+    parser.add_argument("--erase-s", type=float, default=0.0, help="Emulated bootloader sector erase time (default 0)")
+    args = parser.parse_args()
+
+    with EmulatedOpenMV(args.framesize, args.pixformat, fps=args.fps, link_bps=args.link_bps, erase_s=args.erase_s) as emu:
+        print(f"Emulated OpenMV on {emu.port} (Ctrl-C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
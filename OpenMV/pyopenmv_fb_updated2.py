@@ -9,9 +9,24 @@
 # An example script using pyopenmv to grab the framebuffer.
 
 import sys
+import csv
+import json
+import statistics
 import numpy as np
 import pygame
 import pyopenmv
+import pyopenmv_decode
+from pyopenmv_prefetch import FramePrefetcher
+from pyopenmv_jpeg import JpegDecoder, PipelinedReader
+from pyopenmv_text import TextStream, MetricParser
+from pyopenmv_sched import AdaptivePoller
+from pyopenmv_autotune import TransportTuner
+from pyopenmv_perf import PerfLog, RateCounter, script_hash, framesize_name, append_fps_log, FPS_LOG
+from pyopenmv_display import FrameScaler, MODES as SCALE_MODES
+from pyopenmv_scripts import capture_script, PIXFORMATS
+from pyopenmv_bus import BusClosed, BusConsumer
+from pyopenmv_record import RecordingSink, MODES as RECORD_MODES, POLICIES as RECORD_POLICIES
+from bench_decode import logged_framesizes
 import argparse
 import time
 
@@ -29,8 +44,7 @@ while(True):
     print(clock.fps(), " FPS")
 """
 
-def pygame_test(port, poll_rate, scale):
-    pygame.init()
+def connect(port):
     pyopenmv.disconnect()
 
     connected = False
@@ -47,62 +61,329 @@ def pygame_test(port, poll_rate, scale):
         sys.exit(1)
 
     pyopenmv.set_timeout(1*2)
+
+def capture_run(framesize, pixformat, poll_rate, warmup, duration, frames=None, perf=None, stall=5.0):
+    """Uploads the capture script, discards `warmup` seconds of frames, then
+    captures for `duration` seconds (or `frames` frames). Returns (frames, bytes, seconds)."""
     pyopenmv.stop_script()
     pyopenmv.enable_fb(True)
-    pyopenmv.exec_script(test_script)
+    pyopenmv.exec_script(capture_script(framesize, pixformat, skip_ms=0))
+    cam = pyopenmv.default_camera()
+
+    count = nbytes = 0
+    fb = None
+    start = None
+    last = time.monotonic()
+    end = last + warmup
+    while True:
+        now = time.monotonic()
+        if start is None and now >= end:
+            # Warm-up over: start counting
+            cam.perf = perf
+            start = now
+            end = now + duration
+        if start is not None and (count >= frames if frames else now >= end):
+            break
+        w, h, data, size, text, fmt = pyopenmv.read_state(out=fb)
+        if data is None:
+            if now - last > stall:
+                raise RuntimeError(f"{framesize} {pixformat}: no frame for {stall:.0f} s")
+            time.sleep(poll_rate / 1000)
+            continue
+        fb = data
+        last = now
+        if start is not None:
+            count += 1
+            nbytes += size
+    cam.perf = None
+    return count, nbytes, time.monotonic() - start
+
+def headless_sweep(port, framesizes, pixformats, poll_rate=1, repeats=3, warmup=2.0, duration=5.0,
+                   frames=None, output="sweep.csv", fps_log=FPS_LOG):
+    """Runs every framesize x pixformat `repeats` times without a window and
+    writes one row per configuration (CSV, or JSON lines for .jsonl)."""
+    connect(port)
+    columns = ["framesize", "pixformat", "repeats", "frames", "fps_mean", "fps_std", "fps_min", "fps_max",
+               "mbps_mean", "mbps_std", "bytes_per_frame"]
+    spans = ("get_state", "transfer", "decode")
+    columns += [f"{s}_{p}" for s in spans for p in ("p50", "p95", "p99")]
+
+    rows = []
+    print(f"{'framesize':<10}{'pixformat':<11}{'FPS':>9}{'+/-':>7}{'MB/s':>9}{'xfer p50':>10}")
+    try:
+        for framesize in framesizes:
+            for pixformat in pixformats:
+                perf = PerfLog(spans=spans)
+                fps, mbps = [], []
+                total_frames = total_bytes = 0
+                for i in range(repeats):
+                    n, nbytes, seconds = capture_run(framesize, pixformat, poll_rate, warmup, duration, frames, perf)
+                    fps.append(n / seconds)
+                    mbps.append(nbytes / seconds / 1024**2)
+                    total_frames += n
+                    total_bytes += nbytes
+                row = {
+                    "framesize": framesize,
+                    "pixformat": pixformat,
+                    "repeats": repeats,
+                    "frames": total_frames,
+                    "fps_mean": round(statistics.mean(fps), 2),
+                    "fps_std": round(statistics.stdev(fps), 3) if repeats > 1 else 0.0,
+                    "fps_min": round(min(fps), 2),
+                    "fps_max": round(max(fps), 2),
+                    "mbps_mean": round(statistics.mean(mbps), 3),
+                    "mbps_std": round(statistics.stdev(mbps), 4) if repeats > 1 else 0.0,
+                    "bytes_per_frame": total_bytes // max(total_frames, 1),
+                }
+                for s in spans:
+                    for k, v in perf.total[s].summary().items():
+                        row[f"{s}_{k}"] = v
+                rows.append(row)
+                print(f"{framesize:<10}{pixformat:<11}{row['fps_mean']:>9.2f}{row['fps_std']:>7.2f}"
+                      f"{row['mbps_mean']:>9.3f}{row['transfer_p50'] or 0:>10.3f}")
+                if fps_log and pixformat == "GRAYSCALE":
+                    # Same format the viewer appends, so the log stays comparable
+                    with open(fps_log, "a") as log_file:
+                        log_file.write(f"{framesize} - {row['fps_mean']:.2f}\n")
+    finally:
+        pyopenmv.stop_script()
+        pyopenmv.disconnect()
 
-    screen = None
+    with open(output, "w", newline="") as f:
+        if output.endswith(".jsonl"):
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        else:
+            writer = csv.DictWriter(f, columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    print(f"Wrote {output}")
+    return rows
+
+def pygame_test(port, poll_rate, scale, sync=False, depth=2, lossless=False,
+                decode_workers=0, decode_scale=1, adaptive=False, target_fps=None, max_mbps=None,
+                framesize="QVGA", perf_log=None, display_fps=60, scale_mode="nearest",
+                record=None, record_mode="raw", record_policy="drop", bus=None):
+    pygame.init()
+    consumer = None
+    if bus is not None:
+        # Frames come from a pyopenmv_bus daemon, which owns the camera
+        consumer = BusConsumer(bus, "fb_viewer", latest=True)
+    else:
+        connect(port)
+        pyopenmv.stop_script()
+        pyopenmv.enable_fb(True)
+
+    tuner = None
+    if consumer is None and (target_fps or max_mbps):
+        # Uploads a JPEG capture script and retunes it to the target
+        tuner = TransportTuner(target_fps=target_fps, max_mbps=max_mbps, framesize=framesize)
+    elif consumer is None:
+        pyopenmv.exec_script(test_script)
+
+    # Per-frame latency spans, shown in the overlay and optionally logged
+    perf = PerfLog(perf_log, {"port": f"bus:{bus}" if consumer else port,
+                              "script_hash": script_hash(tuner.script if tuner else test_script)})
+    if consumer is None:
+        pyopenmv.default_camera().perf = perf
+    if tuner is not None:
+        tuner.decoder.perf = perf
+
+    scaler = FrameScaler(scale, scale_mode, resizable=True)
     clock = pygame.time.Clock()
-    fps_clock = pygame.time.Clock()
-    font = pygame.font.SysFont("monospace", 30)
+    # With hw scaling the overlay is drawn at frame size and scaled with it
+    font = pygame.font.SysFont("monospace", max(8, 30 // scale) if scale_mode == "hw" else 30)
+    line = font.get_linesize()
+
+    # Learns the device frame interval instead of polling every poll_rate ms
+    poller = AdaptivePoller() if adaptive else None
+
+    read_state = tuner.read_state if tuner else consumer.read_state if consumer else pyopenmv.read_state
 
-    fps_values = []  # List to store FPS values
+    decoder = None
+    if decode_workers:
+        # Decode (JPEG) frames on a worker pool, optionally at 1/2..1/8 size.
+        # Frames leave the capture thread, so their buffers can't be recycled.
+        decoder = JpegDecoder(decode_workers, decode_scale)
+        decoder.perf = perf
+        pipelined = PipelinedReader(read_state, decoder, depth=decode_workers + 1, recycle=sync)
+        read_state = lambda out=None: pipelined.read_state()
 
+    # Capture runs on its own thread at device speed; the render loop below
+    # draws the newest frame at display_fps and skips the stale ones.
+    reader = None
+    if not sync:
+        reader = FramePrefetcher(read_state, depth=depth, lossless=lossless, poll=poll_rate / 1000,
+                                 poller=poller).start()
+
+    # Script output arrives in GET_STATE's text field; keep the device FPS
+    stream = TextStream()
+    metrics = MetricParser()
+    device_fps = 0.0
+
+    # Displayed frames are copied to an encoder process; never waits with "drop"
+    sink = None  # created on the first frame, once the frame size is known
+
+    capture_rate = RateCounter()
+    display_rate = RateCounter()
+    fps_values = {}  # capture FPS samples for fps_log.txt, per camera framesize
+    logged_size = None
+
+    fb = None
     try:
         while True:
-            w, h, data, size, text, fmt = pyopenmv.read_state()
-            fps = fps_clock.get_fps()
-            
-            if fps > 0:
-                fps_values.append(fps)  # Store FPS value
+            if reader is not None:
+                w, h, data, size, text, fmt = reader.latest()
+                capture_rate.update(reader.frames)
+            else:
+                # Hand the last frame back so the decoder can reuse its buffer
+                t_poll = time.monotonic()
+                w, h, data, size, text, fmt = read_state(out=fb)
+                if poller is not None:
+                    poller.observe(data is not None, t_poll)
+                if data is not None:
+                    capture_rate.add()
+            stream.feed(text)
+            for m in metrics.metrics(stream.lines()):
+                device_fps = m.values.get("fps", device_fps)
 
-            mbps = (fps * size) / (1024**2)  # Convert to MB/s
+            if data is not None:
+                # The camera's framesize, not the (--decode-scale) decoded one
+                logged_size = framesize_name(*(pipelined.native_size if decoder is not None else (w, h)))
+            fps = capture_rate.rate
+            if fps > 0 and logged_size is not None:
+                fps_values.setdefault(logged_size, []).append(fps)
 
             if data is not None:
-                image = pygame.image.frombuffer(data.flat[0:], (w, h), 'RGB')
-                image = pygame.transform.smoothscale(image, (w * scale, h * scale))
+                fb = data
+                mbps = (fps * size) / (1024**2)  # Convert to MB/s
 
-                if screen is None:
-                    screen = pygame.display.set_mode((w * scale, h * scale), pygame.DOUBLEBUF, 32)
+                t0 = time.perf_counter()
+                screen = scaler.show(data, w, h)
+                perf.add("scale", time.perf_counter() - t0)
 
-                screen.blit(image, (0, 0))
-                screen.blit(font.render(f"{fps:.2f} FPS | {mbps:.2f} MB/s", 5, (255, 0, 0)), (0, 0))
+                overlay = f"cap {fps:.2f} | disp {display_rate.rate:.2f} FPS | {mbps:.2f} MB/s | dev {device_fps:.2f}"
+                if tuner is not None:
+                    overlay += f" | {tuner.framesize} q{tuner.quality}"
+                screen.blit(font.render(overlay, 5, (255, 0, 0)), (0, 0))
+                screen.blit(font.render(perf.overlay(), 5, (255, 0, 0)), (0, line))
 
+                t2 = time.perf_counter()
                 pygame.display.flip()
-                fps_clock.tick(1000 // poll_rate)
+                perf.add("flip", time.perf_counter() - t2)
+                perf.tags.update(framesize=framesize_name(w, h), pixformat=fmt)
+                if tuner is not None:
+                    perf.tags["script_hash"] = script_hash(tuner.script)
+                perf.frame()
+                display_rate.add()
+                gray = fmt == pyopenmv_decode.RGB_FMT_NAMES[pyopenmv_decode.FMT_GRAY]
+                if record and sink is None:
+                    # The tuner only steps down from --framesize
+                    sink = RecordingSink(record, record_mode, max_size=framesize if tuner else (w, h),
+                                         policy=record_policy, bpp=1 if gray else 3)
+                if sink is not None:
+                    # Grayscale frames are expanded for display; record one channel
+                    if gray:
+                        sink.write(data[:, :, 0], pyopenmv_decode.FMT_GRAY)
+                    else:
+                        sink.write(data)
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
                     raise KeyboardInterrupt
+                if event.type == pygame.VIDEORESIZE:
+                    scaler.resize(event.size)
 
-            clock.tick(1000 // poll_rate)
+            if reader is not None:
+                clock.tick(display_fps)
+            elif poller is not None:
+                poller.wait()
+            else:
+                clock.tick(1000 // poll_rate)
     except KeyboardInterrupt:
         pass
+    except BusClosed as e:
+        print(e)
+
+    if reader is not None:
+        reader.stop()
+        print(f"Capture: {reader.frames} frames, {reader.dropped} dropped, {reader.skipped} not displayed")
+    print(f"Display: {display_rate.count} frames")
+
+    if sink is not None:
+        sink.close()
+        print(f"Recording: {sink.stats()}")
+
+    if poller is not None:
+        print(f"Polling: {poller.stats()}")
+
+    if tuner is not None:
+        print(f"Transport: {tuner.report()}")
+
+    perf.close()
+    print("Latency p50/p95/p99:")
+    print(perf.describe())
+
+    if decoder is not None:
+        pipelined.close()
+        decoder.close()
+        stats = decoder.stats()
+        print(f"Decode: {stats['frames']} frames, mean {stats['mean_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms")
 
     pygame.quit()
-    pyopenmv.stop_script()
+    if consumer is not None:
+        consumer.close()
+    else:
+        pyopenmv.stop_script()
 
-    # Calculate and save average FPS
-    if fps_values:
-        avg_fps = sum(fps_values) / len(fps_values)
-        with open("fps_log.txt", "a") as log_file:
-            log_file.write(f"QCIF - {avg_fps:.2f}\n")
+    # Save the average FPS of each framesize received
+    append_fps_log(fps_values)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="pyopenmv module")
     parser.add_argument("--port", default="/dev/ttyACM0", help="OpenMV camera port (default /dev/ttyACM0)")
     parser.add_argument("--poll", type=int, default=4, help="Poll rate (default 4ms)")
     parser.add_argument("--scale", type=int, default=4, help="Set frame scaling factor (default 4x)")
+    parser.add_argument("--scale-mode", default="nearest", choices=SCALE_MODES, help="nearest (integer), smooth (bilinear) or hw (GPU) scaling (default nearest)")
+    parser.add_argument("--bus", default=None, help="Read frames from this pyopenmv_bus daemon instead of the port")
+    parser.add_argument("--sync", action="store_true", help="Capture and render on one thread (old behaviour)")
+    parser.add_argument("--display-fps", type=int, default=60, help="Render rate when capturing on a thread (default 60)")
+    parser.add_argument("--depth", type=int, default=2, help="Capture ring depth (default 2)")
+    parser.add_argument("--lossless", action="store_true", help="Never drop captured frames")
+    parser.add_argument("--adaptive", action="store_true", help="Schedule polls from the learned device frame interval")
+    parser.add_argument("--decode-workers", type=int, default=0, help="Decode frames on N worker threads (default 0, inline)")
+    parser.add_argument("--decode-scale", type=int, default=1, choices=(1, 2, 4, 8), help="Decode JPEG frames at 1/N size (needs --decode-workers)")
+    parser.add_argument("--target-fps", type=float, default=None, help="Stream JPEG, tuning quality/framesize to reach this FPS")
+    parser.add_argument("--max-mbps", type=float, default=None, help="Stream JPEG, tuning quality/framesize to stay under this MB/s")
+    parser.add_argument("--perf-log", default=None, help="Append per-second latency rows to this file (.jsonl, or .csv)")
+    parser.add_argument("--framesize", default="QVGA", choices=pyopenmv.FRAMESIZES, help="Largest framesize for --target-fps/--max-mbps (default QVGA)")
+    parser.add_argument("--record", default=None, help="Record displayed frames to this file")
+    parser.add_argument("--record-mode", default="raw", choices=RECORD_MODES, help="raw (lossless frame archive) or video (default raw)")
+    parser.add_argument("--record-policy", default="drop", choices=RECORD_POLICIES, help="When the encoder falls behind: drop frames or block the render loop (default drop)")
+    parser.add_argument("--headless", action="store_true", help="No window (with --sweep)")
+    parser.add_argument("--sweep", action="store_true", help="Measure every --framesizes x --pixformats configuration")
+    parser.add_argument("--framesizes", nargs="+", default=None, choices=pyopenmv.FRAMESIZES, help="Sweep framesizes (default: those in fps_log.txt)")
+    parser.add_argument("--pixformats", nargs="+", default=["GRAYSCALE"], choices=PIXFORMATS, help="Sweep pixformats (default GRAYSCALE)")
+    parser.add_argument("--repeats", type=int, default=3, help="Sweep runs per configuration (default 3)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds discarded after each upload (default 2)")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds captured per run (default 5)")
+    parser.add_argument("--frames", type=int, default=None, help="Frames captured per run, instead of --duration")
+    parser.add_argument("--output", default="sweep.csv", help="Sweep results (.csv, or .jsonl; default sweep.csv)")
     args = parser.parse_args()
+    if (args.target_fps or args.max_mbps) and args.decode_workers:
+        parser.error("--target-fps/--max-mbps decode inline, drop --decode-workers")
+    if args.bus and (args.target_fps or args.max_mbps or args.sweep):
+        parser.error("--bus reads the daemon's stream, drop --target-fps/--max-mbps/--sweep")
+    if args.headless != args.sweep:
+        parser.error("--headless and --sweep go together")
+
+    if args.sweep:
+        framesizes = args.framesizes or logged_framesizes(FPS_LOG)
+        headless_sweep(args.port, framesizes, args.pixformats, args.poll, args.repeats, args.warmup,
+                       args.duration, args.frames, args.output)
+        sys.exit(0)
 
-    pygame_test(args.port, args.poll, args.scale)
+    pygame_test(args.port, args.poll, args.scale, args.sync, args.depth, args.lossless,
+                args.decode_workers, args.decode_scale, args.adaptive, args.target_fps, args.max_mbps,
+                args.framesize, args.perf_log, args.display_fps, args.scale_mode,
+                args.record, args.record_mode, args.record_policy, args.bus)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# Firmware flashing on top of the pyopenmv bootloader commands.
+#
+# Erases only the sectors the image covers, then streams WRITE packets in
+# large batches (the bootloader doesn't acknowledge writes, so there is
+# nothing to wait for between packets). Erases aren't acknowledged either and
+# the bootloader reads nothing while it erases, so each sector is given its
+# worst-case erase time before the next command. Several cameras can be
+# flashed in parallel, one thread per port.
+
+import argparse
+import sys
+import threading
+import time
+
+from pyopenmv import OpenMVCamera, FLASH_WRITE_SIZE, _BOOTLDR_WRITE
+
+# Firmware sectors per board: (first firmware sector, sector sizes from there on).
+FLASH_LAYOUTS = {
+    "H7": (1, [128 * 1024] * 15),
+    "F7": (1, [32 * 1024] * 3 + [128 * 1024] + [256 * 1024] * 7),
+}
+
+# Worst-case erase time per KiB of sector (STM32 F7/H7 datasheets: up to 2 s
+# for a 128 KiB sector, 4 s for 256 KiB).
+ERASE_S_PER_KB = 2.0 / 128
+
+def erase_wait(sector, layout="H7"):
+    """Seconds to wait after erasing sector."""
+    first, sizes = FLASH_LAYOUTS[layout]
+    return sizes[sector - first] / 1024 * ERASE_S_PER_KB
+
+def sectors_for(image_size, layout="H7"):
+    """Returns the sector numbers an image of image_size bytes touches."""
+    first, sizes = FLASH_LAYOUTS[layout]
+    sectors = []
+    covered = 0
+    for i, size in enumerate(sizes):
+        if covered >= image_size:
+            break
+        sectors.append(first + i)
+        covered += size
+    if covered < image_size:
+        raise ValueError(f"Image ({image_size} bytes) does not fit in the {layout} flash ({covered} bytes)")
+    return sectors
+
+def write_packets(image, chunk=FLASH_WRITE_SIZE):
+    # WRITE command + data for every chunk, last one padded with 0xFF.
+    cmd = _BOOTLDR_WRITE.to_bytes(4, "little")
+    packets = bytearray()
+    for i in range(0, len(image), chunk):
+        packets += cmd + image[i:i + chunk].ljust(chunk, b"\xff")
+    return bytes(packets)
+
+class Progress:
+    """Thread-safe progress line for one or more devices."""
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self._lock = threading.Lock()
+        self._state = {}
+        self._drawn = 0
+
+    def update(self, port, done, total, start):
+        with self._lock:
+            now = time.monotonic()
+            elapsed = max(now - start, 1e-6)
+            self._state[port] = f"{port}: {100 * done // max(total, 1):3d}% {done / elapsed / 1024:7.1f} KiB/s"
+            if done < total and now - self._drawn < 0.1:
+                return
+            self._drawn = now
+            self.stream.write("\r" + " | ".join(self._state.values()))
+            self.stream.flush()
+
+    def done(self):
+        with self._lock:
+            self.stream.write("\n")
+
+def enter_bootloader(cam, port, baudrate=921600, retries=50, reset=False):
+    # With reset=True the running firmware is asked to jump to the bootloader
+    # first; the port re-enumerates, so reconnect until START is answered.
+    if reset:
+        cam.connect(port, baudrate, timeout=0.2)
+        try:
+            cam.reset_to_bl()
+            cam.serial.flush()
+        finally:
+            cam.disconnect()
+    for i in range(retries):
+        try:
+            if cam.serial is None:
+                cam.connect(port, baudrate, timeout=0.2)
+            if cam.bootloader_start():
+                return True
+        except Exception:
+            cam.disconnect()
+        time.sleep(0.1)
+    return False
+
+def flash_firmware(path_or_image, port, layout="H7", batch=64, erase_delay=None, reset=False,
+                   progress=None, baudrate=921600):
+    """Flashes one device and returns (bytes written, seconds).
+
+    batch WRITE packets are sent per serial write. erase_delay is waited after
+    each sector erase; None waits the sector's worst-case erase time.
+    """
+    if isinstance(path_or_image, (bytes, bytearray)):
+        image = bytes(path_or_image)
+    else:
+        with open(path_or_image, "rb") as f:
+            image = f.read()
+
+    cam = OpenMVCamera()
+    try:
+        if not enter_bootloader(cam, port, baudrate, reset=reset):
+            raise RuntimeError(f"{port}: bootloader did not respond")
+        cam.set_timeout(5)
+        start = time.monotonic()
+
+        for sector in sectors_for(len(image), layout):
+            cam.flash_erase(sector)
+            cam.serial.flush()
+            time.sleep(erase_wait(sector, layout) if erase_delay is None else erase_delay)
+
+        packets = write_packets(image)
+        packet = 4 + FLASH_WRITE_SIZE
+        step = packet * batch
+        view = memoryview(packets)
+        for i in range(0, len(packets), step):
+            cam.serial.write(view[i:i + step])
+            if progress is not None:
+                progress.update(port, min(len(image), (i + step) // packet * FLASH_WRITE_SIZE), len(image), start)
+        cam.serial.flush()
+        cam.bootloader_reset()
+        return len(image), time.monotonic() - start
+    finally:
+        cam.disconnect()
+
+def flash_many(path, ports, **kwargs):
+    """Flashes every port in parallel. Returns {port: (bytes, seconds) or Exception}."""
+    with open(path, "rb") as f:
+        image = f.read()
+    results = {}
+    def worker(port):
+        try:
+            results[port] = flash_firmware(image, port, **kwargs)
+        except Exception as e:
+            results[port] = e
+    threads = [threading.Thread(target=worker, args=(port,)) for port in ports]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Flash OpenMV firmware over the bootloader")
+    parser.add_argument("firmware", help="Firmware image (.bin)")
+    parser.add_argument("ports", nargs="*", default=["/dev/ttyACM0"], help="Camera ports (default /dev/ttyACM0)")
+    parser.add_argument("--layout", default="H7", choices=FLASH_LAYOUTS, help="Flash layout (default H7)")
+    parser.add_argument("--batch", type=int, default=64, help="WRITE packets per transfer (default 64)")
+    parser.add_argument("--erase-delay", type=float, default=None, help="Seconds to wait after each sector erase (default: worst-case erase time of the sector)")
+    parser.add_argument("--reset", action="store_true", help="Reset running firmware into the bootloader first")
+    parser.add_argument("--emulate", type=int, default=0, metavar="N", help="Flash N emulated cams instead and verify the result")
+    args = parser.parse_args()
+
+    emulators = []
+    ports = args.ports
+    if args.emulate:
+        from pyopenmv_emulator import EmulatedOpenMV
+        emulators = [EmulatedOpenMV(bootloader=not args.reset).start() for i in range(args.emulate)]
+        ports = [emu.port for emu in emulators]
+
+    progress = Progress()
+    results = flash_many(args.firmware, ports, layout=args.layout, batch=args.batch,
+                         erase_delay=args.erase_delay, reset=args.reset, progress=progress)
+    progress.done()
+
+    ok = True
+    for port in ports:
+        res = results[port]
+        if isinstance(res, Exception):
+            ok = False
+            print(f"{port}: FAILED ({res})")
+        else:
+            print(f"{port}: {res[0]} bytes in {res[1]:.2f} s ({res[0] / max(res[1], 1e-6) / 1024:.1f} KiB/s)")
+
+    if emulators:
+        with open(args.firmware, "rb") as f:
+            image = f.read()
+        # Wait for the emulators to drain what is still in flight.
+        for emu in emulators:
+            for i in range(100):
+                if emu.resets:
+                    break
+                time.sleep(0.05)
+            written = bytes(emu.flash[:len(image)])
+            match = written == image and emu.erased == set(sectors_for(len(image), args.layout))
+            ok &= match
+            print(f"{emu.port}: verify {'ok' if match else 'FAILED'}")
+            emu.stop()
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
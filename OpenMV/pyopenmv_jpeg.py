@@ -0,0 +1,144 @@
+# Off-thread JPEG decoding for pyopenmv.
+#
+# PIL releases the GIL while decoding, so a small thread pool lets several
+# frames decode while the serial loop keeps transferring. Decoding can be
+# reduced in the DCT domain (1/2, 1/4, 1/8) via Image.draft(), which is much
+# cheaper than decoding at full size and resizing afterwards.
+
+import io
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import pyopenmv_decode
+
+SCALES = (1, 2, 4, 8)
+
+# data is (h, w, 3) uint8 RGB, or (h, w) uint8 when decoding to gray.
+Decoded = namedtuple("Decoded", "w h data decode_ms")
+
+class JpegDecoder:
+    """Decodes frames on `workers` threads into pooled output buffers.
+
+    Buffers handed out by decode()/submit() go back to the pool with
+    release(); un-released buffers are simply garbage collected.
+    """
+
+    def __init__(self, workers=2, scale=1, gray=False, history=256):
+        if scale not in SCALES:
+            raise ValueError(f"scale must be one of {SCALES}")
+        self.scale = scale
+        self.gray = gray
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openmv-jpeg") if workers else None
+        self._free = {}
+        self._lock = threading.Lock()
+        self.decode_ms = deque(maxlen=history)
+        self.perf = None  # optional pyopenmv_perf.PerfLog
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def _buffer(self, shape):
+        with self._lock:
+            free = self._free.get(shape)
+            if free:
+                return free.pop()
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, data):
+        if data is None:
+            return
+        with self._lock:
+            self._free.setdefault(data.shape, []).append(data)
+
+    def decode(self, buf, w, h, fmt=pyopenmv_decode.FMT_JPEG, scale=None):
+        """Decodes one native frame. Non-JPEG frames are converted at full size."""
+        scale = scale or self.scale
+        t = time.perf_counter()
+        if fmt == pyopenmv_decode.FMT_JPEG:
+            img = Image.open(io.BytesIO(buf))
+            mode = "L" if self.gray else "RGB"
+            # draft() makes libjpeg skip the discarded DCT coefficients.
+            img.draft(mode, ((w + scale - 1) // scale, (h + scale - 1) // scale))
+            if img.mode != mode:
+                img = img.convert(mode)
+            dw, dh = img.size
+            out = self._buffer((dh, dw) if self.gray else (dh, dw, 3))
+            out[...] = np.asarray(img)
+        else:
+            dw, dh = w, h
+            if self.gray:
+                out = pyopenmv_decode.to_gray(buf, fmt, w, h, self._buffer((h, w)))
+            else:
+                out = pyopenmv_decode.to_rgb(buf, fmt, w, h, self._buffer((h, w, 3)))
+        dt = time.perf_counter() - t
+        ms = dt * 1e3
+        self.decode_ms.append(ms)
+        if self.perf is not None:
+            self.perf.add("decode", dt)
+        return Decoded(dw, dh, out, ms)
+
+    def submit(self, buf, w, h, fmt=pyopenmv_decode.FMT_JPEG, scale=None):
+        if self._pool is None:
+            raise RuntimeError("JpegDecoder was created without workers")
+        return self._pool.submit(self.decode, buf, w, h, fmt, scale)
+
+    def stats(self):
+        if not self.decode_ms:
+            return {"frames": 0, "mean_ms": 0.0, "p95_ms": 0.0}
+        ms = np.fromiter(self.decode_ms, dtype=np.float64)
+        return {"frames": len(ms), "mean_ms": float(ms.mean()), "p95_ms": float(np.percentile(ms, 95))}
+
+class PipelinedReader:
+    """read_state() wrapper that keeps up to `depth` frames decoding on the
+    decoder's pool while new frames are read.
+
+    Returns the usual read_state() tuple with the decoded frame (possibly
+    downscaled, so w/h are the decoded size; native_size is the camera's
+    (w, h) of the last returned frame). The frame is valid until the
+    next call, after which its buffer is recycled, unless recycle is False
+    (e.g. when frames are handed to another thread).
+    """
+
+    def __init__(self, read_state, decoder, depth=3, recycle=True):
+        self._read_state = read_state
+        self.decoder = decoder
+        self.depth = depth
+        self.recycle = recycle
+        self._pending = deque()
+        self._last = None
+        self.native_size = None
+
+    def read_state(self):
+        self.decoder.release(self._last)
+        self._last = None
+
+        text = None
+        while len(self._pending) < self.depth:
+            w, h, data, size, text, fmt = self._read_state(native=True)
+            if data is None:
+                break
+            self._pending.append((size, text, fmt, (w, h), self.decoder.submit(data, w, h, fmt)))
+            text = None
+            if self._pending[0][4].done():
+                break
+
+        if not self._pending:
+            return 0, 0, None, 0, text, ""
+
+        size, ptext, fmt, self.native_size, future = self._pending.popleft()
+        frame = future.result()
+        if self.recycle:
+            self._last = frame.data
+        text = "".join(t for t in (ptext, text) if t) or None
+        return frame.w, frame.h, frame.data, size, text, pyopenmv_decode.RGB_FMT_NAMES[fmt]
+
+    def close(self):
+        for size, text, fmt, native_size, future in self._pending:
+            future.cancel()
+        self._pending.clear()
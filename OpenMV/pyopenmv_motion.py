@@ -0,0 +1,130 @@
+# Change detection for the camera pipelines.
+#
+# MotionGate reduces each frame to a small luminance copy (sums of
+# `factor` x `factor` blocks of the green channel, which is the gray value for
+# GRAY frames) and compares it with a reference: vectorized absolute
+# difference, a per-pixel threshold, then the share of changed pixels in each
+# tile of a `tiles` grid. Tiles over `tile_fraction` are marked changed and
+# only their reference is refreshed, so a slow drift in a static tile still
+# adds up to a change. Stages subscribe to changed frames, or to changed tiles
+# only, and count the work they skipped.
+
+import time
+
+import numpy as np
+
+class Subscription:
+    """One stage's view of a MotionGate. poll() after each update()."""
+
+    def __init__(self, gate, name, tiles=False):
+        self.gate = gate
+        self.name = name
+        self.tiles = tiles
+        self.processed = 0  # frames, or tiles with tiles=True
+        self.skipped = 0
+
+    def poll(self):
+        """Frame subscribers: True if the stage should run on this frame.
+        Tile subscribers: (x, y, w, h) frame rects of the changed tiles."""
+        gate = self.gate
+        if self.tiles:
+            n = int(gate.mask.sum())
+            self.processed += n
+            self.skipped += gate.mask.size - n
+            return gate.rects()
+        if gate.changed:
+            self.processed += 1
+        else:
+            self.skipped += 1
+        return gate.changed
+
+    def skipped_share(self):
+        total = self.processed + self.skipped
+        return self.skipped / total if total else 0.0
+
+class MotionGate:
+
+    def __init__(self, tiles=(8, 6), factor=4, threshold=16, tile_fraction=0.02, refresh=None):
+        self.tiles = tiles              # (columns, rows)
+        self.factor = factor
+        self.threshold = threshold      # per-pixel gray level difference
+        self.tile_fraction = tile_fraction
+        self.refresh = refresh          # seconds: report a change at least this often
+        self.subscriptions = {}
+        self.frames = 0
+        self.changed_frames = 0
+        self.changed = False
+        self.mask = np.ones(tiles[::-1], dtype=bool)  # (rows, columns)
+        self._size = None
+        self._ref = None
+        self._last_change = None
+
+    def subscribe(self, name, tiles=False):
+        sub = Subscription(self, name, tiles)
+        self.subscriptions[name] = sub
+        return sub
+
+    def _setup(self, w, h):
+        f = self.factor
+        sw, sh = w // f, h // f
+        cols, rows = self.tiles
+        self._size = (w, h)
+        self._small = np.empty((sh, sw), np.uint16)
+        self._diff = np.empty((sh, sw), np.int32)
+        # Tile edges in the small frame; the last row/column of tiles takes the remainder.
+        self._ys = np.arange(rows) * sh // rows
+        self._xs = np.arange(cols) * sw // cols
+        ones = np.ones((sh, sw), np.int32)
+        self._area = np.add.reduceat(np.add.reduceat(ones, self._ys, axis=0), self._xs, axis=1)
+        # Tile rects in frame pixels
+        ye = np.append(self._ys[1:], sh) * f
+        xe = np.append(self._xs[1:], sw) * f
+        ye[-1], xe[-1] = h, w
+        self._rects = [[(int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+                        for x0, x1 in zip(self._xs * f, xe)] for y0, y1 in zip(self._ys * f, ye)]
+        self._ref = None
+
+    def update(self, frame, now=None):
+        """Takes an (h, w, 3) RGB or (h, w) gray uint8 frame; returns True if
+        any tile changed (always True for the first frame of a size)."""
+        now = time.monotonic() if now is None else now
+        h, w = frame.shape[:2]
+        if self._size != (w, h):
+            self._setup(w, h)
+        f = self.factor
+        sh, sw = self._small.shape
+        plane = frame[:sh * f, :sw * f, 1] if frame.ndim == 3 else frame[:sh * f, :sw * f]
+        plane.reshape(sh, f, sw, f).sum(axis=(1, 3), dtype=np.uint16, out=self._small)
+        self.frames += 1
+        if self._ref is None:
+            self._ref = self._small.copy()
+            self.mask[...] = True
+        else:
+            np.subtract(self._small, self._ref, out=self._diff, dtype=np.int32)
+            np.abs(self._diff, out=self._diff)
+            hits = self._diff > self.threshold * f * f
+            counts = np.add.reduceat(np.add.reduceat(hits, self._ys, axis=0, dtype=np.int32), self._xs, axis=1)
+            np.greater(counts, self.tile_fraction * self._area, out=self.mask)
+            if self.refresh is not None and now - self._last_change >= self.refresh:
+                self.mask[...] = True
+            # Refresh the reference of changed tiles only
+            if self.mask.any():
+                rows = np.repeat(self.mask, np.diff(np.append(self._ys, sh)), axis=0)
+                changed = np.repeat(rows, np.diff(np.append(self._xs, sw)), axis=1)
+                self._ref[changed] = self._small[changed]
+        self.changed = bool(self.mask.any())
+        if self.changed:
+            self.changed_frames += 1
+            self._last_change = now
+        return self.changed
+
+    def rects(self, mask=None):
+        """(x, y, w, h) frame rects of the tiles set in mask (default: changed)."""
+        mask = self.mask if mask is None else mask
+        return [self._rects[r][c] for r, c in zip(*np.nonzero(mask))]
+
+    def stats(self):
+        out = {"frames": self.frames, "changed": self.changed_frames}
+        for name, sub in self.subscriptions.items():
+            out[name] = {"processed": sub.processed, "skipped": sub.skipped}
+        return out
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# Multi-camera capture: one reader thread per OpenMVCamera, frames grouped
+# into time-aligned sets.
+
+import argparse
+import threading
+import time
+from collections import deque, namedtuple
+
+from pyopenmv import OpenMVCamera
+
+# t is time.monotonic() when the frame finished arriving on the host.
+Frame = namedtuple("Frame", "seq t w h data size text fmt")
+
+class MultiCapture:
+    """Pulls frames from N cameras on N threads.
+
+    capture() returns one frame per camera, all newer than the previous set,
+    picking from each camera's short history the frame closest in time to the
+    newest frame of the slowest camera. Cameras must not use reuse_buffers,
+    since the history keeps several frames alive.
+    """
+
+    def __init__(self, cameras, history=4, native=False, poll=0.001):
+        self.cameras = list(cameras)
+        self._native = native
+        self._poll = poll
+        self._history = [deque(maxlen=history) for c in self.cameras]
+        self._last = [-1] * len(self.cameras)
+        self._seq = [0] * len(self.cameras)
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        self._error = None
+
+    def start(self):
+        self._running = True
+        for i in range(len(self.cameras)):
+            t = threading.Thread(target=self._run, args=(i,), name=f"openmv-cap{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self, i):
+        cam = self.cameras[i]
+        while self._running:
+            try:
+                w, h, data, size, text, fmt = cam.read_state(native=self._native)
+            except Exception as e:
+                with self._cond:
+                    self._error = e
+                    self._running = False
+                    self._cond.notify_all()
+                return
+            if data is None:
+                time.sleep(self._poll)
+                continue
+            t = time.monotonic()
+            with self._cond:
+                self._seq[i] += 1
+                self._history[i].append(Frame(self._seq[i], t, w, h, data, size, text, fmt))
+                self._cond.notify_all()
+
+    def _ready(self):
+        return all(hist and hist[-1].seq > last for hist, last in zip(self._history, self._last))
+
+    def capture(self, timeout=None):
+        """Returns (frames, skew) where frames has one Frame per camera and
+        skew is the spread of their timestamps in seconds, or None on
+        timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._ready() or not self._running, timeout):
+                return None
+            if self._error is not None:
+                e, self._error = self._error, None
+                raise e
+            if not self._ready():
+                return None
+            ref = min(hist[-1].t for hist in self._history)
+            frames = []
+            for i, hist in enumerate(self._history):
+                fresh = [f for f in hist if f.seq > self._last[i]]
+                f = min(fresh, key=lambda f: abs(f.t - ref))
+                self._last[i] = f.seq
+                frames.append(f)
+        ts = [f.t for f in frames]
+        return frames, max(ts) - min(ts)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture time-aligned frames from several OpenMV cams")
+    parser.add_argument("ports", nargs="+", help="OpenMV camera ports")
+    parser.add_argument("--sets", type=int, default=100, help="Number of frame sets to capture (default 100)")
+    parser.add_argument("--script", help="Script to run on every camera before capturing")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, 'r') as fin:
+            script = fin.read()
+
+    cameras = [OpenMVCamera(port, timeout=2) for port in args.ports]
+    for cam in cameras:
+        cam.stop_script()
+        cam.enable_fb(True)
+        if script:
+            cam.exec_script(script)
+
+    start = time.monotonic()
+    skews = []
+    with MultiCapture(cameras) as cap:
+        while len(skews) < args.sets:
+            res = cap.capture(timeout=5)
+            if res is None:
+                print("Timed out waiting for frames")
+                break
+            skews.append(res[1])
+    elapsed = time.monotonic() - start
+
+    for cam in cameras:
+        cam.disconnect()
+    if skews:
+        print(f"{len(skews)} sets, {len(skews) / elapsed:.2f} sets/s, "
+              f"mean skew {1e3 * sum(skews) / len(skews):.2f} ms, max skew {1e3 * max(skews):.2f} ms")
@@ -0,0 +1,193 @@
+# Per-frame latency spans for the viewers.
+#
+# Each stage of a frame (GET_STATE round trip, frame transfer, decode, scale,
+# inference, display flip) is added to a log-bucketed histogram, which costs
+# one log10() and an index per sample. PerfLog keeps one set of histograms
+# for the current interval (shown in the overlay and written as a row every
+# `interval` seconds) and one for the whole run (written by close()). Rows go
+# to a JSON lines file, or CSV if the path ends in .csv, tagged with
+# framesize, pixformat, port and a hash of the uploaded script.
+
+import csv
+import hashlib
+import json
+import math
+import os
+import time
+
+import pyopenmv
+
+FPS_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fps_log.txt")
+
+SPANS = ("get_state", "transfer", "decode", "scale", "inference", "flip")
+TAGS = ("framesize", "pixformat", "port", "script_hash")
+
+# Short names for the overlay.
+_LABELS = {"get_state": "state", "transfer": "xfer", "decode": "dec", "scale": "scale",
+           "inference": "infer", "flip": "flip", "pose_latency": "lat"}
+
+def script_hash(script):
+    return hashlib.sha1(script.encode()).hexdigest()[:12]
+
+def framesize_name(w, h):
+    for name, size in pyopenmv.FRAMESIZES.items():
+        if size == (w, h):
+            return name
+    return f"{w}x{h}"
+
+def append_fps_log(samples, path=FPS_LOG):
+    """Appends one "FRAMESIZE - FPS" line (the mean) per framesize in
+    samples, {framesize name: [fps, ...]}. Sizes that aren't pyopenmv
+    framesizes are left out, as the log's readers look every name up."""
+    samples = {name: values for name, values in samples.items() if values and name in pyopenmv.FRAMESIZES}
+    if not samples:
+        return
+    with open(path, "a") as log_file:
+        for name, values in samples.items():
+            log_file.write(f"{name} - {sum(values) / len(values):.2f}\n")
+
+class RateCounter:
+    """Rate of a growing count, averaged over at least `window` seconds."""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.count = 0
+        self.rate = 0.0
+        self._t = None
+        self._n = 0
+
+    def add(self, n=1, now=None):
+        return self.update(self.count + n, now)
+
+    def update(self, count, now=None):
+        now = time.monotonic() if now is None else now
+        self.count = count
+        if self._t is None:
+            self._t, self._n = now, count
+        elif now - self._t >= self.window:
+            self.rate = (count - self._n) / (now - self._t)
+            self._t, self._n = now, count
+        return self.rate
+
+class Histogram:
+    """Latency histogram with `per_decade` log-spaced buckets from lo to hi seconds."""
+
+    def __init__(self, lo=1e-5, hi=10.0, per_decade=20):
+        self.lo = lo
+        self.per_decade = per_decade
+        self.counts = [0] * (int(math.log10(hi / lo) * per_decade) + 2)
+        self.n = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        if seconds <= self.lo:
+            i = 0
+        else:
+            i = min(int(math.log10(seconds / self.lo) * self.per_decade) + 1, len(self.counts) - 1)
+        self.counts[i] += 1
+        self.n += 1
+        self.total += seconds
+
+    def percentile(self, q):
+        """Upper edge (seconds) of the bucket holding the q-th percentile."""
+        if not self.n:
+            return None
+        rank = q / 100 * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return self.lo * 10 ** (i / self.per_decade)
+        return self.lo * 10 ** ((len(self.counts) - 1) / self.per_decade)
+
+    def summary(self):
+        ms = {f"p{q}": self.percentile(q) for q in (50, 95, 99)}
+        return {k: None if v is None else round(v * 1e3, 3) for k, v in ms.items()}
+
+class PerfLog:
+
+    def __init__(self, path=None, tags=None, interval=1.0, spans=SPANS):
+        self.spans = spans
+        self.tags = dict.fromkeys(TAGS, "")
+        self.tags.update(tags or {})
+        self.interval = interval
+        self.total = {s: Histogram() for s in spans}
+        self.recent = {s: Histogram() for s in spans}
+        self.last = self.recent  # last complete interval, for the overlay
+        self.frames = 0
+        self._interval_frames = 0
+        self._start = self._interval_start = time.monotonic()
+        self._file = None
+        self._csv = None
+        if path is not None:
+            self._file = open(path, "a", newline="")
+            if path.endswith(".csv"):
+                self._csv = csv.DictWriter(self._file, self._columns())
+                if self._file.tell() == 0:
+                    self._csv.writeheader()
+
+    def _columns(self):
+        cols = ["time", "kind", *TAGS, "frames", "seconds", "fps"]
+        for s in self.spans:
+            cols += [f"{s}_p50", f"{s}_p95", f"{s}_p99"]
+        return cols
+
+    def add(self, span, seconds):
+        self.recent[span].add(seconds)
+        self.total[span].add(seconds)
+
+    def frame(self, now=None):
+        """Counts a displayed frame; closes the interval when it is due."""
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+        self._interval_frames += 1
+        if now - self._interval_start >= self.interval:
+            self._write("interval", self.recent, self._interval_frames, now - self._interval_start)
+            self.last = self.recent
+            self.recent = {s: Histogram() for s in self.spans}
+            self._interval_frames = 0
+            self._interval_start = now
+
+    def _row(self, kind, hists, frames, seconds):
+        row = {"time": round(time.time(), 3), "kind": kind, **self.tags, "frames": frames,
+               "seconds": round(seconds, 3), "fps": round(frames / seconds, 2) if seconds else 0}
+        for s, h in hists.items():
+            for k, v in h.summary().items():
+                row[f"{s}_{k}"] = v
+        return row
+
+    def _write(self, kind, hists, frames, seconds):
+        if self._file is None:
+            return
+        row = self._row(kind, hists, frames, seconds)
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + "\n")
+
+    def overlay(self):
+        """p50 ms of each span seen in the last interval, e.g. "state 1.1 xfer 9.8"."""
+        parts = []
+        for s, h in self.last.items():
+            p50 = h.percentile(50)
+            if p50 is not None:
+                parts.append(f"{_LABELS.get(s, s)} {p50 * 1e3:.1f}")
+        return " ".join(parts)
+
+    def describe(self):
+        """One "span: p50/p95/p99 ms" line per span with samples, for the whole run."""
+        lines = []
+        for s, h in self.total.items():
+            if h.n:
+                p = h.summary()
+                lines.append(f"{s:<10} {p['p50']:8.3f} {p['p95']:8.3f} {p['p99']:8.3f} ms  (n={h.n})")
+        return "\n".join(lines)
+
+    def summary(self):
+        return self._row("total", self.total, self.frames, time.monotonic() - self._start)
+
+    def close(self):
+        if self._file is not None:
+            self._write("total", self.total, self.frames, time.monotonic() - self._start)
+            self._file.close()
+            self._file = None
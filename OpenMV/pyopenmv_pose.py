@@ -0,0 +1,317 @@
+# Pose inference off the display loop.
+#
+# PoseWorker runs MediaPipe pose in its own process. submit() copies a frame
+# into a single shared-memory slot and returns at once: if the worker has not
+# picked up the previous frame yet it is overwritten (latest frame wins) and
+# counted as skipped, so the caller runs at camera rate whatever inference
+# costs. Each result carries the sequence number and capture time of the frame
+# it was computed on; poll() returns the newest, and the caller draws its
+# landmarks over whatever frame it is showing, with the result's age.
+#
+# KeyframePose cuts the inference itself: the model runs only on keyframes,
+# and the landmarks are carried across the frames between them by optical
+# flow, with the keyframe spacing adapted to how far the flow drifts.
+
+import multiprocessing as mp
+import queue
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import pyopenmv
+from pyopenmv_perf import RateCounter
+
+# landmarks is a mediapipe NormalizedLandmarkList, or None if no pose was found;
+# keyframe is False when the landmarks were propagated by KeyframePose.
+PoseResult = namedtuple("PoseResult", "seq t landmarks infer_s done keyframe")
+
+def _worker(shm_name, slot_size, header, lock, ready, stop, results, taken, infer_size, keyframe, options):
+    # Runs in the worker process, with its own pose graph.
+    import cv2
+    import mediapipe as mp_
+
+    pose = mp_.solutions.pose.Pose(**options)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slot = np.ndarray((slot_size,), dtype=np.uint8, buffer=shm.buf)
+    frame = small = gray = None
+
+    def process(rgb):
+        nonlocal small
+        h, w = rgb.shape[:2]
+        if infer_size is not None and infer_size != (w, h):
+            if small is None or small.shape[:2] != (infer_size[1], infer_size[0]):
+                small = np.empty((infer_size[1], infer_size[0], 3), np.uint8)
+            cv2.resize(rgb, infer_size, dst=small, interpolation=cv2.INTER_AREA)
+            rgb = small
+        return pose.process(rgb)
+
+    tracker = KeyframePose(process, **keyframe) if keyframe is not None else None
+    try:
+        while not stop.is_set():
+            if not ready.wait(0.1):
+                continue
+            ready.clear()
+            with lock:
+                seq, w, h, t = int(header[0]), int(header[1]), int(header[2]), header[3]
+                if seq == taken.value:
+                    continue
+                n = w * h * 3
+                if frame is None or frame.shape != (h, w, 3):
+                    frame = np.empty((h, w, 3), np.uint8)
+                frame.reshape(-1)[:] = slot[:n]
+                taken.value = seq
+            t0 = time.perf_counter()
+            if tracker is not None:
+                if gray is None or gray.shape != (h, w):
+                    gray = np.empty((h, w), np.uint8)
+                cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY, dst=gray)
+                landmarks, key = tracker.update(frame, gray)
+            else:
+                landmarks, key = process(frame).pose_landmarks, True
+            infer_s = time.perf_counter() - t0
+            landmarks = landmarks.SerializeToString() if landmarks else None
+            results.put((seq, t, landmarks, infer_s, time.monotonic(), key))
+    finally:
+        pose.close()
+        del slot
+        shm.close()
+
+class PoseWorker:
+    """Pose inference in a worker process, fed one frame at a time.
+
+    `max_size` (a framesize name or (w, h)) bounds the RGB frames passed to
+    submit(); `infer_size` resizes them before inference, as in
+    mediapipe_openmv.infer_pose(). `keyframe` (a dict of KeyframePose
+    arguments, possibly empty) runs the model on keyframes only. Extra
+    keyword arguments go to mediapipe's Pose().
+    """
+
+    def __init__(self, max_size="VGA", infer_size=None, window=1.0, keyframe=None, **options):
+        w, h = pyopenmv.FRAMESIZES[max_size] if isinstance(max_size, str) else max_size
+        self.slot_size = w * h * 3
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slot_size)
+        self._slot = np.ndarray((self.slot_size,), dtype=np.uint8, buffer=self._shm.buf)
+        # Spawned, not forked: a MediaPipe graph already running in this
+        # process (e.g. mediapipe_openmv.pose_model()) does not survive fork().
+        ctx = mp.get_context("spawn")
+        self._header = ctx.RawArray("d", 4)  # seq, w, h, capture time
+        self._lock = ctx.Lock()
+        self._ready = ctx.Event()
+        self._stop = ctx.Event()
+        self._results = ctx.Queue()
+        self._taken = ctx.RawValue("q", 0)  # seq of the last frame the worker picked up
+        self._proc = ctx.Process(target=_worker, name="openmv-pose", daemon=True,
+                                args=(self._shm.name, self.slot_size, self._header, self._lock,
+                                      self._ready, self._stop, self._results, self._taken,
+                                      infer_size, keyframe, options))
+        self._proc.start()
+        self.seq = 0
+        self.submitted = 0
+        self.skipped = 0   # frames overwritten before the worker picked them up
+        self.results = 0
+        self.keyframes = 0
+        self.latest = None
+        self.rate = RateCounter(window)  # results per second
+        self._parse = None
+
+    def submit(self, data, t=None):
+        """Hands an (h, w, 3) uint8 RGB frame to the worker, replacing any
+        frame it has not started on. Returns the frame's sequence number."""
+        if self._proc is None:
+            raise RuntimeError("PoseWorker is closed")
+        h, w = data.shape[:2]
+        if w * h * 3 > self.slot_size:
+            raise ValueError(f"Frame too large for pose slot. Slot: {self.slot_size} frame: {w * h * 3}")
+        with self._lock:
+            if self._taken.value != self.seq:
+                self.skipped += 1
+            self.seq += 1
+            self._slot[:w * h * 3] = data.reshape(-1)
+            self._header[:] = (self.seq, w, h, time.monotonic() if t is None else t)
+        self._ready.set()
+        self.submitted += 1
+        return self.seq
+
+    def poll(self):
+        """Collects finished results; returns the newest PoseResult (possibly
+        one returned before), or None if there has been none yet."""
+        while True:
+            try:
+                seq, t, landmarks, infer_s, done, key = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if landmarks is not None:
+                if self._parse is None:
+                    from mediapipe.framework.formats import landmark_pb2
+                    self._parse = landmark_pb2.NormalizedLandmarkList.FromString
+                landmarks = self._parse(landmarks)
+            self.latest = PoseResult(seq, t, landmarks, infer_s, done, key)
+            self.results += 1
+            self.keyframes += key
+        self.rate.update(self.results)
+        if self._proc is not None and not self._proc.is_alive():
+            raise RuntimeError(f"Pose worker exited ({self._proc.exitcode})")
+        return self.latest
+
+    def stats(self):
+        return {"submitted": self.submitted, "results": self.results, "keyframes": self.keyframes,
+                "skipped": self.skipped, "fps": round(self.rate.rate, 2)}
+
+    def close(self):
+        if self._proc is None:
+            return
+        self._stop.set()
+        self._ready.set()
+        # Drain results so the worker's queue feeder can exit
+        while self._proc.is_alive():
+            try:
+                self._results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._proc.join()
+        self._proc = None
+        del self._slot
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class KeyframePose:
+    """Full pose on keyframes, optical flow in between.
+
+    `process(rgb)` is the model (e.g. mediapipe_openmv.infer_pose or
+    Pose().process) and returns an object with .pose_landmarks. On the frames
+    between keyframes the visible landmarks are moved with sparse pyramidal
+    Lucas-Kanade flow on the grayscale frame. A keyframe is forced early when
+    too few landmarks track (lost, or flow error above `max_error`) or the
+    median landmark moves more than `max_motion` of the frame width. At each
+    keyframe the tracked landmarks are also moved onto the keyframe and
+    compared with the model's (drift, mean distance in frame widths): above
+    `drift_high` the keyframe interval is halved, below `drift_low` it grows
+    by one frame, within [min_interval, max_interval]. With no pose in view
+    the model still runs only every `interval` frames.
+    """
+
+    def __init__(self, process, interval=4, min_interval=1, max_interval=15, drift_low=0.01,
+                 drift_high=0.025, min_tracked=0.7, max_error=20.0, max_motion=0.05,
+                 win_size=(21, 21), levels=3):
+        self.process = process
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.drift_low = drift_low
+        self.drift_high = drift_high
+        self.min_tracked = min_tracked
+        self.max_error = max_error
+        self.max_motion = max_motion
+        self.win_size = win_size
+        self.levels = levels
+        self.landmarks = None  # NormalizedLandmarkList shown for the last frame
+        self.drift = None      # at the last keyframe that followed propagated frames
+        self.keyframes = 0
+        self.propagated = 0    # frames answered without the model
+        self.forced = 0        # keyframes run early because tracking failed
+        self._since = interval  # frames since the last keyframe; the first frame is one
+        self._gray = None
+        self._points = None    # (n, 1, 2) float32 pixel positions of the tracked landmarks
+        self._ids = None
+
+    def update(self, rgb, gray):
+        """Returns (landmarks, keyframe) for an (h, w, 3) RGB frame and its
+        (h, w) uint8 grayscale."""
+        h, w = gray.shape
+        if self._since < self.interval and self.landmarks is None:
+            # Nobody in view: look again on the next keyframe
+            self._since += 1
+            self.propagated += 1
+            return None, False
+        if self._since < self.interval:
+            flow = self._flow(gray)
+            if flow is not None:
+                points, ok = flow
+                moved = np.median(np.linalg.norm((points - self._points)[ok, 0], axis=1)) if ok.any() else np.inf
+                if ok.mean() >= self.min_tracked and moved <= self.max_motion * w:
+                    landmarks = type(self.landmarks)()
+                    landmarks.CopyFrom(self.landmarks)
+                    for i, (x, y), good in zip(self._ids, points[:, 0], ok):
+                        lm = landmarks.landmark[i]
+                        if good:
+                            lm.x, lm.y = x / w, y / h
+                        else:
+                            lm.visibility = 0.0
+                    self.landmarks = landmarks
+                    self._points = points[ok]
+                    self._ids = self._ids[ok]
+                    self._gray = gray.copy()
+                    self._since += 1
+                    self.propagated += 1
+                    return landmarks, False
+            self.forced += 1
+        return self._keyframe(rgb, gray), True
+
+    def _flow(self, gray):
+        """Moves the tracked points onto `gray`: (points, ok), or None with
+        nothing to track."""
+        import cv2
+
+        if self._points is None or not len(self._points) or self._gray.shape != gray.shape:
+            return None
+        h, w = gray.shape
+        points, status, err = cv2.calcOpticalFlowPyrLK(self._gray, gray, self._points, None,
+                                                       winSize=self.win_size, maxLevel=self.levels)
+        # Points that leave the frame are dropped
+        inside = ((points[:, 0] >= 0) & (points[:, 0] <= (w - 1, h - 1))).all(axis=1)
+        ok = (status[:, 0] == 1) & (err[:, 0] < self.max_error) & inside
+        return points, ok
+
+    def _keyframe(self, rgb, gray):
+        h, w = gray.shape
+        landmarks = self.process(rgb).pose_landmarks
+        # Drift is measured on this frame: the tracked points are moved onto
+        # it first, so motion since the last frame doesn't count
+        flow = self._flow(gray) if landmarks is not None and self._since else None
+        if flow is not None:
+            points, ok = flow
+            ids = self._ids[ok]
+            both = landmark_visible(landmarks)[ids]
+            if both.any():
+                d = points[ok, 0][both] / (w, h) - landmark_xy(landmarks)[ids[both]]
+                d[:, 1] *= h / w  # in frame widths on both axes
+                self.drift = float(np.linalg.norm(d, axis=1).mean())
+                if self.drift > self.drift_high:
+                    self.interval = max(self.min_interval, self.interval // 2)
+                elif self.drift < self.drift_low:
+                    self.interval = min(self.max_interval, self.interval + 1)
+        self.landmarks = landmarks
+        self.keyframes += 1
+        self._since = 0
+        if landmarks is None:
+            self._points = self._ids = None
+            return None
+        ids = np.flatnonzero(landmark_visible(landmarks) & _inside(landmarks))
+        self._ids = ids
+        self._points = (landmark_xy(landmarks)[ids] * (w, h)).astype(np.float32).reshape(-1, 1, 2)
+        self._gray = gray.copy()
+        return landmarks
+
+    def stats(self):
+        return {"keyframes": self.keyframes, "propagated": self.propagated, "forced": self.forced,
+                "interval": self.interval, "drift": None if self.drift is None else round(self.drift, 4)}
+
+def landmark_xy(landmarks):
+    """(33, 2) normalized x, y of a NormalizedLandmarkList."""
+    return np.array([(lm.x, lm.y) for lm in landmarks.landmark], dtype=np.float64)
+
+def landmark_visible(landmarks, threshold=0.5):
+    """Landmarks drawn by draw_pose() (visibility at or above the threshold)."""
+    return np.array([lm.visibility >= threshold for lm in landmarks.landmark])
+
+def _inside(landmarks):
+    xy = landmark_xy(landmarks)
+    return ((xy >= 0) & (xy <= 1)).all(axis=1)
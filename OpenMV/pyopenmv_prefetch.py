@@ -0,0 +1,169 @@
+# Background frame prefetching for pyopenmv.
+#
+# A worker thread keeps issuing GET_STATE/FRAME_DUMP exchanges so the next
+# frame is already on its way over USB while the caller decodes/renders the
+# current one.
+
+import threading
+import time
+from collections import deque
+
+import pyopenmv
+
+EMPTY_STATE = (0, 0, None, 0, None, "")
+
+class FramePrefetcher:
+    """Threaded wrapper around read_state().
+
+    Frames are handed over through a bounded ring of `depth` entries. When the
+    ring is full the oldest frame is dropped (latest frame wins), unless
+    `lossless` is set, in which case the worker waits for the caller to catch
+    up. Script text is kept aside and attached to the next frame, or handed
+    out on its own when no frame is queued, so it never takes a frame's place
+    in the ring or gets lost with a dropped frame. While running, the
+    prefetcher owns the serial port: do not issue other pyopenmv commands
+    until stop() has returned.
+    """
+
+    def __init__(self, read_state=None, depth=2, lossless=False, poll=0.001, poller=None):
+        if depth < 1:
+            raise ValueError("depth must be >= 1")
+        self._read_state = read_state or pyopenmv.read_state
+        self._depth = depth
+        self._lossless = lossless
+        self._poll = poll
+        self._poller = poller  # optional pyopenmv_sched.AdaptivePoller
+        self._ring = deque()
+        self._text = []   # text received since the last queued frame
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._error = None
+        self.frames = 0   # frames received from the device
+        self.dropped = 0  # frames discarded because the ring was full
+        self.skipped = 0  # frames passed over by latest()
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._running = True
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="openmv-prefetch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._ring.clear()
+        self._text.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def pending(self):
+        with self._cond:
+            return len(self._ring)
+
+    def _run(self):
+        while self._running:
+            t = time.monotonic()
+            try:
+                state = self._read_state()
+            except Exception as e:
+                with self._cond:
+                    self._error = e
+                    self._running = False
+                    self._cond.notify_all()
+                return
+
+            if self._poller is not None:
+                self._poller.observe(state[2] is not None, t)
+            if state[2] is None and state[4] is None:
+                # Nothing new on the device yet.
+                self._wait()
+                continue
+
+            with self._cond:
+                if state[4]:
+                    self._text.append(state[4])
+                if state[2] is None:
+                    self._cond.notify_all()
+                    continue
+                if self._lossless:
+                    while self._running and len(self._ring) >= self._depth:
+                        self._cond.wait()
+                    if not self._running:
+                        return
+                elif len(self._ring) >= self._depth:
+                    old = self._ring.popleft()
+                    if old[4]:
+                        # Its text goes with the next frame instead.
+                        self._text.insert(0, old[4])
+                    self.dropped += 1
+                self._ring.append(state[:4] + (self._take_text(),) + state[5:])
+                self.frames += 1
+                self._cond.notify_all()
+            if self._poller is not None:
+                self._poller.wait()
+
+    def _wait(self):
+        if self._poller is not None:
+            self._poller.wait()
+        else:
+            time.sleep(self._poll)
+
+    def read_state(self, timeout=None):
+        """Returns the next queued state, in the same layout as
+        pyopenmv.read_state(). Returns an empty state if nothing arrived
+        within `timeout` seconds (None waits forever)."""
+        with self._cond:
+            self._cond.wait_for(self._ready, timeout)
+            if self._ring:
+                state = self._ring.popleft()
+                self._cond.notify_all()
+                return state
+            if self._text:
+                return EMPTY_STATE[:4] + (self._take_text(),) + EMPTY_STATE[5:]
+            return self._empty()
+
+    def latest(self, timeout=0):
+        """Like read_state(), but returns the newest queued frame and skips
+        the older ones. Text from the skipped frames and any pending text is
+        kept."""
+        with self._cond:
+            self._cond.wait_for(self._ready, timeout)
+            if not self._ring and not self._text:
+                return self._empty()
+            states = list(self._ring)
+            self._ring.clear()
+            texts = [s[4] for s in states if s[4]]
+            if self._text:
+                texts.append(self._take_text())
+            self._cond.notify_all()
+
+        state = states[-1] if states else EMPTY_STATE
+        self.skipped += max(0, len(states) - 1)
+        return state[:4] + ("".join(texts) or None,) + state[5:]
+
+    def _ready(self):
+        return self._ring or self._text or not self._running
+
+    def _take_text(self):
+        # Called with the lock held.
+        text = "".join(self._text) or None
+        self._text.clear()
+        return text
+
+    def _empty(self):
+        if self._error is not None:
+            e, self._error = self._error, None
+            raise e
+        return EMPTY_STATE
@@ -0,0 +1,181 @@
+# Non-blocking recording of live frames.
+#
+# RecordingSink copies each frame into the next of `slots` shared-memory
+# slots (a ring: the encoder finishes slots in the order they were filled)
+# and queues the slot number for an encoder process, so the caller pays one
+# memcpy per frame and never waits on disk or the encoder. When every slot is
+# in use the frame is dropped ("drop", the default) or the caller waits up to
+# `timeout` for a slot ("block", for recordings that must be complete). The
+# encoder is spawned, not forked (the viewers fork with capture threads and a
+# MediaPipe graph running), and the sink waits for it to come up, so the
+# first frames are not dropped while it starts.
+# Modes:
+#   raw    lossless frame archive (pyopenmv_archive), native or RGB frames
+#   video  compressed video through cv2.VideoWriter (`codec`, `fps`)
+
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import pyopenmv
+import pyopenmv_decode
+from pyopenmv_archive import FrameRecorder, slot_size_for
+
+MODES = ("raw", "video")
+POLICIES = ("drop", "block")
+
+def _encoder(path, mode, shm_name, slot_size, work, written, ready, fps, codec):
+    # Runs in the encoder process.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray((len(shm.buf),), dtype=np.uint8, buffer=shm.buf)
+    recorder = writer = None
+    size = None
+    try:
+        if mode == "raw":
+            recorder = FrameRecorder(path, slot_size)
+        else:
+            import cv2
+        ready.set()
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            slot, w, h, nbytes, fmt, t = item
+            raw = slots[slot * slot_size:slot * slot_size + nbytes]
+            if mode == "raw":
+                recorder.write(w, h, raw, fmt, t)
+            else:
+                data = raw if fmt == pyopenmv_decode.FMT_JPEG else _native(raw, w, h, fmt)
+                rgb = pyopenmv_decode.to_rgb(data, fmt, w, h)
+                if writer is None:
+                    size = (w, h)
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, size)
+                    if not writer.isOpened():
+                        raise RuntimeError(f"Can't open {path} for {codec} video")
+                if (w, h) != size:
+                    rgb = cv2.resize(rgb, size, interpolation=cv2.INTER_NEAREST)
+                writer.write(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+            with written.get_lock():
+                written.value += 1
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if writer is not None:
+            writer.release()
+        del slots
+        shm.close()
+
+def _native(raw, w, h, fmt):
+    if fmt == pyopenmv_decode.FMT_RGB565:
+        return raw.view(np.uint16).reshape((h, w))
+    if fmt == pyopenmv_decode.FMT_RGB:
+        return raw.reshape((h, w, 3))
+    return raw.reshape((h, w))
+
+class RecordingSink:
+
+    def __init__(self, path, mode="raw", max_size="VGA", slots=8, policy="drop", timeout=1.0,
+                 fps=20.0, codec="mp4v", start_timeout=30.0, bpp=3):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        if mode == "video":
+            import cv2  # fail here rather than in the encoder process
+        self.path = path
+        self.mode = mode
+        self.policy = policy
+        self.timeout = timeout
+        # Room for a frame of max_size (a framesize name or (w, h)) in every slot;
+        # bpp 3 fits RGB, 1 is enough for a grayscale-only stream.
+        w, h = pyopenmv.FRAMESIZES[max_size] if isinstance(max_size, str) else max_size
+        self.slot_size = slot_size_for(w, h, bpp=bpp)
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slot_size * slots)
+        self._slots = np.ndarray((self.slot_size * slots,), dtype=np.uint8, buffer=self._shm.buf)
+        self._slots.fill(0)  # fault the pages in now, not on the first frames
+        self.slots = slots
+        ctx = mp.get_context("spawn")
+        self._work = ctx.Queue()
+        self._written = ctx.Value("q", 0)
+        ready = ctx.Event()
+        self._proc = ctx.Process(target=_encoder, name="openmv-record", daemon=True,
+                                 args=(path, mode, self._shm.name, self.slot_size, self._work,
+                                       self._written, ready, fps, codec))
+        self._proc.start()
+        t0 = time.monotonic()
+        while not ready.wait(0.1):
+            if not self._proc.is_alive() or time.monotonic() - t0 > start_timeout:
+                self._proc.kill()
+                self._proc.join()
+                self._proc = None
+                del self._slots
+                self._shm.close()
+                self._shm.unlink()
+                raise RuntimeError(f"Recorder process did not start ({path})")
+        self.submitted = 0
+        self.dropped = 0
+        self.blocked_s = 0.0
+
+    @property
+    def written(self):
+        return self._written.value
+
+    def write(self, data, fmt=pyopenmv_decode.FMT_RGB, w=None, h=None, t=None):
+        """Queues one frame: an (h, w, 3) RGB array, or a native frame with
+        its format (JPEG frames also need w and h). Returns False if the
+        frame was dropped."""
+        if self._proc is None:
+            raise RuntimeError("RecordingSink is closed")
+        if fmt == pyopenmv_decode.FMT_JPEG:
+            raw = np.frombuffer(data, dtype=np.uint8)
+        else:
+            h, w = data.shape[:2]
+            raw = np.ascontiguousarray(data).reshape(-1).view(np.uint8)
+        if raw.nbytes > self.slot_size:
+            raise ValueError(f"Frame too large for recording slot. Slot: {self.slot_size} frame: {raw.nbytes}")
+        if not self._slot_free():
+            if not self._proc.is_alive():
+                raise RuntimeError(f"Recorder process exited ({self._proc.exitcode})")
+            if self.policy == "block":
+                t0 = time.monotonic()
+                while not self._slot_free() and time.monotonic() - t0 < self.timeout and self._proc.is_alive():
+                    time.sleep(0.001)
+                self.blocked_s += time.monotonic() - t0
+            if not self._slot_free():
+                self.dropped += 1
+                return False
+        slot = self.submitted % self.slots
+        start = slot * self.slot_size
+        self._slots[start:start + raw.nbytes] = raw
+        self._work.put((slot, w, h, raw.nbytes, fmt, time.time() if t is None else t))
+        self.submitted += 1
+        return True
+
+    def _slot_free(self):
+        return self.submitted - self._written.value < self.slots
+
+    def pending(self):
+        return self.submitted - self._written.value
+
+    def stats(self):
+        return {"submitted": self.submitted, "written": self.written, "dropped": self.dropped,
+                "blocked_s": round(self.blocked_s, 3)}
+
+    def close(self):
+        """Waits for queued frames to be encoded and stops the encoder."""
+        if self._proc is None:
+            return
+        self._work.put(None)
+        self._proc.join()
+        self._proc = None
+        del self._slots
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
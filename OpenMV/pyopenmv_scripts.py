@@ -0,0 +1,24 @@
+# On-device script templates for the host tools.
+
+PIXFORMATS = ("GRAYSCALE", "RGB565", "JPEG")
+
+def capture_script(framesize="QVGA", pixformat="GRAYSCALE", quality=90, skip_ms=2000):
+    """Returns the viewer's test script for the given sensor configuration.
+
+    JPEG captures in GRAYSCALE and compresses each frame in place, so the
+    framebuffer sent to the host is JPEG."""
+    sensor_fmt = "GRAYSCALE" if pixformat == "JPEG" else pixformat
+    compress = f"\n    img.compress(quality={quality})" if pixformat == "JPEG" else ""
+    return f"""
+import sensor, image, time
+sensor.reset()
+sensor.set_pixformat(sensor.{sensor_fmt})
+sensor.set_framesize(sensor.{framesize})
+sensor.skip_frames(time = {skip_ms})
+clock = time.clock()
+
+while(True):
+    clock.tick()
+    img = sensor.snapshot(){compress}
+    print(clock.fps(), " FPS")
+"""
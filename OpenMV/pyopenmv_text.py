@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Script output stream for pyopenmv.
+#
+# TextStream collects what the on-device script prints, either from the text
+# field GET_STATE already carries (feed()) or by draining tx_buf (poll()), and
+# hands it out as complete lines, keeping partial lines across frames.
+# MetricParser turns known lines (e.g. "19.02  FPS", "BLOB cx:10, cy:20") into
+# timestamped, typed metrics.
+
+import argparse
+import re
+import time
+from collections import namedtuple
+
+import pyopenmv
+
+Metric = namedtuple("Metric", "t kind values line")
+
+_NUM = r"-?\d+(?:\.\d+)?"
+
+class LineParser:
+    """Regex with named groups; `types` maps group names to converters."""
+
+    def __init__(self, kind, pattern, types):
+        self.kind = kind
+        self.regex = re.compile(pattern)
+        self.types = types
+
+    def parse(self, line):
+        m = self.regex.search(line)
+        if m is None:
+            return None
+        return {k: self.types[k](v) for k, v in m.groupdict().items() if v is not None}
+
+# Formats printed by the viewer test scripts and the IR trackers.
+DEFAULT_PARSERS = [
+    # ir_tracking_noservo.py may prefix "-X Limit Reached " (printed with end="").
+    LineParser("blob", rf"(?:(?:^|\s)(?P<fps>{_NUM})\s+)?BLOB cx:(?P<cx>-?\d+), cy:(?P<cy>-?\d+)",
+               {"fps": float, "cx": int, "cy": int}),
+    LineParser("blob", rf"Tracking blob: cx=(?P<cx>-?\d+) cy=(?P<cy>-?\d+) fps=(?P<fps>{_NUM})",
+               {"fps": float, "cx": int, "cy": int}),
+    LineParser("servo", r"Servo move: pan=(?P<pan>-?\d+) tilt=(?P<tilt>-?\d+)", {"pan": int, "tilt": int}),
+    LineParser("fps", rf"^\s*(?P<fps>{_NUM})\s+FPS\b", {"fps": float}),
+    LineParser("fps", rf"FPS=(?P<fps>{_NUM})", {"fps": float}),
+    # A bare print(clock.fps()) (ir_tracking_noservo.py). Last, as any line
+    # holding just a number matches.
+    LineParser("fps", r"^\s*(?P<fps>\d+(?:\.\d+)?)\s*$", {"fps": float}),
+]
+
+class TextStream:
+
+    def __init__(self, cam=None, max_pending=64 * 1024):
+        self.cam = cam or pyopenmv.default_camera()
+        self.max_pending = max_pending
+        self._pending = bytearray()
+        self.bytes = 0
+
+    def feed(self, text):
+        """Adds text received elsewhere, e.g. the read_state() text field."""
+        if text:
+            data = text.encode() if isinstance(text, str) else text
+            self._pending += data
+            self.bytes += len(data)
+            # Never let a script that prints without newlines grow this forever.
+            del self._pending[:max(0, len(self._pending) - self.max_pending)]
+
+    def poll(self):
+        """Drains the device's tx buffer, returns the number of bytes read."""
+        n = self.cam.tx_buf_len()
+        if n:
+            self.feed(self.cam.tx_buf(n))
+        return n
+
+    def lines(self):
+        """Yields the complete lines received so far."""
+        while True:
+            i = self._pending.find(b"\n")
+            if i < 0:
+                return
+            line = self._pending[:i].decode(errors="replace").rstrip("\r")
+            del self._pending[:i + 1]
+            yield line
+
+    def follow(self, interval=0.05, duration=None):
+        """Blocking generator: polls tx_buf and yields lines as they arrive."""
+        end = None if duration is None else time.monotonic() + duration
+        while end is None or time.monotonic() < end:
+            got = self.poll()
+            yield from self.lines()
+            if not got:
+                time.sleep(interval)
+
+class MetricParser:
+
+    def __init__(self, parsers=None):
+        self.parsers = DEFAULT_PARSERS if parsers is None else parsers
+        self.latest = {}
+
+    def parse(self, line, t=None):
+        """Returns a Metric for the first parser matching line, or None."""
+        for p in self.parsers:
+            values = p.parse(line)
+            if values is not None:
+                metric = Metric(time.time() if t is None else t, p.kind, values, line)
+                self.latest[p.kind] = metric
+                return metric
+        return None
+
+    def metrics(self, lines):
+        for line in lines:
+            metric = self.parse(line)
+            if metric is not None:
+                yield metric
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a script and stream its output")
+    parser.add_argument("script", help="Script to run on the camera")
+    parser.add_argument("--port", default="/dev/ttyACM0", help="OpenMV camera port (default /dev/ttyACM0)")
+    parser.add_argument("--metrics", action="store_true", help="Print parsed metrics instead of raw lines")
+    parser.add_argument("--seconds", type=float, default=None, help="Stop after this many seconds")
+    args = parser.parse_args()
+
+    with open(args.script, 'r') as fin:
+        buf = fin.read()
+
+    cam = pyopenmv.OpenMVCamera(args.port, timeout=2)
+    cam.stop_script()
+    cam.exec_script(buf)
+    stream = TextStream(cam)
+    metrics = MetricParser()
+    try:
+        for line in stream.follow(duration=args.seconds):
+            if not args.metrics:
+                print(line)
+                continue
+            m = metrics.parse(line)
+            if m is not None:
+                print(f"{m.t:.3f} {m.kind} {m.values}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cam.stop_script()
+        cam.disconnect()
@@ -0,0 +1,47 @@
+# Flashing against emulated cams (python -m pytest test_flash.py).
+
+import os
+import subprocess
+import sys
+import time
+
+from pyopenmv import OpenMVCamera
+from pyopenmv_emulator import EmulatedOpenMV
+from pyopenmv_flash import enter_bootloader, erase_wait, flash_firmware, sectors_for
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IMAGE = bytes(range(256)) * 600  # 150 KiB: two H7 sectors
+
+def test_running_firmware_needs_reset():
+    with EmulatedOpenMV(bootloader=False) as emu:
+        cam = OpenMVCamera()
+        try:
+            assert not enter_bootloader(cam, emu.port, retries=3)
+        finally:
+            cam.disconnect()
+
+def test_flash_with_reset():
+    with EmulatedOpenMV(bootloader=False) as emu:
+        size, seconds = flash_firmware(IMAGE, emu.port, erase_delay=0, reset=True)
+        assert size == len(IMAGE)
+        for i in range(100):
+            if emu.resets:
+                break
+            time.sleep(0.05)
+        assert bytes(emu.flash[:len(IMAGE)]) == IMAGE
+        assert emu.erased == set(sectors_for(len(IMAGE)))
+        assert not emu.bootloader
+
+def test_cli_reset(tmp_path):
+    path = tmp_path / "firmware.bin"
+    path.write_bytes(IMAGE)
+    out = subprocess.run([sys.executable, os.path.join(HERE, "pyopenmv_flash.py"), str(path),
+                          "--emulate", "2", "--reset", "--erase-delay", "0"],
+                         capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stdout + out.stderr
+    assert out.stdout.count("verify ok") == 2
+
+def test_default_erase_wait():
+    assert erase_wait(1, "H7") == 2.0
+    assert erase_wait(1, "F7") == 0.5
+    assert erase_wait(5, "F7") == 4.0